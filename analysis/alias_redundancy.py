@@ -0,0 +1,32 @@
+"""
+This script lists the search term aliases that become redundant once report texts and aliases are
+normalized into their canonical form (see text_normalization.py), e.g. "CO 2" and "CO₂" are the same
+as "CO2", and "water vapor" is the same as "water vapour". These aliases can be removed without changing
+the counts (aliases containing another alias, e.g. "sea ice extent" and "sea ice", are not listed).
+
+The report is saved in an Excel file with the following columns:
+Term            Alias           Canonical form      Same as
+water vapour    water vapor     water vapor         water vapour
+"""
+
+import json
+import logging
+import pandas as pd
+from text_normalization import canonical_search_terms, redundant_aliases
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+
+search_terms_path = './data/cci/search_terms.json'
+output_excel_path = './results/redundant_aliases.xlsx'
+
+with open(search_terms_path, 'r') as f:
+    search_terms = json.load(f)
+
+redundant = redundant_aliases(search_terms)
+df = pd.DataFrame(redundant, columns=['Term', 'Alias', 'Canonical form', 'Same as'])
+df.to_excel(output_excel_path, index=False)
+
+n_patterns = sum(len(aliases) + 1 for aliases in search_terms.values())
+n_canonical_patterns = sum(len(aliases) for aliases in canonical_search_terms(search_terms).values())
+logging.info(f'{len(redundant)} redundant aliases written to {output_excel_path}')
+logging.info(f'Patterns to match: {n_patterns} (original texts), {n_canonical_patterns} (canonical texts)')
@@ -0,0 +1,97 @@
+"""
+This script compares the single-pass term matcher (term_matcher.py) with the historical
+per-term regex loop of terms_in_reports.py, on the report txt files of a directory.
+It checks that both methods return exactly the same counts and displays the time spent by each one.
+
+If the directory does not contain any txt file, a synthetic corpus is generated from the search terms
+so that the benchmark can be run before the reports are downloaded and converted.
+
+Usage:
+- Modify the directory_path, search_terms_path and max_files variables according to your file locations.
+- Run `python ./analysis/benchmark_term_matcher.py` from the repository root.
+"""
+
+import os
+import re
+import json
+import time
+import random
+import logging
+from term_matcher import TermMatcher
+from report_text import list_txt_files, read_text
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+
+def regex_counts(patterns, text):
+    """Count the terms in a text with one regex scan per term (historical method)."""
+    return {term: len(pattern.findall(text)) for term, pattern in patterns.items()}
+
+def load_texts(directory_path, max_files=None):
+    """Load the txt files of a directory, return a dictionary {filename: text}."""
+    if not os.path.isdir(directory_path):
+        return {}
+    files = sorted(list_txt_files(directory_path))[:max_files]
+    texts = {}
+    for file in files:
+        texts[file] = read_text(directory_path, file)
+    return texts
+
+def synthetic_texts(search_terms, n_files=5, n_words=200000, seed=0):
+    """Generate texts mixing filler words and search term aliases with random case."""
+    rng = random.Random(seed)
+    aliases = [alias for term, term_aliases in search_terms.items() for alias in [term] + term_aliases]
+    filler = ['the', 'climate', 'ocean', 'observations', 'of', 'and', 'in', 'trend', 'satellite', 'model', '2.3', '(Fig.', 'et al.,']
+    texts = {}
+    for i in range(n_files):
+        words = []
+        for _ in range(n_words):
+            if rng.random() < 0.02:
+                alias = rng.choice(aliases)
+                words.append(alias.upper() if rng.random() < 0.2 else alias)
+            else:
+                words.append(rng.choice(filler))
+        texts[f'synthetic_ch{i + 1}.txt'] = ' '.join(words)
+    return texts
+
+def run_benchmark(search_terms, texts):
+    """Time both methods on the texts and check that their counts are identical."""
+    start = time.perf_counter()
+    patterns = {}
+    for term, aliases in search_terms.items():
+        patterns[term] = re.compile('|'.join(re.escape(alias) for alias in [term] + aliases), re.IGNORECASE)
+    regex_results = {file: regex_counts(patterns, text) for file, text in texts.items()}
+    regex_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matcher = TermMatcher(search_terms)
+    matcher_results = {file: matcher.count(text) for file, text in texts.items()}
+    matcher_time = time.perf_counter() - start
+
+    mismatches = 0
+    for file in texts:
+        for term in search_terms:
+            if regex_results[file][term] != matcher_results[file][term]:
+                mismatches += 1
+                logging.warning(f'Count mismatch for {term!r} in {file}: regex {regex_results[file][term]}, matcher {matcher_results[file][term]}')
+
+    n_chars = sum(len(text) for text in texts.values())
+    logging.info(f'{len(texts)} files, {n_chars / 1e6:.1f}M characters, {len(search_terms)} search terms')
+    logging.info(f'Per-term regex loop: {regex_time:.2f} s')
+    logging.info(f'Single-pass matcher: {matcher_time:.2f} s (speed-up x{regex_time / matcher_time:.1f})')
+    logging.info(f'Count mismatches: {mismatches}')
+    return mismatches
+
+# Example usage
+search_terms_path = './data/cci/search_terms.json'
+directory_path = './data/reports/full'
+max_files = None
+
+with open(search_terms_path, 'r') as f:
+    search_terms = json.load(f)
+
+texts = load_texts(directory_path, max_files)
+if not texts:
+    logging.info(f'No txt file found in {directory_path}, using a synthetic corpus.')
+    texts = synthetic_texts(search_terms)
+
+run_benchmark(search_terms, texts)
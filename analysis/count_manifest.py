@@ -0,0 +1,141 @@
+"""
+This module keeps a manifest of the search term counts computed for each report file,
+so that only the (term, file) cells whose inputs changed are recomputed on the next run.
+
+The manifest (.json) records:
+- A hash of the definition of each search term (term and ordered aliases)
+- For each file: its size, modification time, content hash (SHA-256), error if it failed, and term counts
+
+On a new run:
+- Files whose size and modification time did not change are not hashed again
+- Files with a new content hash (or which failed before) are recounted for all the terms
+- Other files are only counted for the new or modified terms
+- Entries of deleted files and removed terms are dropped from the manifest
+
+Functions:
+- file_hash(directory_path, file): Compute the SHA-256 hash of a file.
+- term_hash(term, aliases): Compute the hash of a search term definition.
+- update_counts(directory_path, documents, search_terms, manifest_path, count_function): Update and return the counts.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+from report_text import file_signature, open_bytes
+
+MANIFEST_VERSION = 1
+
+def file_hash(directory_path, file):
+    """Compute the SHA-256 hash of a file (or split part, see report_text.py), by blocks of a memory map."""
+    digest = hashlib.sha256()
+    with open_bytes(directory_path, file) as data:
+        for start in range(0, len(data), 1 << 20):
+            digest.update(data[start:start + (1 << 20)])
+    return digest.hexdigest()
+
+def term_hash(term, aliases):
+    """Compute the hash of a search term definition (the order of the aliases matters)."""
+    return hashlib.sha256(json.dumps([term] + list(aliases), ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def load_manifest(manifest_path):
+    """Load a manifest, return an empty one if it does not exist or has another version."""
+    empty_manifest = {'version': MANIFEST_VERSION, 'terms': {}, 'documents': {}}
+    if not os.path.exists(manifest_path):
+        return empty_manifest
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        logging.info(f'Manifest {manifest_path} has another version, all counts will be recomputed.')
+        return empty_manifest
+    return manifest
+
+def save_manifest(manifest, manifest_path):
+    """Save a manifest, writing a temporary file first so that an interrupted run does not corrupt it."""
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(temp_path, manifest_path)
+
+def update_counts(directory_path, documents, search_terms, manifest_path, count_function):
+    """
+    Updates the counts of the search terms in the documents, recomputing only the cells whose inputs changed.
+
+    Args:
+        directory_path (str): The directory containing the report txt files.
+        documents (list): The txt files to count the terms in, in the order of the columns.
+        search_terms (dict): Search terms and their aliases, in the order of the rows.
+        manifest_path (str): The path of the manifest (.json).
+        count_function (callable): Function (documents, search_terms) -> (counts, failed) computing the counts
+            matrix (terms x documents) and the mask of the documents that failed.
+
+    Returns:
+        tuple: The counts matrix (terms x documents), the mask of the failed documents,
+            and True if the manifest changed since the previous run (outputs written from the counts may still
+            be stale, e.g. with another order of the terms or documents, and should be rewritten on every run).
+    """
+    manifest = load_manifest(manifest_path)
+    changed = False
+
+    # Drop the entries of deleted files and removed terms
+    for file in set(manifest['documents']) - set(documents):
+        logging.info(f'Removing stale manifest entry of deleted file {file}')
+        del manifest['documents'][file]
+        changed = True
+    for term in set(manifest['terms']) - set(search_terms):
+        logging.info(f'Removing stale manifest entry of removed term {term!r}')
+        del manifest['terms'][term]
+        for entry in manifest['documents'].values():
+            entry['counts'].pop(term, None)
+        changed = True
+
+    # Find the files whose content changed, hashing only the files whose size or modification time changed
+    modified_documents = []
+    for file in documents:
+        size, mtime_ns = file_signature(directory_path, file)
+        entry = manifest['documents'].get(file)
+        if entry is not None and entry['error'] is None and (entry['size'], entry['mtime_ns']) == (size, mtime_ns):
+            continue
+        content_hash = file_hash(directory_path, file)
+        if entry is not None and entry['error'] is None and entry['hash'] == content_hash:
+            entry['size'], entry['mtime_ns'] = size, mtime_ns
+            continue
+        manifest['documents'][file] = {'size': size, 'mtime_ns': mtime_ns, 'hash': content_hash, 'error': None, 'counts': {}}
+        modified_documents.append(file)
+
+    # Find the new or modified search terms
+    term_hashes = {term: term_hash(term, aliases) for term, aliases in search_terms.items()}
+    modified_terms = {term: search_terms[term] for term, hash_ in term_hashes.items() if manifest['terms'].get(term) != hash_}
+    manifest['terms'].update(term_hashes)
+
+    # Recount the modified files for all the terms, and the other files for the modified terms
+    unmodified_documents = [file for file in documents if file not in modified_documents]
+    for recount_documents, recount_terms in ((modified_documents, search_terms), (unmodified_documents, modified_terms)):
+        if not recount_documents or not recount_terms:
+            continue
+        logging.info(f'Counting {len(recount_terms)} terms in {len(recount_documents)} files')
+        counts, failed = count_function(recount_documents, recount_terms)
+        for column, file in enumerate(recount_documents):
+            entry = manifest['documents'][file]
+            if failed[column]:
+                entry['error'] = 'failed'
+                entry['counts'] = {}
+            else:
+                entry['counts'].update(zip(recount_terms, counts[:, column].tolist()))
+        changed = True
+
+    if changed or not os.path.exists(manifest_path):
+        save_manifest(manifest, manifest_path)
+    else:
+        logging.info('No file or search term changed since the previous run.')
+
+    counts = np.zeros((len(search_terms), len(documents)), dtype=np.uint32)
+    failed = np.zeros(len(documents), dtype=bool)
+    for column, file in enumerate(documents):
+        entry = manifest['documents'][file]
+        if entry['error'] is not None:
+            failed[column] = True
+            continue
+        counts[:, column] = [entry['counts'][term] for term in search_terms]
+    return counts, failed, changed
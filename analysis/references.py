@@ -8,20 +8,26 @@ Functions:
 - find_files_with_tag(folder_path, tag): Find all .bib files in the given folder that contain the tag in their name.
 - filter_entries_by_doi(bib_database, dois): Filter entries in a bib_database that have a DOI matching any in the list 'dois'.
 - create_excel_sheet(writer, tag, entries): Create an Excel sheet for the given tag with the provided entries.
-- process_files(folder_path, original_bib_path, report_tags): Process the .bib files in the specified folder based on the given tags.
+- read_tag_dois_from_store(store_path, tag): Read the DOIs of the files containing the tag in their name from the reference store.
+- process_files(folder_path, original_bib_path, report_tags, store_path): Process the .bib files in the specified folder based on the given tags.
 
 Example usage:
 folder_path = './data/references_no_duplicates'
 original_bib_path = './data/cci/cci_papers_merged.bib'
 report_tags = ['sr15', 'srccl', 'srocc', 'wg1', 'wg2', 'wg3']
+store_path = './data/references_store'
 
-process_files(folder_path, original_bib_path, report_tags)
+process_files(folder_path, original_bib_path, report_tags, store_path)
 """
 
 import os
+import sys
 import logging
 import bibtexparser
 import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import bib_stream
+from reference_store import read_store, store_is_stale, list_bib_files, parse_file_name
 
 # Set up basic configuration for logging
 logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
@@ -30,15 +36,15 @@ def read_bib_file(filepath):
     """Read a .bib file and return its content."""
     try:
         with open(filepath, encoding='utf8') as bibtex_file:
-            bib_database = bibtexparser.load(bibtex_file)
+            bib_database = bib_stream.load(bibtex_file)
         return bib_database
     except Exception as e:
         logging.error(f"Error reading {filepath}: {e}")
         return None
 
 def find_files_with_tag(folder_path, tag):
-    """Find all .bib files in the given folder that contain the tag in their name."""
-    tagged_files = [f for f in os.listdir(folder_path) if f.endswith('.bib') and tag in f]
+    """Find all .bib files of the report tag in the given folder (file name prefix, e.g. wg1_ch2.bib, as in the reference store)."""
+    tagged_files = [f for f in list_bib_files(folder_path) if parse_file_name(f)[0] == tag]
     return tagged_files
 
 def filter_entries_by_doi(bib_database, dois):
@@ -52,7 +58,12 @@ def create_excel_sheet(writer, tag, entries):
     df = pd.DataFrame(entries, columns=['Project', 'DOI', 'Title', 'Year', 'Author', 'Journal'])
     df.to_excel(writer, sheet_name=tag, index=False)
 
-def process_files(folder_path, original_bib_path, report_tags):
+def read_tag_dois_from_store(store_path, tag):
+    """Read the DOIs of the files of the report tag from the reference store (see utils/reference_store.py)."""
+    df = read_store(store_path, reports=[tag], columns=['doi_raw'])
+    return {doi for doi in df['doi_raw'].dropna() if doi}
+
+def process_files(folder_path, original_bib_path, report_tags, store_path=None):
     original_bib_db = read_bib_file(original_bib_path)
     if not original_bib_db:
         logging.error("Failed to read the original bib file. Exiting...")
@@ -60,6 +71,11 @@ def process_files(folder_path, original_bib_path, report_tags):
 
     original_dois = {entry.get('doi') for entry in original_bib_db.entries if entry.get('doi')}
 
+    # The DOIs of the tagged files are read from the reference store if it is up to date
+    use_store = store_path is not None and not store_is_stale(folder_path, store_path)
+    if use_store:
+        logging.info(f"Reading the references from the store {store_path}")
+
     # Initialize Excel writer
     excel_writer = pd.ExcelWriter('./results/matched_references.xlsx', engine='openpyxl')
 
@@ -71,12 +87,15 @@ def process_files(folder_path, original_bib_path, report_tags):
             continue
 
         # Collect DOIs from files with the current tag
-        tag_dois = set()
-        for file in tagged_files:
-            logging.info(f"Analysing file: {file}")
-            db = read_bib_file(os.path.join(folder_path, file))
-            if db:
-                tag_dois.update(entry.get('doi') for entry in db.entries if entry.get('doi'))
+        if use_store:
+            tag_dois = read_tag_dois_from_store(store_path, tag)
+        else:
+            tag_dois = set()
+            for file in tagged_files:
+                logging.info(f"Analysing file: {file}")
+                db = read_bib_file(os.path.join(folder_path, file))
+                if db:
+                    tag_dois.update(entry.get('doi') for entry in db.entries if entry.get('doi'))
 
         # Filter original entries by DOIs found in tagged files
         matching_entries = filter_entries_by_doi(original_bib_db, tag_dois)
@@ -113,5 +132,6 @@ def process_files(folder_path, original_bib_path, report_tags):
 folder_path = './data/references_no_duplicates'
 original_bib_path = './data/cci/cci_papers_merged.bib'
 report_tags = ['sr15', 'srccl', 'srocc', 'wg1', 'wg2', 'wg3']
+store_path = './data/references_store' # Built with utils/reference_store.py, the .bib files are parsed if missing or stale
 
-process_files(folder_path, original_bib_path, report_tags)
+process_files(folder_path, original_bib_path, report_tags, store_path)
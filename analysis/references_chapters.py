@@ -2,25 +2,38 @@
 This script processes an Excel file containing multiple sheets and adds a 'Chapters' column to each sheet.
 The 'Chapters' column is populated by searching for chapter numbers in corresponding .bib files.
 
+The .bib files are read once per run into an index from each normalized DOI (lowercase, without resolver prefix)
+to the .bib files citing it, so that each row is a dictionary lookup and DOIs are matched exactly (a DOI is
+not found inside a longer one, e.g. 10.1038/nature1137 in 10.1038/nature11377). The index is read from the
+reference store (utils/reference_store.py) if it is up to date, otherwise the DOI fields of the .bib files are
+read with the streaming BibTeX reader, as when the store is built (utils/bib_stream.py).
+
 The script contains the following functions:
 - extract_chapter_number(bib_filename): Extracts the chapter number from a .bib file name.
-- doi_exists_in_bib(doi, bib_content): Checks if a DOI exists in the content of a .bib file.
-- process_sheet(sheet_name, doi_column, folder_path): Processes each sheet in the Excel file
+- build_doi_index(folder_path, store_path): Builds the index from each normalized DOI to the .bib files citing it.
+- process_sheet(sheet_name, doi_column, folder_path, doi_index): Processes each sheet in the Excel file
   and returns a comma-separated string of chapter numbers found in the corresponding .bib files.
-- process_excel(file_path, output_path, folder_path): Processes each sheet in the Excel file,
+- process_excel(file_path, output_path, folder_path, store_path): Processes each sheet in the Excel file,
   adds the 'Chapters' column, and saves the updated Excel file.
 
 Example usage:
 - input_excel_path: Path to the input Excel file.
 - output_excel_path: Path to save the output Excel file.
 - bib_folder_path: Path to the folder containing the .bib files.
+- reference_store_path: Path to the reference store (the .bib files are scanned if missing or stale).
 
 Note: This script requires the pandas library to be installed.
 """
 
 import os
+import sys
 import pandas as pd
 import logging
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'preprocessing'))
+from bib_stream import iter_bib, decode_value
+from bib_dedup import normalize_doi
+from reference_store import read_store, store_is_stale
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
@@ -38,20 +51,39 @@ def extract_chapter_number(bib_filename):
     """
     return bib_filename.split('ch')[-1].split('.')[0]
 
-def doi_exists_in_bib(doi, bib_content):
+def build_doi_index(folder_path, store_path=None):
     """
-    Checks if a DOI exists in the content of a .bib file.
+    Builds the index from each normalized DOI to the .bib files citing it (in the order of os.listdir).
 
     Args:
-        doi (str): The DOI to check.
-        bib_content (str): The content of the .bib file.
+        folder_path (str): The path to the folder containing the .bib files.
+        store_path (str): The path to the reference store, used if it is up to date.
 
     Returns:
-        bool: True if the DOI exists, False otherwise.
+        dict: The .bib files (list) citing each normalized DOI.
     """
-    return doi in bib_content
+    bib_files = [file for file in os.listdir(folder_path) if file.endswith('.bib')]
+    file_dois = {}
+    if store_path is not None and not store_is_stale(folder_path, store_path):
+        logger.info(f'Reading the DOIs from the reference store {store_path}')
+        df = read_store(store_path, columns=['file', 'doi']).dropna(subset=['doi'])
+        for file, dois in df.groupby('file')['doi']:
+            file_dois[file] = set(dois)
+    else:
+        # Same DOIs as in the store (see reference_store.build_store)
+        for bib_file in bib_files:
+            file_dois[bib_file] = {normalize_doi(decode_value(entry['doi']))
+                                   for entry in iter_bib(os.path.join(folder_path, bib_file)) if 'doi' in entry}
+
+    doi_index = {}
+    for bib_file in bib_files:
+        for doi in file_dois.get(bib_file, ()):
+            if doi:
+                doi_index.setdefault(doi, []).append(bib_file)
+    logger.info(f'Indexed {len(doi_index)} DOIs in {len(bib_files)} bib files')
+    return doi_index
 
-def process_sheet(sheet_name, doi_column, folder_path):
+def process_sheet(sheet_name, doi_column, folder_path, doi_index=None):
     """
     Processes each sheet in the Excel file and returns a comma-separated string of chapter numbers found in the corresponding .bib files.
 
@@ -59,25 +91,25 @@ def process_sheet(sheet_name, doi_column, folder_path):
         sheet_name (str): The name of the sheet.
         doi_column (str): The name of the DOI column in the sheet.
         folder_path (str): The path to the folder containing the .bib files.
+        doi_index (dict): The index built by build_doi_index (built from folder_path if not given).
 
     Returns:
         str: A comma-separated string of chapter numbers found in the .bib files.
     """
-    bib_files = [file for file in os.listdir(folder_path) if file.endswith('.bib') and sheet_name in file]
+    if doi_index is None:
+        doi_index = build_doi_index(folder_path)
 
     chapters = []
 
-    for bib_file in bib_files:
-        with open(os.path.join(folder_path, bib_file), 'r', encoding='utf8') as file:
-            bib_content = file.read()
-            if doi_exists_in_bib(doi_column, bib_content):
-                chapter_number = extract_chapter_number(bib_file)
-                logger.info(f'Found chapter {chapter_number} in bib file {bib_file}')
-                chapters.append(chapter_number)
+    for bib_file in doi_index.get(normalize_doi(doi_column), []):
+        if sheet_name in bib_file:
+            chapter_number = extract_chapter_number(bib_file)
+            logger.info(f'Found chapter {chapter_number} in bib file {bib_file}')
+            chapters.append(chapter_number)
 
     return ','.join(chapters) if chapters else None
 
-def process_excel(file_path, output_path, folder_path):
+def process_excel(file_path, output_path, folder_path, store_path=None):
     """
     Processes each sheet in the Excel file, adds the 'Chapters' column, and saves the updated Excel file.
 
@@ -85,8 +117,10 @@ def process_excel(file_path, output_path, folder_path):
         file_path (str): The path to the input Excel file.
         output_path (str): The path to save the output Excel file.
         folder_path (str): The path to the folder containing the .bib files.
+        store_path (str): The path to the reference store, used if it is up to date.
     """
     df = pd.read_excel(file_path, sheet_name=None)
+    doi_index = build_doi_index(folder_path, store_path)
     writer = pd.ExcelWriter(output_path)
 
     total_sheets = len(df)
@@ -96,7 +130,7 @@ def process_excel(file_path, output_path, folder_path):
         current_sheet += 1
         logger.info(f'Processing sheet {current_sheet}/{total_sheets}: {sheet_name}')
         try:
-            sheet_data['Chapters'] = sheet_data.apply(lambda row: process_sheet(sheet_name, row['DOI'], folder_path), axis=1)
+            sheet_data['Chapters'] = sheet_data.apply(lambda row: process_sheet(sheet_name, row['DOI'], folder_path, doi_index), axis=1)
             sheet_data.to_excel(writer, sheet_name=sheet_name, index=False)
         except Exception as e:
             logger.error(f'Error processing sheet {sheet_name}: {e}')
@@ -107,7 +141,8 @@ def process_excel(file_path, output_path, folder_path):
 input_excel_path = './results/matched_references.xlsx'
 output_excel_path = './results/matched_references_refined.xlsx'
 bib_folder_path = './data/references_no_duplicates'
+reference_store_path = './data/references_store'
 
 logger.info('Starting processing...')
-process_excel(input_excel_path, output_excel_path, bib_folder_path)
+process_excel(input_excel_path, output_excel_path, bib_folder_path, reference_store_path)
 logger.info('Processing complete.')
@@ -4,11 +4,14 @@ It searches for specific patterns in text files and counts the occurrences of th
 Note that the specific patterns are limited to ([First Author] et al., [Year]) format.
 Note that the count is set to 1 by default because each paper is cited at least once (as present in chapter bib files).
 The results are then added to the workbook and saved as a new Excel file.
+Optionally (section_depth), the citations are also attributed to the chapter sections in which they appear,
+using the section trees written by preprocessing/segment_sections.py (see report_sections.py).
 
 Functions:
 - create_search_pattern(author, year): Creates a regex pattern for searching based on the author and year.
 - count_pattern_in_file(file_path, pattern): Counts the occurrences of a pattern in a text file.
-- process_workbook(file_path, output_path, data_folder): Processes the workbook, counts the pattern occurrences, and saves the modified workbook.
+- count_pattern_by_section(file_path, pattern, depth): Counts the occurrences of a pattern in each section of a text file.
+- process_workbook(file_path, output_path, data_folder, section_depth=None): Processes the workbook, counts the pattern occurrences, and saves the modified workbook.
 
 Usage:
 - Modify the file_path, output_path, and data_folder variables according to your file locations.
@@ -18,6 +21,8 @@ Usage:
 import pandas as pd
 import os
 import re
+from report_sections import load_section_tree, section_segments, attribute_sections
+from report_text import file_exists, read_text
 
 def create_search_pattern(author, year):
     """
@@ -46,14 +51,47 @@ def count_pattern_in_file(file_path, pattern):
     - count (int): The number of occurrences of the pattern in the file.
     """
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
+        content = read_text(*os.path.split(file_path))
         count = len(pattern.findall(content))
         return max(1, count)  # Ensure that count is at least 1
     except FileNotFoundError:
         return 1  # Return 1 if the file is not found
+    except ValueError as e:
+        # The original txt file changed since it was split (see report_text.open_bytes): counted as missing
+        print(f"Error reading {file_path}: {e}")
+        return 1
 
-def process_workbook(file_path, output_path, data_folder):
+def count_pattern_by_section(file_path, pattern, depth):
+    """
+    Counts the occurrences of a pattern in each section of a text file.
+
+    Args:
+    - file_path (str): The path to the text file.
+    - pattern (re.Pattern): The compiled regex pattern.
+    - depth (int): The depth of the sections (2 for 10.2, 3 for 10.2.3).
+
+    Returns:
+    - counts (dict): The number of occurrences in each section, empty if the file or its section tree is missing
+      (or the file changed since it was split).
+    """
+    directory_path, file = os.path.split(file_path)
+    if not file_exists(directory_path, file):
+        return {}
+    tree = load_section_tree(directory_path, file)
+    if tree is None:
+        return {}
+    try:
+        content = read_text(directory_path, file)
+    except ValueError as e:
+        print(f"Error reading {file_path}: {e}")
+        return {}
+    positions = [match.start() for match in pattern.finditer(content)]
+    counts = {}
+    for section in attribute_sections(section_segments(tree, depth), positions):
+        counts[section] = counts.get(section, 0) + 1
+    return counts
+
+def process_workbook(file_path, output_path, data_folder, section_depth=None):
     """
     Processes the workbook, counts the pattern occurrences, and saves the modified workbook.
 
@@ -61,6 +99,7 @@ def process_workbook(file_path, output_path, data_folder):
     - file_path (str): The path to the input Excel file.
     - output_path (str): The path to save the modified Excel file.
     - data_folder (str): The folder containing the text files to search.
+    - section_depth (int): If set, the depth of the sections to which the occurrences are attributed ('Section Counts').
 
     Returns:
     - output_path (str): The path to the saved modified Excel file.
@@ -75,6 +114,8 @@ def process_workbook(file_path, output_path, data_folder):
         # Initialize new columns
         df['File Counts'] = ''
         df['Total Count'] = 0
+        if section_depth is not None:
+            df['Section Counts'] = ''
 
         # Iterate over each row in the DataFrame
         for index, row in df.iterrows():
@@ -82,6 +123,7 @@ def process_workbook(file_path, output_path, data_folder):
             year = row['Year']
             chapters = str(row['Chapters']).split(';')  # Convert to string to handle unexpected types
             file_counts = []
+            section_counts = []
             total_count = 0
 
             # Regex pattern for the current author and year
@@ -94,10 +136,15 @@ def process_workbook(file_path, output_path, data_folder):
                 count = count_pattern_in_file(file_path, pattern)
                 file_counts.append(f"{chapter.strip()}:{count}")
                 total_count += count
+                if section_depth is not None:
+                    section_counts.extend(f"{section}:{count}" for section, count in
+                                          count_pattern_by_section(file_path, pattern, section_depth).items())
 
             # Update the DataFrame with the counts
             df.at[index, 'File Counts'] = ';'.join(file_counts)
             df.at[index, 'Total Count'] = total_count
+            if section_depth is not None:
+                df.at[index, 'Section Counts'] = ';'.join(section_counts)
 
         # Write updated DataFrame to new sheet in the output Excel file
         df.to_excel(writer, sheet_name=sheet_name, index=False)
@@ -111,4 +158,5 @@ def process_workbook(file_path, output_path, data_folder):
 file_path = './data/cci/matched_references_unique_formated.xlsx'
 output_path = './results/matched_references_number_of_citations.xlsx'
 data_folder = './data/reports/content'
-process_workbook(file_path, output_path, data_folder)
+section_depth = None # Depth of the sections to which citations are attributed (e.g. 2 for 10.2), None to disable
+process_workbook(file_path, output_path, data_folder, section_depth)
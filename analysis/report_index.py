@@ -0,0 +1,260 @@
+"""
+This module builds and queries a persistent positional inverted index over the report txt files,
+so that search terms can be counted without rescanning the reports.
+
+The index is built once and stored next to the reports (in an 'index' folder of the reports directory):
+- documents.json            [indexed files with their size, modification time and byte range]
+- text.bin                  [case-folded text of all files (UTF-8), separated by a null byte]
+- vocabulary.bin            [sorted tokens separated by newlines]
+- vocabulary_offsets.npy    [start of each token in vocabulary.bin]
+- postings_pointers.npy     [start of the postings of each token in postings.npy]
+- postings.npy              [positions (bytes in text.bin) of each token, grouped by token]
+
+All files can be memory-mapped. Tokens are maximal runs of word characters (ASCII letters, digits,
+underscore and any non-ASCII character). A search alias is looked up through its first token, whose
+candidate positions are then checked against text.bin. Counts are therefore exactly the ones of
+term_matcher.py (and of the historical regex search) on the same files, including for aliases
+matching inside words (e.g. 'lake' in 'lakes').
+
+Functions:
+- build_index(directory_path, index_path=None): Build the index of the txt files of a directory.
+- index_is_stale(directory_path, index_path=None): Check if the txt files changed since the index was built.
+
+Classes:
+- ReportIndex(index_path): Query an index built by build_index.
+
+Example usage:
+build_index('./data/reports/content')
+index = ReportIndex('./data/reports/content/index')
+counts = index.count_terms(search_terms)    # terms x documents matrix
+"""
+
+import os
+import re
+import json
+import mmap
+import logging
+import numpy as np
+from term_matcher import fold_case, select_matches
+from report_text import list_txt_files, file_signature, read_text
+
+TOKEN_REGEX = re.compile(rb'[\w\x80-\xff]+')
+DOCUMENT_SEPARATOR = b'\x00'
+
+def default_index_path(directory_path):
+    """Return the default location of the index of a reports directory."""
+    return os.path.join(directory_path, 'index')
+
+def _list_files(directory_path):
+    return sorted(list_txt_files(directory_path))
+
+def build_index(directory_path, index_path=None):
+    """
+    Builds the positional inverted index of the txt files of a directory.
+
+    Args:
+        directory_path (str): The directory containing the report txt files.
+        index_path (str): The directory where the index is saved (default: 'index' folder of directory_path).
+
+    Returns:
+        str: The path of the index.
+    """
+    index_path = index_path or default_index_path(directory_path)
+    os.makedirs(index_path, exist_ok=True)
+
+    vocabulary = {}
+    token_ids = []
+    positions = []
+    documents = []
+    position = 0
+
+    with open(os.path.join(index_path, 'text.bin'), 'wb') as text_file:
+        for file in _list_files(directory_path):
+            size, mtime_ns = file_signature(directory_path, file)
+            document = {'file': file, 'size': size, 'mtime_ns': mtime_ns, 'start': position, 'end': position, 'error': None}
+            documents.append(document)
+            try:
+                data = fold_case(read_text(directory_path, file)).encode('utf-8')
+            except Exception as e:
+                logging.warning(f'Error indexing file {file}: {e}')
+                document['error'] = str(e)
+                continue
+            logging.info(f'Indexing file: {file}')
+            for match in TOKEN_REGEX.finditer(data):
+                token_id = vocabulary.setdefault(match.group(), len(vocabulary))
+                token_ids.append(token_id)
+                positions.append(position + match.start())
+            text_file.write(data)
+            text_file.write(DOCUMENT_SEPARATOR)
+            document['end'] = position + len(data)
+            position += len(data) + len(DOCUMENT_SEPARATOR)
+
+    # Renumber tokens in sorted order and group the positions by token
+    tokens = sorted(vocabulary)
+    rank = np.empty(len(tokens), dtype=np.int64)
+    for new_id, token in enumerate(tokens):
+        rank[vocabulary[token]] = new_id
+    token_ids = rank[np.asarray(token_ids, dtype=np.int64)]
+    positions = np.asarray(positions, dtype=np.uint64)
+    order = np.lexsort((positions, token_ids))
+    pointers = np.searchsorted(token_ids[order], np.arange(len(tokens) + 1)).astype(np.int64)
+
+    vocabulary_blob = b'\n'.join(tokens)
+    vocabulary_offsets = np.zeros(len(tokens), dtype=np.int64)
+    if tokens:
+        vocabulary_offsets[1:] = np.cumsum([len(token) + 1 for token in tokens[:-1]])
+
+    with open(os.path.join(index_path, 'vocabulary.bin'), 'wb') as f:
+        f.write(vocabulary_blob)
+    np.save(os.path.join(index_path, 'vocabulary_offsets.npy'), vocabulary_offsets)
+    np.save(os.path.join(index_path, 'postings_pointers.npy'), pointers)
+    np.save(os.path.join(index_path, 'postings.npy'), positions[order])
+    with open(os.path.join(index_path, 'documents.json'), 'w', encoding='utf-8') as f:
+        json.dump(documents, f, indent=1)
+
+    logging.info(f'Index of {len(documents)} files and {len(tokens)} tokens written to {index_path}')
+    return index_path
+
+def index_is_stale(directory_path, index_path=None):
+    """
+    Checks if the txt files of a directory were added, removed or modified since the index was built.
+
+    Args:
+        directory_path (str): The directory containing the report txt files.
+        index_path (str): The directory of the index (default: 'index' folder of directory_path).
+
+    Returns:
+        bool: True if the index is missing or stale, False otherwise.
+    """
+    index_path = index_path or default_index_path(directory_path)
+    documents_path = os.path.join(index_path, 'documents.json')
+    if not os.path.exists(documents_path):
+        return True
+    with open(documents_path, 'r', encoding='utf-8') as f:
+        documents = json.load(f)
+    if [document['file'] for document in documents] != _list_files(directory_path):
+        return True
+    return any(file_signature(directory_path, document['file']) != (document['size'], document['mtime_ns'])
+               for document in documents)
+
+class ReportIndex:
+    """
+    Memory-mapped view of an index built by build_index.
+
+    Args:
+        index_path (str): The directory of the index.
+    """
+
+    def __init__(self, index_path):
+        with open(os.path.join(index_path, 'documents.json'), 'r', encoding='utf-8') as f:
+            self.documents = json.load(f)
+        self.files = [document['file'] for document in self.documents]
+        self._document_starts = np.array([document['start'] for document in self.documents], dtype=np.int64)
+        self._text_file = open(os.path.join(index_path, 'text.bin'), 'rb')
+        self._vocabulary_file = open(os.path.join(index_path, 'vocabulary.bin'), 'rb')
+        self.text = self._map(self._text_file)
+        self.vocabulary = self._map(self._vocabulary_file)
+        self.vocabulary_offsets = np.load(os.path.join(index_path, 'vocabulary_offsets.npy'), mmap_mode='r')
+        self.pointers = np.load(os.path.join(index_path, 'postings_pointers.npy'), mmap_mode='r')
+        self.postings = np.load(os.path.join(index_path, 'postings.npy'), mmap_mode='r')
+
+    @staticmethod
+    def _map(file):
+        # Empty files cannot be memory-mapped
+        if os.fstat(file.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        for mapped in (self.text, self.vocabulary):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        self._text_file.close()
+        self._vocabulary_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _candidate_positions(self, pattern):
+        """Positions (bytes in text.bin) where pattern may start, from the postings of its first token."""
+        first_token = TOKEN_REGEX.search(pattern)
+        if first_token is None:
+            # No token to look up, fall back to a scan of the text
+            return np.array([m.start() for m in re.finditer(b'(?=' + re.escape(pattern) + b')', self.text)], dtype=np.int64)
+
+        token = re.escape(first_token.group())
+        bounded_start = first_token.start() > 0
+        bounded_end = first_token.end() < len(pattern)
+        # Vocabulary tokens containing the first token, with the constraints given by the pattern around it
+        regex = (b'^' if bounded_start else b'(?=') + token + (b'$' if bounded_end else b'') + (b'' if bounded_start else b')')
+        candidates = []
+        for match in re.finditer(regex, self.vocabulary, re.MULTILINE):
+            token_id = int(np.searchsorted(self.vocabulary_offsets, match.start(), side='right')) - 1
+            shift = match.start() - int(self.vocabulary_offsets[token_id]) - first_token.start()
+            postings = self.postings[self.pointers[token_id]:self.pointers[token_id + 1]]
+            candidates.append(postings.astype(np.int64) + shift)
+        if not candidates:
+            return np.array([], dtype=np.int64)
+        return np.concatenate(candidates)
+
+    def alias_positions(self, alias):
+        """
+        Finds all the positions (bytes in text.bin) of an alias, including overlapping ones.
+
+        Args:
+            alias (str): The alias to find.
+
+        Returns:
+            numpy.ndarray: The sorted positions of the alias.
+        """
+        pattern = fold_case(alias).encode('utf-8')
+        text = self.text
+        length = len(pattern)
+        found = [position for position in self._candidate_positions(pattern).tolist()
+                 if position >= 0 and text[position:position + length] == pattern]
+        return np.unique(np.array(found, dtype=np.int64))
+
+    def count_term(self, term, aliases, include_term=True):
+        """
+        Counts a search term (with its aliases) in each indexed document.
+
+        Args:
+            term (str): The search term.
+            aliases (list): The aliases of the search term.
+            include_term (bool): Whether the term itself is matched before its aliases (default: True).
+
+        Returns:
+            numpy.ndarray: The count of the term in each document (in the order of self.files).
+        """
+        occurrences_by_document = {}
+        for priority, alias in enumerate(([term] if include_term else []) + list(aliases)):
+            if not alias:
+                raise ValueError(f'Empty alias for search term {term!r}')
+            positions = self.alias_positions(alias)
+            length = len(fold_case(alias).encode('utf-8'))
+            document_ids = np.searchsorted(self._document_starts, positions, side='right') - 1
+            for document_id, position in zip(document_ids.tolist(), positions.tolist()):
+                occurrences_by_document.setdefault(document_id, []).append((position, priority, position + length))
+        counts = np.zeros(len(self.documents), dtype=np.uint32)
+        for document_id, occurrences in occurrences_by_document.items():
+            counts[document_id] = len(select_matches(occurrences))
+        return counts
+
+    def count_terms(self, search_terms, include_terms=True):
+        """
+        Counts all the search terms in each indexed document.
+
+        Args:
+            search_terms (dict): Search terms and their aliases.
+            include_terms (bool): Whether the terms themselves are matched before their aliases (default: True).
+
+        Returns:
+            numpy.ndarray: The counts matrix (terms x documents, in the order of self.files).
+        """
+        counts = np.zeros((len(search_terms), len(self.documents)), dtype=np.uint32)
+        for row, (term, aliases) in enumerate(search_terms.items()):
+            counts[row] = self.count_term(term, aliases, include_terms)
+        return counts
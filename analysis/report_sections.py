@@ -0,0 +1,104 @@
+"""
+This module reads the section trees of the report chapters (written by preprocessing/segment_sections.py)
+and attributes character offsets in the chapter texts (term matches, in-text citations...) to sections.
+
+Sections can be attributed at any depth: at depth 2, a match in section 10.2.3.1 is attributed to 10.2,
+and a match before the first section of the chapter is attributed to the chapter itself. Boxes and FAQs
+are attributed as sections of the level of their parent + 1.
+
+Functions:
+- load_section_tree(directory_path, file): Load the section tree of a chapter file.
+- iter_sections(tree): Iterate over the nodes of a section tree.
+- section_segments(tree, depth=None): Split a chapter into consecutive segments of sections of a given depth.
+- attribute_sections(segments, positions): Find the section of character offsets.
+
+Example usage:
+tree = load_section_tree('./data/reports/content', 'wg1_ch10.txt')
+segments = section_segments(tree, depth=2)
+sections = attribute_sections(segments, [1200, 56000])    # ['10.1', '10.3']
+"""
+
+import os
+import json
+import logging
+import numpy as np
+from report_text import file_signature
+
+def default_sections_path(directory_path):
+    """Return the default location of the section trees of a reports directory."""
+    return os.path.join(directory_path, 'sections')
+
+def load_section_tree(directory_path, file, sections_path=None):
+    """
+    Loads the section tree of a chapter file.
+
+    Args:
+        directory_path (str): The directory containing the chapter txt files.
+        file (str): The chapter txt file.
+        sections_path (str): The directory of the section trees (default: 'sections' folder of directory_path).
+
+    Returns:
+        dict: The root node of the section tree, or None if the tree is missing or older than the file.
+    """
+    sections_path = sections_path or default_sections_path(directory_path)
+    tree_path = os.path.join(sections_path, file.replace('.txt', '.json'))
+    if not os.path.exists(tree_path):
+        return None
+    with open(tree_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if (data['signature']['size'], data['signature']['mtime_ns']) != file_signature(directory_path, file):
+        logging.warning(f'Section tree of {file} is out of date, run segment_sections.py again')
+        return None
+    return data['tree']
+
+def iter_sections(tree):
+    """Iterate over the nodes of a section tree, in the order of the text (parents before children)."""
+    yield tree
+    for child in tree['children']:
+        yield from iter_sections(child)
+
+def section_segments(tree, depth=None):
+    """
+    Splits a chapter into consecutive segments, each segment belonging to the deepest section of at most
+    the given depth that contains it.
+
+    Args:
+        tree (dict): The root node of the section tree.
+        depth (int): The maximum level of the sections (default: all levels).
+
+    Returns:
+        tuple: The start offsets of the segments (numpy.ndarray) and the id of the section of each segment (list).
+    """
+    starts = []
+    ids = []
+
+    def visit(node):
+        starts.append(node['start'])
+        ids.append(node['id'])
+        for child in node['children']:
+            if depth is None or child['level'] <= depth:
+                visit(child)
+                # Back to the parent after the child
+                starts.append(child['end'])
+                ids.append(node['id'])
+
+    visit(tree)
+    # Keep the last segment starting at each offset (empty segments are dropped)
+    starts = np.array(starts, dtype=np.int64)
+    keep = np.append(starts[1:] != starts[:-1], True)
+    return starts[keep], [section_id for section_id, kept in zip(ids, keep) if kept]
+
+def attribute_sections(segments, positions):
+    """
+    Finds the section of character offsets in a chapter text, with a binary search in the segments.
+
+    Args:
+        segments (tuple): The segments of the chapter, as returned by section_segments.
+        positions (list): The character offsets.
+
+    Returns:
+        list: The id of the section of each offset.
+    """
+    starts, ids = segments
+    indices = np.searchsorted(starts, positions, side='right') - 1
+    return [ids[max(index, 0)] for index in indices.tolist()]
@@ -0,0 +1,128 @@
+"""
+This module reads the report txt files of a directory, whether they are real files or parts of other files
+recorded in a split index (split.json) by preprocessing/split_chapter_references.py in index mode.
+
+In index mode, the content and references of each chapter are not copied: the 'content' and 'references'
+folders only contain a split.json file giving, for each chapter, the byte range of the part in the
+original txt file. The parts are read as memory-mapped slices of the original files, without copy.
+When a directory contains both a txt file and a split index entry with the same name, the entry is used.
+
+The split index has the following format:
+{"source_folder": "../txt", "part": "content", "files": {"wg1_ch1.txt": {"start": 0, "end": 180512,
+ "start_char": 0, "size": 250136, "mtime_ns": ...}}}
+with start and end in bytes, start_char the character offset of the part in the original file, size and
+mtime_ns the size and modification time of the original file when it was split.
+
+Functions:
+- list_txt_files(directory_path): List the txt files of a directory, including the split parts.
+- file_exists(directory_path, file): Check if a txt file or split part exists.
+- file_signature(directory_path, file): Return the size and modification time of a txt file or split part.
+- open_bytes(directory_path, file): Open a txt file or split part as a memoryview (context manager).
+- read_text(directory_path, file): Read a txt file or split part as text.
+- load_page_starts(directory_path, file): Load the page start offsets of a txt file or split part.
+
+Example usage:
+for file in list_txt_files('./data/reports/content'):
+    text = read_text('./data/reports/content', file)
+"""
+
+import os
+import json
+import mmap
+from contextlib import contextmanager
+
+SPLIT_INDEX_NAME = 'split.json'
+
+_split_indexes = {}
+
+def load_split_index(directory_path):
+    """Return the split index of a directory (cached until the index file changes), or None."""
+    index_path = os.path.join(directory_path, SPLIT_INDEX_NAME)
+    if not os.path.exists(index_path):
+        return None
+    mtime_ns = os.stat(index_path).st_mtime_ns
+    cached = _split_indexes.get(index_path)
+    if cached is None or cached[0] != mtime_ns:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            cached = (mtime_ns, json.load(f))
+        _split_indexes[index_path] = cached
+    return cached[1]
+
+def _split_entry(directory_path, file):
+    split_index = load_split_index(directory_path)
+    if split_index is None or file not in split_index['files']:
+        return None, None
+    source_path = os.path.join(directory_path, split_index['source_folder'], file)
+    return split_index['files'][file], source_path
+
+def list_txt_files(directory_path):
+    """List the txt files of a directory (in os.listdir order), followed by the split parts without txt file."""
+    files = [f for f in os.listdir(directory_path) if f.endswith('.txt')]
+    split_index = load_split_index(directory_path)
+    if split_index is not None:
+        present = set(files)
+        files += [f for f in split_index['files'] if f not in present]
+    return files
+
+def file_exists(directory_path, file):
+    """Check if a txt file or split part exists."""
+    entry, source_path = _split_entry(directory_path, file)
+    if entry is not None:
+        return os.path.exists(source_path)
+    return os.path.exists(os.path.join(directory_path, file))
+
+def file_signature(directory_path, file):
+    """
+    Return the size and modification time of a txt file or split part, for change detection.
+    The size of a split part is its size in bytes, and its modification time the one of the original file.
+    """
+    entry, source_path = _split_entry(directory_path, file)
+    if entry is not None:
+        return entry['end'] - entry['start'], os.stat(source_path).st_mtime_ns
+    stat = os.stat(os.path.join(directory_path, file))
+    return stat.st_size, stat.st_mtime_ns
+
+@contextmanager
+def open_bytes(directory_path, file):
+    """
+    Opens a txt file or split part as a read-only memoryview of its bytes, memory-mapped without copy.
+    The memoryview must not be used after the end of the with block.
+    """
+    entry, source_path = _split_entry(directory_path, file)
+    file_path = source_path if entry is not None else os.path.join(directory_path, file)
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if entry is not None and (size, os.fstat(f.fileno()).st_mtime_ns) != (entry['size'], entry['mtime_ns']):
+            raise ValueError(f'{file} changed since it was split, run split_chapter_references.py again')
+        if size == 0:
+            yield memoryview(b'')
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            part = view[entry['start']:entry['end']] if entry is not None else view
+            try:
+                yield part
+            finally:
+                part.release()
+                view.release()
+
+def read_text(directory_path, file):
+    """Read a txt file or split part as text, with the same line breaks as open(..., 'r')."""
+    with open_bytes(directory_path, file) as data:
+        text = str(data, 'utf-8')
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+def load_page_starts(directory_path, file):
+    """
+    Load the start offset (in characters) of each page of a txt file or split part, from the page sidecar
+    of the file (<name>.pages.bin, see utils/pdf_to_txt.py). Return None if there is no sidecar.
+    """
+    import numpy as np
+    entry, source_path = _split_entry(directory_path, file)
+    pages_path = os.path.splitext(source_path if entry is not None else os.path.join(directory_path, file))[0] + '.pages.bin'
+    if not os.path.exists(pages_path):
+        return None
+    page_starts = np.fromfile(pages_path, dtype='<i8')
+    if entry is not None:
+        page_starts = np.maximum(page_starts - entry['start_char'], 0)
+    return page_starts
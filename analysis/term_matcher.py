@@ -0,0 +1,210 @@
+"""
+This module provides a single-pass multi-term matcher used to count search terms in report files.
+All terms and their aliases (ECVs, projects, sensors, satellites, CMIP MIPs...) are compiled into
+one Aho-Corasick automaton so that each document is scanned once, whatever the number of terms.
+
+The counts are identical to the historical per-term approach, where each term was counted with
+len(re.compile('|'.join(re.escape(alias) for alias in [term] + aliases), re.IGNORECASE).findall(text)):
+- Case-insensitive matching uses the same simple case folding as re.IGNORECASE
+- For each term, matches do not overlap and are searched from left to right
+- When several aliases of a term start at the same position, the first one listed wins
+
+Functions:
+- fold_case(text): Fold the case of a text as re.IGNORECASE does, keeping character offsets.
+- select_matches(occurrences): Select the non-overlapping matches of a term from all its occurrences.
+
+Classes:
+- TermMatcher(search_terms): Compile the search terms and count them in texts.
+
+Example usage:
+matcher = TermMatcher({'sea ice': [], 'water vapour': ['water vapor']})
+counts = matcher.count(text)    # {'sea ice': 12, 'water vapour': 3}
+"""
+
+from collections import deque
+
+try:
+    from re._casefix import _EXTRA_CASES
+except ImportError:  # Python < 3.11
+    _EXTRA_CASES = {}
+
+def _build_equivalence_table():
+    """
+    Builds a translation table mapping the characters that re.IGNORECASE considers equivalent
+    beyond lowercasing (e.g. 'ı' and 'i', 'ς' and 'σ') to a single representative.
+
+    Returns:
+        dict: A str.translate table.
+    """
+    groups = {}
+    for char, others in _EXTRA_CASES.items():
+        group = {char, *others}
+        for member in list(group):
+            group |= groups.get(member, set())
+        for member in group:
+            groups[member] = group
+    return {char: min(group) for char, group in groups.items() if char != min(group)}
+
+_EQUIVALENCE_TABLE = _build_equivalence_table()
+
+def fold_case(text):
+    """
+    Folds the case of a text as re.IGNORECASE does, keeping one character for each input character
+    so that offsets in the folded text are offsets in the original text.
+
+    Args:
+        text (str): The text to fold.
+
+    Returns:
+        str: The folded text.
+    """
+    # 'İ' is the only character whose full lowercase mapping has more than one character
+    return text.replace('İ', 'i').lower().translate(_EQUIVALENCE_TABLE)
+
+def select_matches(occurrences):
+    """
+    Selects the non-overlapping matches of a term from all the occurrences of its aliases,
+    reproducing the behaviour of re.findall on the alternation of the aliases.
+
+    Args:
+        occurrences (list): (start, priority, end) tuples, priority being the position of the alias in the term list.
+
+    Returns:
+        list: The start offsets of the selected matches.
+    """
+    starts = []
+    position = 0
+    for start, _, end in sorted(occurrences):
+        if start >= position:
+            starts.append(start)
+            position = end
+    return starts
+
+class TermMatcher:
+    """
+    Aho-Corasick automaton over all the aliases of a set of search terms.
+
+    Args:
+        search_terms (dict): Search terms and their aliases, e.g. loaded from search_terms.json.
+        include_terms (bool): Whether the terms themselves are matched before their aliases (default: True).
+    """
+
+    def __init__(self, search_terms, include_terms=True):
+        self.terms = list(search_terms.keys())
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [()]
+        for term_index, (term, aliases) in enumerate(search_terms.items()):
+            for priority, alias in enumerate(([term] if include_terms else []) + list(aliases)):
+                if not alias:
+                    raise ValueError(f'Empty alias for search term {term!r}')
+                self._add_pattern(fold_case(alias), (term_index, priority, len(alias)))
+        self._build_failure_links()
+        # Transitions are computed lazily and cached, only for the characters met in the texts
+        self._delta = [dict(goto) for goto in self._goto]
+
+    def __getstate__(self):
+        # The cached transitions can be rebuilt, do not copy them to worker processes
+        state = self.__dict__.copy()
+        state['_delta'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._delta = [dict(goto) for goto in self._goto]
+
+    def _add_pattern(self, pattern, output):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append(())
+            state = next_state
+        self._outputs[state] += (output,)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail
+                # States are visited by increasing depth, so the outputs of the failure state are complete
+                self._outputs[next_state] += self._outputs[fail]
+
+    def _transition(self, state, char):
+        origin = state
+        while state and char not in self._goto[state]:
+            state = self._fail[state]
+        next_state = self._goto[state].get(char, 0)
+        self._delta[origin][char] = next_state
+        return next_state
+
+    def occurrences(self, text):
+        """
+        Scans a text once and returns all the occurrences of all the aliases, including overlapping ones.
+
+        Args:
+            text (str): The text to scan.
+
+        Returns:
+            list: For each term (in the order of self.terms), a list of (start, priority, end) tuples.
+        """
+        delta = self._delta
+        outputs = self._outputs
+        transition = self._transition
+        occurrences = [[] for _ in self.terms]
+        state = 0
+        for end, char in enumerate(fold_case(text), 1):
+            next_state = delta[state].get(char)
+            if next_state is None:
+                next_state = transition(state, char)
+            state = next_state
+            if outputs[state]:
+                for term_index, priority, length in outputs[state]:
+                    occurrences[term_index].append((end - length, priority, end))
+        return occurrences
+
+    def find(self, text):
+        """
+        Finds the start offsets of the matches of each term in a text.
+
+        Args:
+            text (str): The text to scan.
+
+        Returns:
+            list: For each term (in the order of self.terms), the sorted start offsets of its matches.
+        """
+        return [select_matches(term_occurrences) for term_occurrences in self.occurrences(text)]
+
+    def count_list(self, text):
+        """
+        Counts the matches of each term in a text.
+
+        Args:
+            text (str): The text to scan.
+
+        Returns:
+            list: The count of each term, in the order of self.terms.
+        """
+        return [len(starts) for starts in self.find(text)]
+
+    def count(self, text):
+        """
+        Counts the matches of each term in a text.
+
+        Args:
+            text (str): The text to scan.
+
+        Returns:
+            dict: The count of each term.
+        """
+        return dict(zip(self.terms, self.count_list(text)))
@@ -2,69 +2,75 @@
 This script performs a search for specific terms in a collection of text files.
 It allows the user to choose between two types of analysis: 'ar6' or 'ars'.
 The script loads a set of search terms and their aliases from a JSON file,
-and then searches for these terms in the text files located in the specified directories. 
+and then searches for these terms in the text files located in the specified directories.
 The results are written to separate sheets in an Excel file.
 
 The script follows the following steps:
 1. Setup logging configuration.
 2. Load search terms and their aliases from a JSON file.
 3. Define the directories and output paths based on the selected analysis type.
-4. Prepare regex patterns for the search terms.
+4. Compile the search terms and their aliases into a single-pass matcher (see term_matcher.py).
 5. Define the tags based on the selected analysis type.
-6. Define a function to extract tags from filenames.
-7. Group the files by tag.
-8. Initialize an Excel writer.
-9. Iterate over the tags and files, and search for the terms in the files.
-10. Write the results to separate sheets in the Excel file.
-11. Sort the columns in the Excel file.
-12. Remove the temporary file.
-13. Log the completion of the search.
+6. Group the files by tag.
+7. Order the files once, by tag and in natural chapter order (CH10 after CH9).
+8. Search for the terms in the files, optionally in a pool of worker processes or from the
+   inverted index of the files (see report_index.py), and store the counts in a terms x files matrix.
+   In incremental mode, only the files and search terms that changed since the previous run are
+   searched again (see count_manifest.py). In canonical mode, canonical aliases are searched in the
+   normalized texts (see text_normalization.py).
+9. Write the results to separate sheets in an Excel file, each sheet in a single write.
+10. Optionally, count the terms in each page of the files, using the page sidecars written by pdf_to_txt.py
+    (<name>.pages.bin), and save one terms x pages matrix per file in a NumPy archive (.npz).
+    Optionally, count the terms in each section of the files, at a given depth, using the section trees
+    written by segment_sections.py (see report_sections.py), and write them to a separate Excel file.
+11. Log the completion of the search.
 
 Note: The script assumes that the necessary directories and files exist.
 """
 
 import logging
 import os
-import re
 import json
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from term_matcher import TermMatcher
+from report_index import ReportIndex, build_index, default_index_path, index_is_stale
+from count_manifest import update_counts
+from text_normalization import canonical_search_terms, update_canonical_cache
+from report_sections import load_section_tree, section_segments, iter_sections
+from report_text import list_txt_files, read_text, load_page_starts
 
 analysis = 'ar6' # Choose between 'ar6' or 'ars
+workers = 1 # Number of worker processes: 1 to process the files one by one, None to use all cores
+use_index = False # Count the terms from the inverted index of the reports (built or rebuilt when files changed)
+incremental = False # Only recount the files and search terms that changed since the previous run (see count_manifest.py)
+canonical = False # Match canonical aliases in the canonical (normalized and cached) texts (see text_normalization.py)
+per_page = False # Also count the terms in each page of the files (needs the .pages.bin sidecars of pdf_to_txt.py)
+per_section = False # Also count the terms in each section of the files (needs the section trees of segment_sections.py)
+section_depth = 2 # Depth of the sections for per-section counts (2 for 10.2, 3 for 10.2.3, None for all levels)
 
 # Setup logging
-logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
-
-# Load search terms and their aliases
-with open('./data/cci/search_terms.json', 'r') as f:
-    search_terms = json.load(f)
+LOG_FORMAT = '%(levelname)s - %(message)s'
+logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
 
 # Directory containing .txt files
 ar6_directory_path = './data/reports/content'
 ars_directory_path = './data/reports/full'
 ar6_output_excel_path = './results/terms_in_reports_ar6.xlsx'
 ars_output_excel_path = './results/terms_in_reports_ars.xlsx'
-
-# Prepare regex patterns for search terms
-patterns = {}
-for term, aliases in search_terms.items():
-    all_terms = [term] + aliases
-    pattern = '|'.join(re.escape(alias) for alias in all_terms)
-    patterns[term] = re.compile(pattern, re.IGNORECASE)
+ar6_manifest_path = './results/terms_in_reports_ar6_manifest.json'
+ars_manifest_path = './results/terms_in_reports_ars_manifest.json'
+ar6_pages_path = './results/terms_in_reports_ar6_pages.npz'
+ars_pages_path = './results/terms_in_reports_ars_pages.npz'
+ar6_sections_path = './results/terms_in_reports_ar6_sections.xlsx'
+ars_sections_path = './results/terms_in_reports_ars_sections.xlsx'
+search_terms_path = './data/cci/search_terms.json'
 
 # Define tags
 ar6_tags = ['sr15', 'srccl', 'srocc', 'wg1', 'wg2', 'wg3', 'syr']
 ars_tags = [f'ar{i}' for i in range(1,7)]
 
-# Select analysis
-if analysis == 'ar6':
-    tags = ar6_tags
-    directory_path = ar6_directory_path
-    output_excel_path = ar6_output_excel_path
-elif analysis == 'ars':
-    tags = ars_tags
-    directory_path = ars_directory_path
-    output_excel_path = ars_output_excel_path
-
 # Function to extract tag from filename
 def extract_tag(filename, tags):
     for tag in tags:
@@ -73,69 +79,266 @@ def extract_tag(filename, tags):
     return 'other'
 
 # Group files by tag
-files_by_tag = {}
-for file in os.listdir(directory_path):
-    if file.endswith('.txt'):
-        tag = extract_tag(file, tags)
-        if tag not in files_by_tag:
-            files_by_tag[tag] = []
-        files_by_tag[tag].append(file)
-
-# Initialize Excel writer
-excel_path_temp = './results/terms_in_reports_temp.xlsx'
-
-with pd.ExcelWriter(excel_path_temp) as writer:
-    for tag, files in files_by_tag.items():
-        # Initialize DataFrame for the current tag
-        results_df = pd.DataFrame(columns=['Term'] + [file.replace('.txt', '') for file in files])
-        results_df['Term'] = list(search_terms.keys())
-
-        # Search through files of the current tag
-        for file in files:
-            logging.info(f'Processing file: {file}')
-            try:
-                with open(os.path.join(directory_path, file), 'r', encoding='utf-8') as f:
-                    text = f.read()
-                for term, pattern in patterns.items():
-                    count = len(pattern.findall(text))
-                    results_df.loc[results_df['Term'] == term, file.replace('.txt', '')] = count
-            except Exception as e:
-                logging.warning(f'Error processing file {file}: {e}')
-
-        # Write results of the current tag to a separate sheet in the Excel document
-        results_df.to_excel(writer, sheet_name=tag, index=False)
+def group_files_by_tag(directory_path, tags):
+    files_by_tag = {}
+    for file in list_txt_files(directory_path):
+        if file.endswith('.txt'):
+            tag = extract_tag(file, tags)
+            if tag not in files_by_tag:
+                files_by_tag[tag] = []
+            files_by_tag[tag].append(file)
+    return files_by_tag
 
 # Sort the columns so that CH10 appears after CH9 and not after CH1
-def sort_columns(df):
-    ecv_column = df['Term'] if 'Term' in df.columns else None
-    def sort_key(col):
-        if 'ch' in col:
-            num_part = int(''.join(filter(str.isdigit, col.split('ch')[-1])))
-            return (0, num_part)
-        elif 'a' not in col:
-            return (1, col)
-        else:
-            return (2, col)
-    columns_to_sort = [col for col in df.columns if col != 'Term']
-    sorted_columns = sorted(columns_to_sort, key=sort_key)
-    if ecv_column is not None:
-        sorted_columns = ['Term'] + sorted_columns
-    return df[sorted_columns]
-
-input_excel_path = excel_path_temp  # Actual input file path
-
-with pd.ExcelWriter(output_excel_path) as writer:
-    for sheet_name in pd.ExcelFile(input_excel_path).sheet_names:
-        df = pd.read_excel(input_excel_path, sheet_name=sheet_name)
-        df_sorted = sort_columns(df)
-        df_sorted.to_excel(writer, sheet_name=sheet_name, index=False)
-
-# Check if the file exists and then remove it
-if os.path.exists(excel_path_temp):
-    os.remove(excel_path_temp)
-else:
-    print("Temporary file does not exist.")
-
-# Log completion
-logging.info(f'Results written to {output_excel_path}')
-logging.info('Search completed. Check the logs for any warnings or errors.')
\ No newline at end of file
+def sort_key(col):
+    if 'ch' in col:
+        num_part = int(''.join(filter(str.isdigit, col.split('ch')[-1])))
+        return (0, num_part)
+    elif 'a' not in col:
+        return (1, col)
+    else:
+        return (2, col)
+
+# Order the documents once: by tag, then in natural chapter order within each tag
+def order_documents(files_by_tag):
+    documents = []
+    columns_by_tag = {}
+    for tag, files in files_by_tag.items():
+        files = sorted(files, key=lambda file: sort_key(file.replace('.txt', '')))
+        columns_by_tag[tag] = list(range(len(documents), len(documents) + len(files)))
+        documents.extend(files)
+    return documents, columns_by_tag
+
+# Matcher of the current process, set once per worker by init_worker
+worker_matcher = None
+
+def init_worker(matcher, log_level=logging.INFO):
+    global worker_matcher
+    worker_matcher = matcher
+    # Spawned workers do not inherit the logging configuration of the parent process
+    logging.basicConfig(level=log_level, format=LOG_FORMAT)
+
+def count_file(file_path):
+    """Count the search terms in a file, return the counts or the error message if the file fails."""
+    logging.info(f'Processing file: {os.path.basename(file_path)}')
+    try:
+        text = read_text(*os.path.split(file_path))
+        return worker_matcher.count_list(text), None
+    except Exception as e:
+        return None, str(e)
+
+def count_documents(directory_path, documents, matcher, workers=1):
+    """
+    Count the search terms in the documents, in a pool of worker processes if workers is not 1.
+    The matcher is sent once to each worker and the results are merged in the order of the documents.
+    Return the counts matrix (terms x documents) and the mask of the documents that failed.
+    """
+    counts = np.zeros((len(matcher.terms), len(documents)), dtype=np.uint32)
+    failed = np.zeros(len(documents), dtype=bool)
+    file_paths = [os.path.join(directory_path, file) for file in documents]
+
+    executor = None
+    if workers == 1:
+        init_worker(matcher)
+        results = map(count_file, file_paths)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                       initargs=(matcher, logging.getLogger().level))
+        results = executor.map(count_file, file_paths)
+
+    try:
+        for column, (file, (file_counts, error)) in enumerate(zip(documents, results)):
+            if error is None:
+                counts[:, column] = file_counts
+            else:
+                failed[column] = True
+                logging.warning(f'Error processing file {file}: {error}')
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return counts, failed
+
+def count_file_segments(args):
+    """
+    Count the search terms in each segment (page, section...) of a file, given the start offsets of the segments.
+    Return the counts (terms x segments) or the error message if the file fails.
+    """
+    file_path, segment_starts = args
+    logging.info(f'Processing segments of file: {os.path.basename(file_path)}')
+    try:
+        text = read_text(*os.path.split(file_path))
+        counts = np.zeros((len(worker_matcher.terms), len(segment_starts)), dtype=np.uint32)
+        for row, starts in enumerate(worker_matcher.find(text)):
+            if starts:
+                # Segment of each match, by binary search in the segment start offsets
+                segments = np.maximum(np.searchsorted(segment_starts, starts, side='right') - 1, 0)
+                counts[row] = np.bincount(segments, minlength=len(segment_starts))
+        return counts, None
+    except Exception as e:
+        return None, str(e)
+
+def count_document_segments(directory_path, segment_starts, matcher, workers=1):
+    """
+    Count the search terms in each segment of the documents, in a pool of worker processes if workers is not 1.
+    segment_starts is a dictionary {document: start offsets of its segments}.
+    Return a dictionary {document: counts matrix (terms x segments)}, documents that failed are skipped.
+    """
+    documents = list(segment_starts)
+    tasks = [(os.path.join(directory_path, file), segment_starts[file]) for file in documents]
+
+    executor = None
+    if workers == 1:
+        init_worker(matcher)
+        results = map(count_file_segments, tasks)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                       initargs=(matcher, logging.getLogger().level))
+        results = executor.map(count_file_segments, tasks)
+
+    segment_counts = {}
+    try:
+        for file, (counts, error) in zip(documents, results):
+            if error is None:
+                segment_counts[file] = counts
+            else:
+                logging.warning(f'Error processing segments of file {file}: {error}')
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return segment_counts
+
+def count_documents_from_index(directory_path, documents, search_terms, include_terms=True):
+    """
+    Count the search terms in the documents from the inverted index of the directory (see report_index.py),
+    building it first if it is missing or if the files changed.
+    Return the counts matrix (terms x documents) and the mask of the documents that failed.
+    """
+    index_path = default_index_path(directory_path)
+    if index_is_stale(directory_path, index_path):
+        logging.info(f'Building the index of {directory_path}')
+        build_index(directory_path, index_path)
+    counts = np.zeros((len(search_terms), len(documents)), dtype=np.uint32)
+    with ReportIndex(index_path) as index:
+        index_columns = {file: column for column, file in enumerate(index.files)}
+        errors = [index.documents[index_columns[file]]['error'] if file in index_columns else 'File not indexed'
+                  for file in documents]
+        columns = [column for column, file in enumerate(documents) if file in index_columns]
+        counts[:, columns] = index.count_terms(search_terms, include_terms)[:, [index_columns[documents[column]] for column in columns]]
+    failed = np.array([error is not None for error in errors], dtype=bool)
+    for file, error in zip(documents, errors):
+        if error is not None:
+            logging.warning(f'Error processing file {file}: {error}')
+    return counts, failed
+
+# Write the counts of each section (one row per section, one column per term), one sheet per tag
+def write_section_results(output_excel_path, terms, documents, columns_by_tag, section_counts):
+    with pd.ExcelWriter(output_excel_path) as writer:
+        for tag, columns in columns_by_tag.items():
+            rows = []
+            for column in columns:
+                document = documents[column]
+                for (section_id, title), counts in section_counts.get(document, {}).items():
+                    rows.append([document.replace('.txt', ''), section_id, title] + counts.tolist())
+            results_df = pd.DataFrame(rows, columns=['Document', 'Section', 'Title'] + terms)
+            results_df.to_excel(writer, sheet_name=tag, index=False)
+
+# Write the results of each tag to a separate sheet in the Excel document, failed files are left empty
+def write_results(output_excel_path, terms, documents, columns_by_tag, counts, failed):
+    with pd.ExcelWriter(output_excel_path) as writer:
+        for tag, columns in columns_by_tag.items():
+            names = [documents[column].replace('.txt', '') for column in columns]
+            results_df = pd.DataFrame(counts[:, columns], columns=names)
+            for column, name in zip(columns, names):
+                if failed[column]:
+                    results_df[name] = None
+            results_df.insert(0, 'Term', terms)
+            results_df.to_excel(writer, sheet_name=tag, index=False)
+
+if __name__ == '__main__':
+
+    # Load search terms and their aliases
+    with open(search_terms_path, 'r') as f:
+        search_terms = json.load(f)
+
+    # Select analysis
+    if analysis == 'ar6':
+        tags = ar6_tags
+        directory_path = ar6_directory_path
+        output_excel_path = ar6_output_excel_path
+        manifest_path = ar6_manifest_path
+        pages_path = ar6_pages_path
+        sections_path = ar6_sections_path
+    elif analysis == 'ars':
+        tags = ars_tags
+        directory_path = ars_directory_path
+        output_excel_path = ars_output_excel_path
+        manifest_path = ars_manifest_path
+        pages_path = ars_pages_path
+        sections_path = ars_sections_path
+
+    files_by_tag = group_files_by_tag(directory_path, tags)
+    documents, columns_by_tag = order_documents(files_by_tag)
+
+    # Search the canonical texts for the canonical aliases, the terms themselves are kept for display only
+    if canonical:
+        directory_path = update_canonical_cache(directory_path, documents)
+        search_terms = canonical_search_terms(search_terms)
+        manifest_path = manifest_path.replace('_manifest', '_canonical_manifest')
+
+    def count(documents, search_terms):
+        if use_index:
+            return count_documents_from_index(directory_path, documents, search_terms, not canonical)
+        # Compile search terms and aliases into a single automaton, each file is scanned once
+        return count_documents(directory_path, documents, TermMatcher(search_terms, not canonical), workers)
+
+    if incremental:
+        counts, failed, _ = update_counts(directory_path, documents, search_terms, manifest_path, count)
+    else:
+        counts, failed = count(documents, search_terms)
+
+    # Always written (cheap next to counting): the order of the terms and documents, or the mode of a previous run,
+    # may differ even if no count changed
+    write_results(output_excel_path, list(search_terms), documents, columns_by_tag, counts, failed)
+    logging.info(f'Results written to {output_excel_path}')
+
+    # Per-page and per-section counts, offsets are offsets in the original texts and not in the canonical texts
+    if (per_page or per_section) and canonical:
+        logging.warning('Per-page and per-section counts are not available in canonical mode')
+    else:
+        if per_page:
+            page_starts = {}
+            for file in documents:
+                page_starts[file] = load_page_starts(directory_path, file)
+                if page_starts[file] is None:
+                    logging.warning(f'No page offsets for file {file}')
+                    del page_starts[file]
+            page_counts = count_document_segments(directory_path, page_starts, TermMatcher(search_terms), workers)
+            np.savez_compressed(pages_path, terms=np.array(list(search_terms)), **page_counts)
+            logging.info(f'Per-page results written to {pages_path}')
+
+        if per_section:
+            segments = {}
+            titles = {}
+            for file in documents:
+                tree = load_section_tree(directory_path, file)
+                if tree is None:
+                    logging.warning(f'No section tree for file {file}')
+                    continue
+                segments[file] = section_segments(tree, section_depth)
+                titles[file] = {node['id']: node['title'] for node in iter_sections(tree)}
+            segment_counts = count_document_segments(directory_path, {file: starts for file, (starts, _) in segments.items()},
+                                                     TermMatcher(search_terms), workers)
+            # Sum the segments of each section (a section is split in several segments by its subsections)
+            section_counts = {}
+            for file, counts in segment_counts.items():
+                section_counts[file] = {}
+                for section_id, segment_count in zip(segments[file][1], counts.T):
+                    key = (section_id, titles[file][section_id])
+                    section_counts[file][key] = section_counts[file].get(key, 0) + segment_count
+            write_section_results(sections_path, list(search_terms), documents, columns_by_tag, section_counts)
+            logging.info(f'Per-section results written to {sections_path}')
+
+    # Log completion
+    logging.info('Search completed. Check the logs for any warnings or errors.')
@@ -0,0 +1,176 @@
+"""
+This module normalizes report texts and search term aliases into a canonical form, so that aliases
+covering typographic variants ("CO2"/"CO 2"/"CO₂", "water vapour"/"water vapor", "tempera-\\nture"...)
+are no longer needed and fewer patterns are matched.
+
+The canonical form is obtained as follows:
+1. Unicode compatibility normalization (NFKC), e.g. subscripts '₂' become '2' and ligatures 'ﬁ' become 'fi'.
+2. Line-break hyphenation left by the PDF extraction is removed ('tempera-\\nture' becomes 'temperature').
+3. Whitespace sequences (including line breaks) become a single space.
+4. Spaces inserted in chemical formulas by the PDF extraction are removed ('CO 2' becomes 'CO2'). Formulas are
+   only matched as written in upper case, so that prose such as 'No 2' or 'so 2' is left unchanged.
+5. Case is folded as for the case-insensitive search (see term_matcher.py).
+6. British spellings become American spellings ('vapour' becomes 'vapor', 'sulphur' becomes 'sulfur'), for
+   whole words and their plural.
+
+Canonical texts are cached once per report file in a 'canonical' folder of the reports directory,
+and are only recomputed when the report file or the normalizer version changes.
+
+Functions:
+- canonicalize(text): Return the canonical form of a text.
+- canonical_search_terms(search_terms): Return the search terms with canonical, deduplicated aliases.
+- redundant_aliases(search_terms): List the aliases that become redundant in canonical form.
+- update_canonical_cache(directory_path, files, cache_path=None): Write the canonical texts of report files.
+"""
+
+import os
+import re
+import sys
+import json
+import logging
+import unicodedata
+from term_matcher import fold_case
+from report_text import file_signature, read_text
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from blob_store import replace_file
+
+NORMALIZER_VERSION = 2
+
+# Chemical formulas whose digits are separated by a space after PDF extraction (e.g. 'CO 2', 'N 2O')
+CHEMICAL_FORMULAS = ['CO2', 'CH4', 'N2O', 'NO2', 'SO2', 'SF6', 'NH3', 'O3', 'O2', 'H2O']
+
+# British spellings (whole words, and their plural) and their American equivalent
+AMERICAN_SPELLINGS = {
+    'vapour': 'vapor',
+    'colour': 'color',
+    'sulphur': 'sulfur',
+    'sulphate': 'sulfate',
+    'modelling': 'modeling',
+    'modelled': 'modeled',
+    'behaviour': 'behavior',
+    'labour': 'labor',
+    'harbour': 'harbor',
+    'favour': 'favor',
+    'centre': 'center',
+    'metre': 'meter',
+    'litre': 'liter',
+    'programme': 'program',
+    'organisation': 'organization',
+    'urbanisation': 'urbanization',
+    'aerosolised': 'aerosolized',
+    'analyse': 'analyze',
+}
+
+HYPHENATION_REGEX = re.compile(r'(?<=\w)-[ \t]*\r?\n\s*(?=[^\W\d_])')
+WHITESPACE_REGEX = re.compile(r'\s+')
+SPELLING_REGEX = re.compile(r'\b(' + '|'.join(map(re.escape, AMERICAN_SPELLINGS)) + r')(s?)\b')
+
+def _formula_regex(formula):
+    # Allow one space before each digit run
+    parts = re.findall(r'\d+|\D+', formula)
+    body = ''.join((' ?' if part.isdigit() else '') + re.escape(part) for part in parts)
+    return r'(?<!\w)' + body + r'(?!\w)'
+
+FORMULA_REGEX = re.compile('|'.join(f'(?P<f{i}>{_formula_regex(formula)})' for i, formula in enumerate(CHEMICAL_FORMULAS)))
+
+def canonicalize(text):
+    """
+    Returns the canonical form of a text (see module docstring).
+
+    Args:
+        text (str): The text to normalize.
+
+    Returns:
+        str: The canonical text.
+    """
+    text = unicodedata.normalize('NFKC', text)
+    text = HYPHENATION_REGEX.sub('', text)
+    text = WHITESPACE_REGEX.sub(' ', text)
+    # Formulas are matched before case folding, in upper case only (case sensitive)
+    text = FORMULA_REGEX.sub(lambda match: CHEMICAL_FORMULAS[int(match.lastgroup[1:])], text)
+    text = fold_case(text)
+    text = SPELLING_REGEX.sub(lambda match: AMERICAN_SPELLINGS[match.group(1)] + match.group(2), text)
+    return text
+
+def canonical_search_terms(search_terms):
+    """
+    Returns the search terms with the canonical form of the term and its aliases, without redundant aliases.
+    The canonical form of the term is the first alias of each list, the terms (keys) are kept as they are
+    for display and must not be matched themselves (include_terms=False in TermMatcher and ReportIndex).
+
+    Args:
+        search_terms (dict): Search terms and their aliases.
+
+    Returns:
+        dict: The search terms (same keys) and their canonical aliases.
+    """
+    redundant = {(term, alias) for term, alias, _, _ in redundant_aliases(search_terms)}
+    return {term: [canonicalize(alias) for alias in [term] + aliases if (term, alias) not in redundant]
+            for term, aliases in search_terms.items()}
+
+def redundant_aliases(search_terms):
+    """
+    Lists the aliases that become redundant once texts and aliases are in canonical form: aliases with
+    the same canonical form as a previous alias of the term, which can be removed without changing the counts.
+    The term itself is never considered redundant. An alias containing another alias of the term is not
+    redundant: its matches overlap the matches of the other alias, but removing it changes the counts.
+
+    Args:
+        search_terms (dict): Search terms and their aliases.
+
+    Returns:
+        list: (term, alias, canonical form, same as alias) tuples.
+    """
+    redundant = []
+    for term, aliases in search_terms.items():
+        kept = {}
+        for alias in [term] + aliases:
+            canonical = canonicalize(alias)
+            if canonical in kept:
+                redundant.append((term, alias, canonical, kept[canonical]))
+            else:
+                kept[canonical] = alias
+    return redundant
+
+def default_cache_path(directory_path):
+    """Return the default location of the canonical texts of a reports directory."""
+    return os.path.join(directory_path, 'canonical')
+
+def update_canonical_cache(directory_path, files, cache_path=None):
+    """
+    Writes the canonical text of report files, skipping the files whose cached canonical text is up to date.
+    A sidecar (.json) records the size and modification time of the source file and the normalizer version.
+
+    Args:
+        directory_path (str): The directory containing the report txt files.
+        files (list): The txt files to normalize.
+        cache_path (str): The directory of the canonical texts (default: 'canonical' folder of directory_path).
+
+    Returns:
+        str: The directory of the canonical texts, containing files with the same names as the reports.
+    """
+    cache_path = cache_path or default_cache_path(directory_path)
+    os.makedirs(cache_path, exist_ok=True)
+    for file in files:
+        target_path = os.path.join(cache_path, file)
+        sidecar_path = target_path + '.json'
+        size, mtime_ns = file_signature(directory_path, file)
+        signature = {'size': size, 'mtime_ns': mtime_ns, 'version': NORMALIZER_VERSION}
+        if os.path.exists(target_path) and os.path.exists(sidecar_path):
+            with open(sidecar_path, 'r', encoding='utf-8') as f:
+                if json.load(f) == signature:
+                    continue
+        try:
+            text = read_text(directory_path, file)
+        except Exception as e:
+            logging.warning(f'Error normalizing file {file}: {e}')
+            for path in (target_path, sidecar_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            continue
+        logging.info(f'Normalizing file: {file}')
+        with replace_file(target_path, encoding='utf-8') as f:
+            f.write(canonicalize(text))
+        with replace_file(sidecar_path, encoding='utf-8') as f:
+            json.dump(signature, f)
+    return cache_path
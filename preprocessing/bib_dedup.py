@@ -0,0 +1,172 @@
+"""
+This module finds exact and near-duplicate entries in BibTeX databases in roughly linear time, so that it
+scales to the merged IPCC reference corpus (hundreds of thousands of entries).
+
+- Exact duplicates (entries with all fields identical, including ID and type) are found with a canonical
+  hash of each entry (SHA-1 of its sorted fields), in a single pass.
+- Near-duplicates are found by blocking: entries are grouped by normalized DOI, by normalized title, and by
+  first author surname and year. Entries with the same DOI or title are duplicates; entries of the same
+  author/year block are duplicates if their titles are similar (trigram Jaccard similarity above a threshold).
+  Only entries of the same block are compared, and blocks larger than max_block are not compared pairwise.
+- Duplicates are grouped into clusters with a union-find structure, each cluster recording the reasons
+  (exact, doi, title, author_year_title) linking its entries.
+
+Functions:
+- canonical_hash(entry): The canonical hash of an entry.
+- normalize_doi(doi): Normalize a DOI (lowercase, without resolver prefix).
+- unique_entries(entries): Remove exact duplicates, keeping the first occurrence.
+- find_duplicate_clusters(entries, title_threshold, max_block): Find the clusters of near-duplicates.
+- write_cluster_report(report_path, entries, clusters): Write the clusters to a csv file.
+
+Example usage:
+clusters = find_duplicate_clusters(bib_database.entries)
+write_cluster_report('./results/duplicate_clusters.csv', bib_database.entries, clusters)
+"""
+
+import re
+import csv
+import hashlib
+from collections import defaultdict
+from bib_index import normalize_text, trigrams, first_author_surname
+
+DOI_PREFIX_REGEX = re.compile(r'^(https?://(dx\.)?doi\.org/|doi:\s*)', re.IGNORECASE)
+
+def canonical_hash(entry):
+    """Return the canonical hash of an entry: equal for entries with all fields (including ID and type) identical."""
+    # Fields are separated with ASCII unit/record separators, which do not appear in BibTeX fields
+    canonical = '\x1e'.join(f'{key}\x1f{value}' for key, value in sorted(entry.items()))
+    return hashlib.sha1(canonical.encode('utf-8')).digest()
+
+def normalize_doi(doi):
+    """Normalize a DOI: lowercase, without resolver prefix or trailing punctuation. Return '' if not a DOI."""
+    doi = DOI_PREFIX_REGEX.sub('', str(doi).strip()).lower().rstrip('.,;')
+    return doi if doi.startswith('10.') else ''
+
+def unique_entries(entries):
+    """
+    Removes exact duplicates, keeping the first occurrence of each entry.
+
+    Returns:
+        tuple: The unique entries (list) and the number of duplicates removed.
+    """
+    seen = set()
+    unique = []
+    for entry in entries:
+        key = canonical_hash(entry)
+        if key not in seen:
+            seen.add(key)
+            unique.append(entry)
+    return unique, len(entries) - len(unique)
+
+class UnionFind:
+    """Union-find (disjoint sets) over the indices 0..n-1, with path compression and union by size."""
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, i, j):
+        i, j = self.find(i), self.find(j)
+        if i == j:
+            return
+        if self.size[i] < self.size[j]:
+            i, j = j, i
+        self.parent[j] = i
+        self.size[i] += self.size[j]
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+def find_duplicate_clusters(entries, title_threshold=0.9, max_block=500):
+    """
+    Finds the clusters of exact and near-duplicate entries.
+
+    Args:
+        entries (list): The BibTeX entries (dictionaries).
+        title_threshold (float): The minimum trigram Jaccard similarity of the titles of two entries of the
+            same first author and year to be near-duplicates.
+        max_block (int): The maximum size of an author/year block compared pairwise.
+
+    Returns:
+        list: The clusters (of at least two entries), as dictionaries with the indices of the entries
+        (in order) and the reasons linking them, sorted by first index.
+    """
+    union_find = UnionFind(len(entries))
+    links = [] # (i, j, reason) of each union
+
+    def link(i, j, reason):
+        links.append((i, j, reason))
+        union_find.union(i, j)
+
+    exact, dois, titles, author_years = {}, {}, {}, defaultdict(list)
+    normalized_titles = {}
+    for i, entry in enumerate(entries):
+        key = canonical_hash(entry)
+        if key in exact:
+            link(exact[key], i, 'exact')
+            continue
+        exact[key] = i
+        doi = normalize_doi(entry.get('doi', ''))
+        if doi:
+            if doi in dois:
+                link(dois[doi], i, 'doi')
+            else:
+                dois[doi] = i
+        title = normalize_text(entry.get('title', ''))
+        if len(title) >= 20:
+            if title in titles:
+                link(titles[title], i, 'title')
+            else:
+                titles[title] = i
+        surname = first_author_surname(entry.get('author', ''))
+        year = str(entry.get('year', '')).strip()
+        if surname and year and title:
+            author_years[(surname, year)].append(i)
+            normalized_titles[i] = title
+
+    for block in author_years.values():
+        if len(block) < 2 or len(block) > max_block:
+            continue
+        title_trigrams = {i: trigrams(normalized_titles[i]) for i in block}
+        for a in range(len(block)):
+            for b in range(a + 1, len(block)):
+                i, j = block[a], block[b]
+                if union_find.find(i) != union_find.find(j) and \
+                        jaccard(title_trigrams[i], title_trigrams[j]) >= title_threshold:
+                    link(i, j, 'author_year_title')
+
+    members = defaultdict(list)
+    for i in range(len(entries)):
+        members[union_find.find(i)].append(i)
+    reasons = defaultdict(set)
+    for i, j, reason in links:
+        reasons[union_find.find(i)].add(reason)
+    clusters = [{'indices': indices, 'reasons': sorted(reasons[root])}
+                for root, indices in members.items() if len(indices) > 1]
+    return sorted(clusters, key=lambda cluster: cluster['indices'][0])
+
+def write_cluster_report(report_path, entries, clusters):
+    """
+    Writes the duplicate clusters to a csv file, one row per entry of each cluster.
+
+    Args:
+        report_path (str): The path of the csv file.
+        entries (list): The BibTeX entries.
+        clusters (list): The clusters, as returned by find_duplicate_clusters.
+    """
+    with open(report_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Cluster', 'Reasons', 'Index', 'ID', 'DOI', 'Title', 'Author', 'Year'])
+        for cluster_id, cluster in enumerate(clusters, start=1):
+            for i in cluster['indices']:
+                entry = entries[i]
+                writer.writerow([cluster_id, ' '.join(cluster['reasons']), i, entry.get('ID', ''), entry.get('doi', ''),
+                                 entry.get('title', ''), entry.get('author', ''), entry.get('year', '')])
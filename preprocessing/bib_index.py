@@ -0,0 +1,169 @@
+"""
+This module provides a local fuzzy index over the entries of .bib files (e.g. the IPCC chapter references in
+data/references), to resolve free-text references (e.g. 'Nitta T (2017) Impact of Arctic wetlands...') without
+network access. get_references.py uses it before falling back to a Crossref query.
+
+The index is based on character trigrams of the normalized titles: an inverted index gives the entries sharing
+trigrams with a reference (using its rarest trigrams first), the candidates sharing the most trigrams are scored,
+and the best candidate is returned with a confidence score combining:
+- The containment of the title in the reference (fraction of the title trigrams found in the reference).
+- The presence of the first author surname in the reference.
+- The presence of the year in the reference.
+
+Classes:
+- BibIndex(entries): The fuzzy index.
+
+Functions:
+- normalize_text(text): Normalize a title or reference (lowercase ASCII words, LaTeX braces removed).
+- load_bib_entries(folder_path): Load the entries of all .bib files of a folder.
+
+Example usage:
+index = BibIndex(load_bib_entries('./data/references'))
+entry, confidence = index.match('Nitta T (2017) Impact of Arctic wetlands on the climate system...')
+"""
+
+import os
+import re
+import logging
+import unicodedata
+import sys
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import bib_stream
+
+NON_ALPHANUMERIC_REGEX = re.compile(r'[^a-z0-9]+')
+
+MIN_TITLE_TRIGRAMS = 12 # Shorter titles are too ambiguous to be matched
+MAX_POSTINGS = 200000 # Maximum number of postings read to find the candidates of a reference (rarest trigrams first)
+MIN_QUERY_TRIGRAMS = 5 # Minimum number of trigrams used to find the candidates of a reference
+N_CANDIDATES = 10
+
+def normalize_text(text):
+    """Normalize a title or reference: ASCII lowercase words separated by single spaces, LaTeX commands removed."""
+    text = re.sub(r'\\[a-zA-Z]+\s*', ' ', str(text))
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+    return NON_ALPHANUMERIC_REGEX.sub(' ', text).strip()
+
+def trigrams(normalized_text):
+    """Return the set of character trigrams of a normalized text (padded with spaces)."""
+    padded = f' {normalized_text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def first_author_surname(authors):
+    """Return the normalized surname of the first author of a BibTeX author field ('Last, First and ...')."""
+    first_author = str(authors).split(' and ')[0].strip()
+    if not first_author:
+        return ''
+    surname = first_author.split(',')[0] if ',' in first_author else first_author.split()[-1]
+    return normalize_text(surname)
+
+def load_bib_entries(folder_path):
+    """
+    Loads the entries of all .bib files of a folder (in sorted file order).
+
+    Args:
+        folder_path (str): The folder containing the .bib files.
+
+    Returns:
+        list: The BibTeX entries (dictionaries).
+    """
+    entries = []
+    for file in sorted(f for f in os.listdir(folder_path) if f.endswith('.bib')):
+        with open(os.path.join(folder_path, file), 'r', encoding='utf-8') as bibtex_file:
+            entries.extend(bib_stream.load(bibtex_file, decode=True).entries)
+    logging.info(f'Loaded {len(entries)} entries from {folder_path}')
+    return entries
+
+class BibIndex:
+    """
+    Trigram index over the titles of BibTeX entries, matching free-text references.
+
+    Args:
+        entries (list): The BibTeX entries (dictionaries with at least a title field).
+    """
+
+    def __init__(self, entries):
+        self.entries = []
+        self.title_trigrams = []
+        self.surnames = []
+        self.years = []
+        postings = {}
+        for entry in entries:
+            title_trigrams = trigrams(normalize_text(entry.get('title', '')))
+            if len(title_trigrams) < MIN_TITLE_TRIGRAMS:
+                continue
+            entry_id = len(self.entries)
+            self.entries.append(entry)
+            self.title_trigrams.append(title_trigrams)
+            self.surnames.append(first_author_surname(entry.get('author', '')))
+            self.years.append(str(entry.get('year', '')).strip())
+            for trigram in title_trigrams:
+                postings.setdefault(trigram, []).append(entry_id)
+        self.postings = {trigram: np.array(ids, dtype=np.int32) for trigram, ids in postings.items()}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def candidates(self, reference_trigrams):
+        """Return the ids of the entries sharing the most trigrams with a reference, among its rarest trigrams."""
+        lists = sorted((self.postings[trigram] for trigram in reference_trigrams if trigram in self.postings), key=len)
+        if not lists:
+            return []
+        total = 0
+        for n_lists, postings in enumerate(lists):
+            total += len(postings)
+            if total > MAX_POSTINGS and n_lists >= MIN_QUERY_TRIGRAMS:
+                lists = lists[:n_lists]
+                break
+        counts = np.bincount(np.concatenate(lists), minlength=len(self.entries))
+        n = min(N_CANDIDATES, np.count_nonzero(counts))
+        best = np.argpartition(-counts, n - 1)[:n]
+        return best[np.argsort(-counts[best], kind='stable')].tolist()
+
+    def score(self, entry_id, reference_trigrams, reference_words):
+        """
+        Return the confidence (0 to 1) that a reference cites an entry, and the number of title trigrams
+        found in the reference (to prefer the longest title between entries with the same confidence).
+        """
+        title_trigrams = self.title_trigrams[entry_id]
+        shared = len(title_trigrams & reference_trigrams)
+        author = bool(self.surnames[entry_id]) and set(self.surnames[entry_id].split()) <= reference_words
+        year = bool(self.years[entry_id]) and self.years[entry_id] in reference_words
+        return shared / len(title_trigrams) * (0.8 + 0.1 * author + 0.1 * year), shared
+
+    def match(self, reference):
+        """
+        Finds the entry best matching a free-text reference.
+
+        Args:
+            reference (str): The reference (authors, year, title, journal...).
+
+        Returns:
+            tuple: The best entry (or None) and its confidence score (0 to 1).
+        """
+        normalized = normalize_text(reference)
+        reference_trigrams = trigrams(normalized)
+        reference_words = set(normalized.split())
+        best_entry, best_score = None, (0.0, 0)
+        for entry_id in self.candidates(reference_trigrams):
+            score = self.score(entry_id, reference_trigrams, reference_words)
+            if score > best_score:
+                best_entry, best_score = self.entries[entry_id], score
+        return best_entry, round(best_score[0], 3)
+
+    def match_many(self, references, min_confidence=0.0):
+        """
+        Matches references in bulk.
+
+        Args:
+            references (list): The free-text references.
+            min_confidence (float): The minimum confidence of a match.
+
+        Returns:
+            list: (entry, confidence) for each reference, or None if there is no match above min_confidence.
+        """
+        matches = []
+        for reference in references:
+            entry, confidence = self.match(reference)
+            matches.append((entry, confidence) if entry is not None and confidence >= min_confidence else None)
+        return matches
@@ -0,0 +1,226 @@
+"""
+This module provides an asyncio client for the Crossref REST API (api.crossref.org), used by get_references.py
+to resolve many references concurrently while staying polite with the API:
+- The blocking requests are run in a dedicated thread pool (one thread per request in flight), each thread with
+  its own requests.Session (sessions are not thread-safe), so that connections are kept alive and reused.
+- A concurrency limit (number of requests in flight).
+- A token-bucket rate limiter (requests per second, with a burst size).
+- Webpages (publisher landing pages) have their own concurrency limit and are not rate limited, as they are
+  not sent to Crossref. They can be streamed and processed while downloaded (see doi_extraction.py).
+- Retries with exponential backoff on connection errors, 429 and 5xx responses, honouring Retry-After.
+
+The base URL is configurable, so that the client can be run against a local stub server mimicking
+the /works endpoints (see crossref_stub.py).
+
+Classes:
+- TokenBucket(rate, burst): Asyncio token-bucket rate limiter.
+- CrossrefClient(base_url, concurrency, rate, ...): Asyncio Crossref client.
+
+Example usage:
+async def main():
+    async with CrossrefClient(concurrency=8, rate=10) as client:
+        work = await client.work('10.1038/nature11377')
+asyncio.run(main())
+"""
+
+import time
+import random
+import asyncio
+import functools
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'DNT': '1',  # Do Not Track Request Header
+    'Connection': 'keep-alive'
+}
+
+QUERY_FIELDS = 'title,DOI,published,author,container-title,volume,page,issue,type'
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: at most burst requests at once, then rate requests per second on average.
+
+    Args:
+        rate (float): The number of tokens added per second.
+        burst (int): The maximum number of tokens.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def retry_after_seconds(response):
+    """Return the delay requested by the Retry-After header of a response (seconds or HTTP date), or None."""
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class CrossrefClient:
+    """
+    Asyncio client for the Crossref REST API, the blocking requests being run in a dedicated thread pool.
+
+    Args:
+        base_url (str): The base URL of the API (default: https://api.crossref.org).
+        concurrency (int): The maximum number of API requests in flight.
+        page_concurrency (int): The maximum number of webpage requests in flight.
+        rate (float): The maximum number of requests per second (None for no limit).
+        burst (int): The number of requests that can be sent at once before the rate applies.
+        max_retries (int): The number of retries on connection errors, 429 and 5xx responses.
+        backoff (float): The delay before the first retry (seconds), doubled at each retry.
+        max_backoff (float): The maximum delay between two retries (seconds).
+        timeout (float): The timeout of each request (seconds).
+        headers (dict): The headers of the requests.
+        mailto (str): Contact email sent to Crossref to use the polite pool (recommended).
+    """
+
+    def __init__(self, base_url='https://api.crossref.org', concurrency=8, rate=10, burst=None, max_retries=5,
+                 backoff=1.0, max_backoff=60.0, timeout=30, headers=None, mailto=None, page_concurrency=16):
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.page_concurrency = page_concurrency
+        self.bucket = TokenBucket(rate, burst or concurrency) if rate else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.mailto = mailto
+        self.headers = headers or DEFAULT_HEADERS
+        # Enough threads for all the requests allowed in flight, so that API requests never wait for webpages
+        self.executor = ThreadPoolExecutor(max_workers=concurrency + page_concurrency, thread_name_prefix='crossref')
+        self._local = threading.local()
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
+        self._semaphores = None
+        self.request_count = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        with self._sessions_lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions.clear()
+
+    @property
+    def session(self):
+        """The requests.Session of the current thread (created on first use)."""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.headers)
+            self._local.session = session
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
+
+    def _request(self, url, params, process):
+        """Blocking request (run in the thread pool). The response is streamed to process, if any, once successful."""
+        response = self.session.get(url, params=params, timeout=self.timeout, stream=process is not None)
+        if process is None or response.status_code in RETRY_STATUSES or not response.ok:
+            if process is not None:
+                response.close()
+            return response, None
+        return response, process(response)
+
+    async def get(self, url, params=None, process=None, api=True):
+        """
+        Sends a GET request, retrying on connection errors, 429 and 5xx responses.
+
+        Args:
+            url (str): The URL.
+            params (dict): The query parameters.
+            process (function): A function of the successful response, called in the request thread with the
+                response streamed (stream=True), e.g. to stop reading a large body early.
+            api (bool): True for a Crossref API request (rate limited), False for a webpage.
+
+        Returns:
+            requests.Response: The response (successful), or the result of process if given.
+
+        Raises:
+            requests.RequestException: If the request still fails after the retries, or fails with another status.
+        """
+        if self._semaphores is None:
+            self._semaphores = {True: asyncio.Semaphore(self.concurrency), False: asyncio.Semaphore(self.page_concurrency)}
+        for attempt in range(self.max_retries + 1):
+            delay = min(self.max_backoff, self.backoff * 2 ** attempt) * (0.5 + random.random() / 2)
+            async with self._semaphores[api]:
+                if api and self.bucket is not None:
+                    await self.bucket.acquire()
+                self.request_count += 1
+                try:
+                    response, result = await asyncio.get_running_loop().run_in_executor(
+                        self.executor, functools.partial(self._request, url, params, process))
+                except (requests.ConnectionError, requests.Timeout):
+                    if attempt == self.max_retries:
+                        raise
+                    response = None
+            if response is not None:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    response.raise_for_status()
+                    return result if process is not None else response
+                retry_after = retry_after_seconds(response)
+                if retry_after is not None:
+                    delay = min(self.max_backoff, retry_after)
+            # Wait outside of the semaphore, so that other requests can be sent meanwhile
+            await asyncio.sleep(delay)
+
+    def _params(self, params=None):
+        params = dict(params or {})
+        if self.mailto:
+            params['mailto'] = self.mailto
+        return params or None
+
+    async def work(self, doi):
+        """Return the Crossref metadata ('message') of a DOI."""
+        response = await self.get(f'{self.base_url}/works/{doi}', self._params())
+        return response.json()['message']
+
+    async def query(self, text, rows=1, select=QUERY_FIELDS):
+        """Return the Crossref items ('message' 'items') best matching a free-text reference."""
+        response = await self.get(f'{self.base_url}/works', self._params({'query': text, 'select': select, 'rows': rows}))
+        return response.json()['message']['items']
+
+    async def page(self, url, process=None):
+        """
+        Return the response of a webpage (e.g. a publisher landing page), with the same retries, or the result
+        of process on the streamed response (see get).
+        """
+        return await self.get(url, process=process, api=False)
@@ -0,0 +1,246 @@
+"""
+This script builds a local store of Crossref works from a JSON-lines dump (one work per line, as the 'message'
+of /works/<doi>, optionally gzipped), and provides an offline backend for get_references.py with the same
+interface as CrossrefClient (see crossref_client.py).
+
+The store is a SQLite database with:
+- A works table keyed on the lowercase DOI, each work being stored as zlib-compressed JSON.
+- A secondary index from the 64-bit hash of the normalized title (see bib_index.normalize_text) to the DOI.
+
+The dump is streamed and inserted in batches, so building the store runs in bounded memory whatever the
+size of the dump. Each (title hash, DOI) pair is indexed once, and a work loaded again (from a newer dump)
+replaces its previous version and title in the index. DOI lookups are primary key
+lookups (well under a millisecond). Free-text queries are resolved with the title index, by looking up the
+hashes of all the word spans of the query (the longest span matching a title wins), so that a reference
+containing the exact title of a work (e.g. 'Nitta T (2017) Impact of Arctic wetlands... Nature 12') is found.
+
+Classes:
+- CrossrefStore(store_path): The store, usable as an offline CrossrefClient.
+
+Functions:
+- build_store(dump_paths, store_path, batch_size): Build (or update) a store from JSON-lines dumps.
+
+Usage:
+python ./preprocessing/crossref_store.py build dump.jsonl.gz [dump2.jsonl ...] [--store ./data/cci/crossref_store.sqlite]
+python ./preprocessing/crossref_store.py lookup 10.1038/nature11377
+python ./preprocessing/crossref_store.py query "Nitta T (2017) Impact of Arctic wetlands..."
+"""
+
+import os
+import gzip
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+import argparse
+from bib_index import normalize_text
+
+DEFAULT_STORE_PATH = './data/cci/crossref_store.sqlite'
+
+MIN_SPAN_WORDS = 3 # Shortest word span of a query looked up in the title index
+MAX_SPAN_WORDS = 60 # Longest word span of a query looked up in the title index
+
+def title_hash(normalized_title):
+    """Return the signed 64-bit hash of a normalized title."""
+    return int.from_bytes(hashlib.blake2b(normalized_title.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+def work_title(work):
+    """Return the normalized title of a Crossref work."""
+    return normalize_text(' '.join(work.get('title') or []))
+
+def iter_dump(dump_path):
+    """Iterate over the works of a JSON-lines dump (gzipped if its name ends with .gz)."""
+    opener = gzip.open if dump_path.endswith('.gz') else open
+    with opener(dump_path, 'rt', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                work = json.loads(line)
+            except ValueError:
+                logging.warning(f'{dump_path}:{line_number}: invalid JSON line skipped')
+                continue
+            work = work.get('message', work)
+            if work.get('DOI'):
+                yield work
+
+def create_tables(connection):
+    connection.execute('CREATE TABLE IF NOT EXISTS works (doi TEXT PRIMARY KEY, data BLOB NOT NULL) WITHOUT ROWID')
+    # The index of the UNIQUE constraint also serves the lookups by title hash
+    connection.execute('CREATE TABLE IF NOT EXISTS titles (title_hash INTEGER NOT NULL, doi TEXT NOT NULL, UNIQUE (title_hash, doi))')
+
+def build_store(dump_paths, store_path=DEFAULT_STORE_PATH, batch_size=10000):
+    """
+    Builds (or updates) a store from JSON-lines dumps, streaming the works in batches.
+    A work already in the store (or repeated in the dumps) is replaced, and its old title removed from the index.
+
+    Args:
+        dump_paths (list): The paths of the dumps.
+        store_path (str): The path of the store.
+        batch_size (int): The number of works inserted per batch.
+
+    Returns:
+        int: The number of works loaded.
+    """
+    if os.path.dirname(store_path):
+        os.makedirs(os.path.dirname(store_path), exist_ok=True)
+    connection = sqlite3.connect(store_path)
+    # A build (or update) interrupted between two batches leaves a consistent store with the batches committed
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    create_tables(connection)
+
+    start_time = time.time()
+    count = 0
+    works = {} # DOI -> (compressed work, title hash or None), the last occurrence of a DOI in a batch wins
+
+    def flush():
+        dois = list(works)
+        old_titles = []
+        for i in range(0, len(dois), 500):
+            chunk = dois[i:i + 500]
+            for doi, data in connection.execute(
+                f"SELECT doi, data FROM works WHERE doi IN ({','.join('?' * len(chunk))})", chunk
+            ):
+                old_title = work_title(json.loads(zlib.decompress(data)))
+                if old_title and title_hash(old_title) != works[doi][1]:
+                    old_titles.append((title_hash(old_title), doi))
+        connection.executemany('DELETE FROM titles WHERE title_hash = ? AND doi = ?', old_titles)
+        connection.executemany('INSERT OR REPLACE INTO works (doi, data) VALUES (?, ?)',
+                               ((doi, data) for doi, (data, _) in works.items()))
+        connection.executemany('INSERT OR IGNORE INTO titles (title_hash, doi) VALUES (?, ?)',
+                               ((hash_value, doi) for doi, (_, hash_value) in works.items() if hash_value is not None))
+        connection.commit()
+        works.clear()
+
+    for dump_path in dump_paths:
+        logging.info(f'Loading {dump_path}')
+        for work in iter_dump(dump_path):
+            doi = work['DOI'].lower()
+            title = work_title(work)
+            if doi in works:
+                flush() # The work replaces a work of the same batch
+            works[doi] = (zlib.compress(json.dumps(work, separators=(',', ':')).encode('utf-8')),
+                          title_hash(title) if title else None)
+            count += 1
+            if len(works) >= batch_size:
+                flush()
+                logging.info(f'{count} works loaded ({time.time() - start_time:.0f} s)')
+    flush()
+
+    connection.execute('VACUUM')
+    # Back to a rollback journal, so that the store can be opened read-only without its WAL files
+    connection.execute('PRAGMA journal_mode=DELETE')
+    connection.close()
+    logging.info(f'{count} works loaded in {store_path} ({time.time() - start_time:.0f} s)')
+    return count
+
+class CrossrefStore:
+    """
+    Local store of Crossref works, with the lookups of CrossrefClient (work, query, page) run offline.
+    Missing works raise LookupError (instead of requests.HTTPError 404 for the API).
+
+    Args:
+        store_path (str): The path of the store (built with build_store).
+    """
+
+    def __init__(self, store_path=DEFAULT_STORE_PATH):
+        if not os.path.exists(store_path):
+            raise FileNotFoundError(f'No Crossref store at {store_path}, build it with crossref_store.py build')
+        self.connection = sqlite3.connect(f'file:{store_path}?mode=ro', uri=True)
+        self.request_count = 0 # No network requests
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def get_work(self, doi):
+        """Return the Crossref work of a DOI, or None."""
+        row = self.connection.execute('SELECT data FROM works WHERE doi = ?', (str(doi).strip().lower(),)).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row is not None else None
+
+    def find_titles(self, text, rows=1):
+        """
+        Return the works whose normalized title is a word span of a free-text query, longest titles first.
+
+        Args:
+            text (str): The query (e.g. a reference).
+            rows (int): The maximum number of works.
+        """
+        words = normalize_text(text).split()
+        spans = {}
+        for length in range(min(len(words), MAX_SPAN_WORDS), MIN_SPAN_WORDS - 1, -1):
+            for start in range(len(words) - length + 1):
+                span = ' '.join(words[start:start + length])
+                spans.setdefault(title_hash(span), span)
+        hashes = list(spans)
+        candidates = []
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i:i + 500]
+            candidates += self.connection.execute(
+                f"SELECT title_hash, doi FROM titles WHERE title_hash IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+        works = []
+        seen = set()
+        for hash_value, doi in sorted(candidates, key=lambda candidate: -len(spans[candidate[0]])):
+            work = self.get_work(doi) if doi not in seen else None
+            seen.add(doi)
+            # Check the title, in case of a hash collision
+            if work is not None and work_title(work) == spans[hash_value]:
+                works.append(work)
+                if len(works) == rows:
+                    break
+        return works
+
+    async def work(self, doi):
+        """Return the Crossref work ('message') of a DOI, like CrossrefClient.work."""
+        work = self.get_work(doi)
+        if work is None:
+            raise LookupError(f'{doi} not found in the Crossref store')
+        return work
+
+    async def query(self, text, rows=1, select=None):
+        """Return the Crossref items matching a free-text reference, like CrossrefClient.query (select is ignored)."""
+        return self.find_titles(text, rows)
+
+    async def page(self, url, process=None):
+        raise LookupError(f'Webpages are not available offline ({url})')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Local store of Crossref works built from a JSON-lines dump.')
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help='Path of the SQLite store')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='Load JSON-lines dumps (.jsonl or .jsonl.gz) into the store')
+    build_parser.add_argument('dumps', nargs='+')
+    build_parser.add_argument('--batch-size', type=int, default=10000)
+    lookup_parser = subparsers.add_parser('lookup', help='Show the work of a DOI')
+    lookup_parser.add_argument('doi')
+    query_parser = subparsers.add_parser('query', help='Show the works whose title is found in a free-text query')
+    query_parser.add_argument('text')
+    query_parser.add_argument('--rows', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_store(args.dumps, args.store, args.batch_size)
+    else:
+        store = CrossrefStore(args.store)
+        start_time = time.perf_counter()
+        if args.command == 'lookup':
+            works = [work for work in [store.get_work(args.doi)] if work is not None]
+        else:
+            works = store.find_titles(args.text, args.rows)
+        elapsed = (time.perf_counter() - start_time) * 1000
+        for work in works:
+            print(json.dumps(work, indent=2, ensure_ascii=False))
+        print(f'{len(works)} works found in {elapsed:.2f} ms')
+        store.close()
@@ -0,0 +1,128 @@
+"""
+This script runs a local stub HTTP server mimicking the Crossref /works endpoints, so that get_references.py
+and crossref_client.py can be run offline and reproducibly (set crossref_base_url to the stub URL).
+
+Endpoints:
+- GET /works/<doi>                   {"status": "ok", "message": <work>}, or 404 if the DOI is unknown
+- GET /works?query=<text>&rows=<n>   {"status": "ok", "message": {"items": [<works sharing the most words with the query>]}}
+- GET /pages/<name>                  A webpage (e.g. a publisher landing page containing a DOI)
+
+Transient failures can be injected: a fraction of the requests (fail_rate) get a 429 or 503 response
+with a Retry-After header, to check that the client backs off and retries.
+
+Usage:
+python ./preprocessing/crossref_stub.py works.json [--pages pages.json] [--port 8000] [--fail-rate 0.1]
+where works.json is a list of Crossref works ('message' of /works/<doi>) and pages.json a dictionary {name: html}.
+"""
+
+import re
+import json
+import random
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORD_REGEX = re.compile(r'\w+')
+
+def words(text):
+    return set(WORD_REGEX.findall(str(text).lower()))
+
+def make_server(works, pages=None, host='127.0.0.1', port=0, fail_rate=0.0, seed=0):
+    """
+    Creates the stub server (not started).
+
+    Args:
+        works (list): The Crossref works served by the stub.
+        pages (dict): The webpages served under /pages/, {name: html}.
+        host (str): The host of the server.
+        port (int): The port of the server (0 for a free port).
+        fail_rate (float): The fraction of requests answered with a transient error (429 or 503).
+        seed (int): The seed of the failure injection.
+
+    Returns:
+        ThreadingHTTPServer: The server, with a url attribute and a requests counter.
+    """
+    works_by_doi = {work['DOI'].lower(): work for work in works}
+    works_words = [(words(' '.join(work.get('title', []))), work) for work in works]
+    pages = pages or {}
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, data, headers=None):
+            body = json.dumps(data).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            with lock:
+                server.requests += 1
+                fail = rng.random() < fail_rate
+            if fail:
+                self.send_json(rng.choice([429, 503]), {'status': 'failed'}, {'Retry-After': '0'})
+                return
+
+            url = urlsplit(self.path)
+            path = unquote(url.path)
+            params = parse_qs(url.query)
+            if path.startswith('/works/'):
+                work = works_by_doi.get(path[len('/works/'):].lower())
+                if work is None:
+                    self.send_json(404, {'status': 'error', 'message': 'Resource not found.'})
+                else:
+                    self.send_json(200, {'status': 'ok', 'message-type': 'work', 'message': work})
+            elif path == '/works':
+                query = words(params.get('query', [''])[0])
+                rows = int(params.get('rows', ['20'])[0])
+                ranked = sorted(works_words, key=lambda item: -len(item[0] & query))
+                items = [work for _, work in ranked[:rows]]
+                self.send_json(200, {'status': 'ok', 'message-type': 'work-list', 'message': {'items': items}})
+            elif path.startswith('/pages/') and path[len('/pages/'):] in pages:
+                body = pages[path[len('/pages/'):]].encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self.send_json(404, {'status': 'error', 'message': 'Resource not found.'})
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.requests = 0
+    server.url = f'http://{host}:{server.server_address[1]}'
+    return server
+
+def serve_in_thread(*args, **kwargs):
+    """Start the stub server in a background thread and return it (stop it with server.shutdown())."""
+    server = make_server(*args, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stub of the Crossref /works endpoints.')
+    parser.add_argument('works', help='JSON file with a list of Crossref works')
+    parser.add_argument('--pages', help='JSON file with a dictionary {name: html} of webpages')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    with open(args.works, 'r', encoding='utf-8') as f:
+        works = json.load(f)
+    pages = None
+    if args.pages:
+        with open(args.pages, 'r', encoding='utf-8') as f:
+            pages = json.load(f)
+
+    server = make_server(works, pages, port=args.port, fail_rate=args.fail_rate)
+    print(f"Crossref stub serving {len(works)} works on {server.url}")
+    server.serve_forever()
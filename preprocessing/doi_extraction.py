@@ -0,0 +1,165 @@
+"""
+This module extracts the DOI of a publication from its landing page while the page is downloaded, so that
+get_references.py does not download and scan whole webpages.
+
+The page is scanned incrementally, chunk by chunk:
+- The meta tags giving the DOI of the page (citation_doi, dc.identifier, prism.doi...) are checked first:
+  as they are in the head of the page, the download stops as soon as one is found.
+- Otherwise, the first DOI found in the text of the page is used, as soon as the head of the page has been
+  read (a meta tag can no longer be found).
+- The download stops after max_bytes bytes in any case.
+
+The extraction is a pure function of the byte chunks of the page (extract_doi_from_chunks), so that it can
+be checked against local HTML fixtures.
+
+Classes:
+- DoiScanner(max_bytes): Incremental DOI scanner.
+
+Functions:
+- extract_doi_from_chunks(chunks, max_bytes): Extract the DOI of a page from its byte chunks.
+- scan_response(response, max_bytes, chunk_size): Extract the DOI of a streamed requests.Response.
+
+Usage (on HTML fixtures):
+python ./preprocessing/doi_extraction.py page1.html [page2.html ...]
+"""
+
+import re
+import sys
+
+DOI_REGEX = re.compile(r'10\.\d{4,9}/[-._;()/:A-Za-z0-9]+')
+META_REGEX = re.compile(r'<meta\s[^>]*>', re.IGNORECASE)
+ATTRIBUTE_REGEX = re.compile(r'([\w.:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))')
+HEAD_END_REGEX = re.compile(r'</head\s*>|<body[\s>]', re.IGNORECASE)
+
+DOI_META_NAMES = {'citation_doi', 'dc.identifier', 'dc.identifier.doi', 'prism.doi', 'bepress_citation_doi', 'doi'}
+
+MAX_PAGE_BYTES = 512 * 1024
+OVERLAP = 512 # Characters kept between chunks, so that a tag or DOI split between two chunks is found
+
+def clean_doi(doi):
+    """Remove the trailing punctuation and fulltext suffixes of a DOI found in a page."""
+    doi = re.sub(r'(full|fulltext\.html)$', '', doi)
+    return re.sub(r'[^\w\d]+$', '', doi)
+
+def meta_doi(tag):
+    """Return the DOI of a meta tag giving the DOI of the page, or None."""
+    attributes = {name.lower(): double or single or bare for name, double, single, bare in ATTRIBUTE_REGEX.findall(tag)}
+    name = (attributes.get('name') or attributes.get('property') or '').lower()
+    if name not in DOI_META_NAMES:
+        return None
+    match = DOI_REGEX.search(attributes.get('content', ''))
+    return clean_doi(match.group(0)) if match else None
+
+class DoiScanner:
+    """
+    Incremental DOI scanner over the byte chunks of a page (see the module docstring for the rules).
+
+    Args:
+        max_bytes (int): The maximum number of bytes scanned.
+
+    Attributes:
+        doi (str): The DOI found (None until done, or if there is no DOI).
+        source (str): Where the DOI was found: 'meta' or 'text'.
+        bytes_read (int): The number of bytes scanned.
+        done (bool): True once the DOI is known (no more chunks are needed).
+    """
+
+    def __init__(self, max_bytes=MAX_PAGE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+        self.buffer = ''
+        self.head_done = False
+        self.text_doi = None
+        self.doi = None
+        self.source = None
+        self.done = False
+
+    def feed(self, chunk):
+        """Scans a chunk (bytes), return True once the DOI is known."""
+        if self.done:
+            return True
+        chunk = chunk[:self.max_bytes - self.bytes_read]
+        self.bytes_read += len(chunk)
+        # Latin-1 maps each byte to a character: DOIs and tags are ASCII, whatever the encoding of the page
+        self.buffer += chunk.decode('latin-1')
+        self._scan(final=self.bytes_read >= self.max_bytes)
+        return self.done
+
+    def close(self):
+        """Scans the end of the page, return the DOI (or None)."""
+        if not self.done:
+            self._scan(final=True)
+        return self.doi
+
+    def _scan(self, final):
+        buffer = self.buffer
+        # Keep the beginning of a tag not complete yet
+        keep_from = len(buffer)
+        if not self.head_done:
+            for match in META_REGEX.finditer(buffer):
+                doi = meta_doi(match.group(0))
+                if doi:
+                    self._finish(doi, 'meta')
+                    return
+            end = HEAD_END_REGEX.search(buffer)
+            if end:
+                self.head_done = True
+            else:
+                open_tag = buffer.rfind('<')
+                if open_tag != -1 and buffer.find('>', open_tag) == -1:
+                    keep_from = open_tag
+        if self.text_doi is None:
+            for match in DOI_REGEX.finditer(buffer):
+                if match.end() == len(buffer) and not final:
+                    # The DOI may continue in the next chunk
+                    keep_from = min(keep_from, match.start())
+                    break
+                self.text_doi = clean_doi(match.group(0))
+                break
+        if final:
+            self._finish(self.text_doi, 'text' if self.text_doi else None)
+        elif self.text_doi is not None and self.head_done:
+            self._finish(self.text_doi, 'text')
+        else:
+            self.buffer = buffer[min(keep_from, max(0, len(buffer) - OVERLAP)):]
+
+    def _finish(self, doi, source):
+        self.doi = doi
+        self.source = source
+        self.done = True
+        self.buffer = ''
+
+def extract_doi_from_chunks(chunks, max_bytes=MAX_PAGE_BYTES):
+    """
+    Extracts the DOI of a page from its byte chunks, reading the chunks only until the DOI is known.
+
+    Args:
+        chunks (iterable): The byte chunks of the page.
+        max_bytes (int): The maximum number of bytes scanned.
+
+    Returns:
+        tuple: The DOI (or None), its source ('meta', 'text' or None) and the number of bytes scanned.
+    """
+    scanner = DoiScanner(max_bytes)
+    for chunk in chunks:
+        if scanner.feed(chunk):
+            break
+    scanner.close()
+    return scanner.doi, scanner.source, scanner.bytes_read
+
+def scan_response(response, max_bytes=MAX_PAGE_BYTES, chunk_size=16384):
+    """
+    Extracts the DOI of a streamed requests.Response (requested with stream=True), closing the connection
+    as soon as the DOI is known. Returns the same tuple as extract_doi_from_chunks.
+    """
+    try:
+        return extract_doi_from_chunks(response.iter_content(chunk_size), max_bytes)
+    finally:
+        response.close()
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        with open(path, 'rb') as f:
+            doi, source, bytes_read = extract_doi_from_chunks(iter(lambda: f.read(16384), b''))
+        print(f'{path}: {doi} ({source}, {bytes_read} bytes read)')
@@ -1,89 +1,265 @@
 # Automatic download of AR6 and AR5 WG1,2,3 chapters (.pdf), AR4 WG2,3 chapters and AR6 references (.bib)
 # Manual download is prefered for WG1,2,3 SPMs, TSs (and WG1 Atlas for AR6, referenced as chapter 13)
 # Manual download is prefered for SYR and SR chapters, SPMs and TSs since url naming is not consistent
+#
+# The files to download are listed in a manifest (built for the assessment cycles of interest, or read from a
+# JSON file). They are downloaded in parallel over a pooled session, streamed to a .part file in chunks and
+# renamed once complete. An interrupted download is resumed with an HTTP Range request, and the ETag and
+# Last-Modified headers of the downloaded files are kept in a state file, so that a re-sync only transfers
+# the files that changed on the server (conditional requests answered with 304 Not Modified).
+# The server can be changed with base_url (e.g. a local mirror or test server).
+# With blob_store_root, the downloaded files are stored in a content-addressable store (see utils/blob_store.py):
+# identical files are stored once, and a file deleted locally but still stored is restored without download.
 
-import requests
 import os
+import json
+import time
+import sys
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from blob_store import BlobStore
+
+# ARs of interest
+cycles = [4, 5, 6]
+
+base_url = 'https://www.ipcc.ch'
+download_folder = 'data'
+manifest_file = None # JSON list of {"url": ..., "path": ...} to download instead of the built-in manifest
+state_file = os.path.join(download_folder, 'download_state.json')
+workers = 8
+chunk_size = 1024 * 1024
+max_attempts = 3 # Attempts per file, an interrupted download being resumed at the next attempt
+blob_store_root = None # Content-addressable store of the downloaded files (e.g. './data/blobs'), None to disable
+
+def build_manifest(cycles, base_url='https://www.ipcc.ch', download_folder='data'):
+    """
+    Builds the list of files to download for the given assessment cycles.
+
+    Args:
+        cycles (list): The assessment cycles (4, 5 and/or 6).
+        base_url (str): The base URL of the IPCC website.
+        download_folder (str): The data folder.
+
+    Returns:
+        list: The files to download, as dictionaries with url, path, cycle, wg, chapter and kind ('pdf' or 'bib') keys.
+    """
+    manifest = []
+
+    def add(url, path, cycle, wg, chapter, kind):
+        manifest.append({'url': base_url + url, 'path': os.path.join(download_folder, path),
+                         'cycle': cycle, 'wg': wg, 'chapter': chapter, 'kind': kind})
+
+    if 6 in cycles:
+        for i in range(1, 4):
+            # Set the range for j based on the value of i
+            j_range = 12 if i == 1 else 18 if i == 2 else 17
+            roman = 'I' * i
+            for j in range(1, j_range + 1):
+                # Format j with leading zeros
+                j_formatted = f"{j:02}"
+                add(f'/report/ar6/wg{i}/downloads/report/IPCC_AR6_WG{roman}_Chapter{j_formatted}.pdf',
+                    f'reports/pdf/wg{i}_ch{j}.pdf', 6, i, j, 'pdf')
+                add(f'/report/ar6/wg{i}/downloads/report/IPCC_AR6_WG{roman}_References_Chapter{j_formatted}.bib',
+                    f'references/wg{i}_ch{j}.bib', 6, i, j, 'bib')
+
+    if 5 in cycles:
+        for i in range(1, 4):
+            j_range = 14 if i == 1 else 30 if i == 2 else 16
+            for j in range(1, j_range + 1):
+                j_formatted = f"{j:02}"
+                if i == 1:
+                    if j not in [1, 2]:
+                        chapter_url = f'/site/assets/uploads/2018/02/WG1AR5_Chapter{j_formatted}_FINAL.pdf'
+                    else:
+                        chapter_url = f'/site/assets/uploads/2017/09/WG1AR5_Chapter{j_formatted}_FINAL.pdf'
+                if i == 2:
+                    chapter_url = f'/site/assets/uploads/2018/02/WGIIAR5-Chap{j}_FINAL.pdf'
+                if i == 3:
+                    chapter_url = f'/site/assets/uploads/2018/02/ipcc_wg3_ar5_chapter{j}.pdf'
+                add(chapter_url, f'reports/pdf/ar5/wg{i}_ch{j}.pdf', 5, i, j, 'pdf')
+
+    if 4 in cycles:
+        for i in range(2, 4):
+            j_range = 20 if i == 2 else 13
+            for j in range(1, j_range + 1):
+                add(f'/site/assets/uploads/2018/02/ar4-wg{i}-chapter{j}-1.pdf',
+                    f'reports/pdf/ar4/wg{i}_ch{j}.pdf', 4, i, j, 'pdf')
+
+    return manifest
+
+def load_manifest(manifest_file):
+    """Load a manifest from a JSON file (list of dictionaries with at least url and path keys)."""
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def load_state(state_file):
+    """Load the download state (ETag, Last-Modified and size of each downloaded file, by path)."""
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_state(state_file, state):
+    """Save the download state (written to a temporary file, then renamed)."""
+    os.makedirs(os.path.dirname(state_file) or '.', exist_ok=True)
+    with open(state_file + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(state_file + '.tmp', state_file)
+
+def make_session(workers):
+    """Return a session with a connection pool of the size of the number of workers, retrying transient errors."""
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['GET'])
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def validators(response):
+    return {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+
+def download_file(session, item, file_state, chunk_size=chunk_size):
+    """
+    Downloads a file of the manifest, streamed to a .part file.
+
+    - If the file exists and was downloaded with an ETag or Last-Modified header, it is requested conditionally
+      and skipped if unchanged (304).
+    - If a .part file exists, the download is resumed with a Range request (If-Range ensures the part belongs
+      to the same version of the file, otherwise the server sends the whole file).
+
+    Args:
+        session (requests.Session): The session.
+        item (dict): The manifest item (url and path).
+        file_state (dict): The state of the file at its last download, or None.
+        chunk_size (int): The size of the chunks written.
+
+    Returns:
+        tuple: The status ('unchanged', 'downloaded' or 'resumed'), the number of bytes transferred and
+        the new state of the file.
+    """
+    url, path = item['url'], item['path']
+    part_path = path + '.part'
+    part_state_path = part_path + '.json'
+    headers = {}
+    offset = 0
+
+    if file_state and os.path.exists(path) and os.path.getsize(path) == file_state.get('size'):
+        if file_state.get('etag'):
+            headers['If-None-Match'] = file_state['etag']
+        if file_state.get('last_modified'):
+            headers['If-Modified-Since'] = file_state['last_modified']
+    elif os.path.exists(part_path) and os.path.exists(part_state_path):
+        with open(part_state_path, 'r', encoding='utf-8') as f:
+            part_state = json.load(f)
+        if_range = part_state.get('etag') or part_state.get('last_modified')
+        if if_range:
+            offset = os.path.getsize(part_path)
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = if_range
+
+    with session.get(url, headers=headers, stream=True, timeout=60) as response:
+        if response.status_code == 304:
+            return 'unchanged', 0, file_state
+        if response.status_code == 416:
+            # The part is already complete (or invalid), download the whole file again
+            os.remove(part_path)
+            return download_file(session, item, None, chunk_size)
+        response.raise_for_status()
+        resumed = response.status_code == 206
+        new_state = validators(response)
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if not resumed:
+            offset = 0
+            with open(part_state_path, 'w', encoding='utf-8') as f:
+                json.dump(new_state, f)
+        transferred = 0
+        with open(part_path, 'ab' if resumed else 'wb') as f:
+            for chunk in response.iter_content(chunk_size):
+                f.write(chunk)
+                transferred += len(chunk)
+
+    expected_size = response.headers.get('Content-Length')
+    if expected_size is not None and 'Content-Encoding' not in response.headers and transferred != int(expected_size):
+        raise requests.ConnectionError(f'Incomplete download of {url} ({transferred}/{expected_size} bytes)')
+    os.replace(part_path, path)
+    os.remove(part_state_path)
+    new_state['size'] = offset + transferred
+    new_state['url'] = url
+    return ('resumed' if resumed else 'downloaded'), transferred, new_state
+
+def download_with_retries(session, item, file_state, max_attempts=max_attempts):
+    """Download a file, resuming it after a failure (up to max_attempts attempts)."""
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return download_file(session, item, file_state)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+            if attempt == max_attempts:
+                raise
+            time.sleep(2 ** attempt)
+
+def download_all(manifest, state_file, workers=workers, store=None):
+    """
+    Downloads the files of a manifest in parallel, skipping the files unchanged since their last download.
+
+    Args:
+        manifest (list): The files to download (dictionaries with url and path keys).
+        state_file (str): The file keeping the state of the downloaded files.
+        workers (int): The number of parallel downloads.
+        store (BlobStore): The store of the downloaded files (None for no store).
+
+    Returns:
+        dict: The number of files by status, and the number of bytes transferred.
+    """
+    state = load_state(state_file)
+    if store is not None:
+        # Restore the files deleted locally but still stored (they are then checked with a conditional request)
+        for item in manifest:
+            sha256 = (state.get(item['path']) or {}).get('sha256')
+            if sha256 and not os.path.exists(item['path']) and store.has(sha256):
+                store.link(sha256, item['path'])
+    counts = {'downloaded': 0, 'resumed': 0, 'unchanged': 0, 'failed': 0, 'bytes': 0}
+    session = make_session(workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(download_with_retries, session, item, state.get(item['path'])): item
+                   for item in manifest}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                status, transferred, file_state = future.result()
+            except (requests.RequestException, OSError) as e:
+                print(f"Failed to download {item['url']}: {e}")
+                counts['failed'] += 1
+                continue
+            counts[status] += 1
+            counts['bytes'] += transferred
+            stored = False
+            # Unchanged files (304) are already stored, unless the store was enabled after their download
+            if store is not None and (status != 'unchanged' or not file_state.get('sha256')):
+                sha256 = store.put(item['path'])
+                if file_state.get('sha256') != sha256:
+                    file_state['sha256'] = sha256
+                    store.record_provenance('download', {item['url']: sha256}, [item['path']])
+                    stored = True
+            state[item['path']] = file_state
+            if status != 'unchanged':
+                print(f"{status.title()} {item['path']}")
+            if status != 'unchanged' or stored:
+                save_state(state_file, state)
+    session.close()
+    if store is not None:
+        store.save()
+    return counts
+
 
-# AR of interest
-ar = 4
-
-# Function to download a file from a URL
-def download_file(url, filename):
-    try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an error on a failed request
-        with open(filename, 'wb') as f:
-            f.write(response.content)
-        print(f"Downloaded {filename}")
-    except requests.RequestException as e:
-        print(f"Failed to download {url}: {e}")
-
-if ar == 6:
-
-    download_folder = 'data'
-    folders = ['data/reports/pdf', 'data/references']
-    for folder in folders:
-        if not os.path.exists(folder):
-            os.makedirs(folder)
-
-    # Loop through the specified ranges for i and j
-    for i in range(1, 4):
-        # Set the range for j based on the value of i
-        j_range = 12 if i == 1 else 18 if i == 2 else 17
-        for j in range(1, j_range + 1):
-            # Format j with leading zeros
-            j_formatted = f"{j:02}"
-            # Construct the URL and filename
-            chapter_url = f"https://www.ipcc.ch/report/ar6/wg{i}/downloads/report/IPCC_AR6_WG{i*"I"}_Chapter{j_formatted}.pdf"
-            filename = os.path.join(download_folder, f"reports/pdf/wg{i}_ch{j}.pdf")
-            download_file(chapter_url, filename)
-            reference_url = f"https://www.ipcc.ch/report/ar6/wg{i}/downloads/report/IPCC_AR6_WG{i*"I"}_References_Chapter{j_formatted}.bib"
-            filename = os.path.join(download_folder, f"references/wg{i}_ch{j}.bib")
-            download_file(reference_url, filename)
-
-if ar == 5:
-
-    download_folder = 'data'
-    folder = f'{download_folder}/reports/pdf/ar5'
-    if not os.path.exists(folder):
-            os.makedirs(folder)
-
-    # Loop through the specified ranges for i and j
-    for i in range(1, 4):
-        # Set the range for j based on the value of i
-        j_range = 14 if i == 1 else 30 if i == 2 else 16
-        for j in range(1, j_range + 1):
-            # Format j with leading zeros
-            j_formatted = f"{j:02}"
-            # Construct the URL and filename
-            if i == 1:
-                if j not in [1,2]:
-                    chapter_url = f'https://www.ipcc.ch/site/assets/uploads/2018/02/WG1AR5_Chapter{j_formatted}_FINAL.pdf'
-                else:
-                    chapter_url = f'https://www.ipcc.ch/site/assets/uploads/2017/09/WG1AR5_Chapter{j_formatted}_FINAL.pdf'
-            if i == 2:
-                chapter_url = f'https://www.ipcc.ch/site/assets/uploads/2018/02/WGIIAR5-Chap{j}_FINAL.pdf'
-            if i == 3:
-                chapter_url = f'https://www.ipcc.ch/site/assets/uploads/2018/02/ipcc_wg3_ar5_chapter{j}.pdf'
-            filename = os.path.join(download_folder, f"reports/pdf/ar5/wg{i}_ch{j}.pdf")
-            download_file(chapter_url, filename)
-
-if ar == 4:
-
-    download_folder = 'data'
-    folder = f'{download_folder}/reports/pdf/ar4'
-    if not os.path.exists(folder):
-            os.makedirs(folder)
-
-    # Loop through the specified ranges for i and j
-    for i in range(2, 4):
-        # Set the range for j based on the value of i
-        j_range = 20 if i == 2 else 13
-        for j in range(1, j_range + 1):
-            # Format j with leading zeros
-            j_formatted = f"{j:02}"
-            # Construct the URL and filename
-            chapter_url = f'https://www.ipcc.ch/site/assets/uploads/2018/02/ar4-wg{i}-chapter{j}-1.pdf'
-            filename = os.path.join(download_folder, f"reports/pdf/ar4/wg{i}_ch{j}.pdf")
-            download_file(chapter_url, filename)
+if __name__ == '__main__':
+    manifest = load_manifest(manifest_file) if manifest_file else build_manifest(cycles, base_url, download_folder)
+    start_time = time.time()
+    store = BlobStore(blob_store_root) if blob_store_root else None
+    counts = download_all(manifest, state_file, workers, store)
+    print(f"{len(manifest)} files in {time.time() - start_time:.1f} s: {counts['downloaded']} downloaded, "
+          f"{counts['resumed']} resumed, {counts['unchanged']} unchanged, {counts['failed']} failed "
+          f"({counts['bytes'] / 1e6:.1f} MB transferred)")
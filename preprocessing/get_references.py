@@ -1,41 +1,114 @@
+"""
+This script resolves the references of a spreadsheet (one reference per row, optionally with its CCI project
+in a first column) with the Crossref API, and writes them to a BibTeX file.
+
+For each reference, the DOI is searched in the reference content, then in the webpage of the URL found in the
+content (the webpage is streamed and only read until its DOI meta tag or first DOI is found, see doi_extraction.py), and the Crossref metadata is fetched from the DOI. Otherwise, the reference content is used as a
+Crossref query. References without DOI or URL are first matched, offline and in bulk, against the entries of
+local .bib files (e.g. the IPCC chapter references, see bib_index.py): matches with a confidence above
+local_min_confidence are taken from the local files, and only the others are sent to Crossref.
+Instead of the API, a local store built from a Crossref dump can be used (offline, see crossref_store.py).
+The references are resolved concurrently (see crossref_client.py): the connections are pooled,
+the number of requests in flight and the request rate are limited, and requests failing with a 429 or 5xx
+status are retried with backoff. The lookups are cached on disk (see http_cache.py), so that a re-run only
+requests the references not resolved yet.
+
+Each resolved reference is appended to a journal (<excel_name>_journal.jsonl, next to the .bib file) as soon as
+it is committed, in the order of the rows. If a run is interrupted, the next run (resume = True) restarts after
+the last committed row, and the .bib file, the log files and the summary counters are rebuilt from the journal.
+The journal starts with a header recording a hash of the references, and is discarded if the Excel file changed.
+
+The messages of each reference are logged, and the entries written, in the
+order of the spreadsheet rows, so that logs and outputs do not depend on the order of the responses.
+
+Usage:
+- Modify the excel_file_path and API settings variables.
+- Run `python ./preprocessing/get_references.py` from the repository root.
+"""
+
+import os
 import re
+import sys
+import json
+import asyncio
+import hashlib
+import functools
 import logging
 import requests
 import pandas as pd
 from bibtexparser.bibdatabase import BibDatabase
 from bibtexparser.bwriter import BibTexWriter
+from crossref_client import CrossrefClient, DEFAULT_HEADERS
+from http_cache import HttpCache, DAY
+from bib_index import BibIndex, load_bib_entries
+from crossref_store import CrossrefStore
+from doi_extraction import scan_response
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from blob_store import replace_file
 
 # Specify the path to your Excel file
 bib_file_path = './data/cci'
 excel_file_path = './data/cci/cci_oc_papers.xlsx'
 excel_name = excel_file_path.split('/')[-1][:-5]
+resume = True # Restart after the last row committed to the journal of a previous run (False to resolve all rows again)
+
+# Crossref API settings
+crossref_base_url = 'https://api.crossref.org' # Can be set to a local stub server (see crossref_stub.py)
+concurrency = 8 # Number of requests in flight
+requests_per_second = 10 # Rate limit, be polite with the API
+max_retries = 5 # Retries on connection errors, 429 and 5xx responses
+mailto = None # Contact email sent to Crossref (polite pool)
+page_concurrency = 16 # Number of webpage requests in flight (not rate limited, as they are not sent to Crossref)
+page_max_bytes = 512 * 1024 # Maximum number of bytes read from a webpage to find its DOI
+crossref_store_path = None # Local store built from a Crossref dump (crossref_store.py), used instead of the API (offline)
+
+# Local references settings
+local_bib_path = './data/references' # Folder of .bib files matched before querying Crossref (None to disable)
+local_min_confidence = 0.85 # Minimum confidence of a local match (title, first author and year found in the reference)
+
+# Lookup cache settings
+cache_path = './data/cci/crossref_cache.sqlite' # None to disable the cache
+cache_ttl_days = 90 # Time to live of the resolved lookups
+negative_cache_ttl_days = 7 # Time to live of the lookups without result (unknown DOI, webpage without DOI...)
 
 # Specify the log level: 'INFO' or 'ERROR'
 logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
 
-headers = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)',
-    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-    'Accept-Language': 'en-US,en;q=0.5',
-    'DNT': '1',  # Do Not Track Request Header
-    'Connection': 'keep-alive'
-}
+headers = DEFAULT_HEADERS
+
+class ReferenceLog:
+    """
+    Messages of a reference, kept until the reference is resolved and then written in the order of the references.
+    Messages are sent to the console (info, warning, error) or to the error and warning log files (log_error, log_warning).
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def info(self, message):
+        self.messages.append(('info', message))
 
-# Initialize counters
-reference_from_doi_count = 0
-reference_from_query_count = 0
-error_count = 0
+    def warning(self, message):
+        self.messages.append(('warning', message))
 
-# Open error and warning log files
-error_log_file = open(f'./logs/{excel_name}_error_log.txt', 'w', encoding='utf-8')
-warning_log_file = open(f'./logs/{excel_name}_warning_log.txt', 'w', encoding='utf-8')
+    def error(self, message):
+        self.messages.append(('error', message))
 
-# Update the functions to write to the error and warning logs
-def log_error(message):
-    error_log_file.write(message + '\n')
+    def log_error(self, message):
+        self.messages.append(('error_file', message))
 
-def log_warning(message):
-    warning_log_file.write(message + '\n')
+    def log_warning(self, message):
+        self.messages.append(('warning_file', message))
+
+    def flush(self, error_log_file, warning_log_file, console=True):
+        for level, message in self.messages:
+            if level == 'error_file':
+                error_log_file.write(message + '\n')
+            elif level == 'warning_file':
+                warning_log_file.write(message + '\n')
+            elif console:
+                getattr(logging, level)(message)
+        self.messages = []
 
 def remove_non_alphanumeric_at_end(s):
     pattern = r'(full|fulltext\.html)$'
@@ -43,50 +116,73 @@ def remove_non_alphanumeric_at_end(s):
     return re.sub(r'[^\w\d]+$', '', cleaned_text)
 
 # Function to find DOI or URL in text and display the process
-def find_doi_or_url(text):
+def find_doi_or_url(text, log=logging):
     doi_regex = r'(?:^|\b)10\.(\d{4,9}/[-._;()/:A-Za-z0-9]+)'
     url_regex = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
     doi_match = re.search(doi_regex, text)
     if doi_match:
-        logging.info("DOI found in reference content.")
+        log.info("DOI found in reference content.")
         return ('doi', remove_non_alphanumeric_at_end(doi_match.group(0)))
     url_match = re.search(url_regex, text)
     if url_match:
-        logging.info("URL found in reference content, will attempt to extract DOI from the webpage.")
+        log.info("URL found in reference content, will attempt to extract DOI from the webpage.")
         return ('url', remove_non_alphanumeric_at_end(url_match.group(0)))
-    logging.info("No DOI or URL found in reference content, proceeding with query.")
+    log.info("No DOI or URL found in reference content, proceeding with query.")
     return ('query', text)
 
+def is_negative(error):
+    """Return True if a lookup error is a definitive result (cached), False if it is transient (connection error, 429, 5xx)."""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return 400 <= error.response.status_code < 500 and error.response.status_code != 429
+    return isinstance(error, LookupError)
+
 # Function to attempt fetching a DOI from webpage content and display the process
-def extract_doi_from_webpage(url):
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        doi_match = re.search(r'10.\d{4,9}/[-._;()/:A-Za-z0-9]+', response.text)
-        if doi_match:
-            logging.info("DOI successfully extracted from webpage content.")
-            return remove_non_alphanumeric_at_end(doi_match.group(0))
-        else:
-            logging.info("No DOI found in webpage content.")
-    except requests.RequestException as e:
-        logging.error(f'Error accessing URL {url}: {e}')
-    return None
-
-def fetch_crossref_data(mode, content, reference_id):
-    global doi_in_content_count, doi_from_url_count, reference_from_query_count
-    if mode == 'doi':
-        url = f'https://api.crossref.org/works/{content}'
-    elif mode == 'query':
-        url = f'https://api.crossref.org/works?query={content}&select=title,DOI,published,author,container-title,volume,page,issue,type&rows=1'
-        log_warning(f'Reference ID {reference_id}: Entry recovered using query : {content}')
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        return data['message'] if mode != 'query' else data['message']['items'][0]
-    except requests.RequestException as e:
-        log_error(f'Reference ID {reference_id}: Error fetching data for {content}: {str(e)}')
-        return None
+async def extract_doi_from_webpage(url, client, log=logging, cache=None):
+    found = False
+    if cache is not None:
+        found, doi, error = cache.get('page', url)
+    if not found:
+        doi, error = None, None
+        try:
+            doi, _, _ = await client.page(url, functools.partial(scan_response, max_bytes=page_max_bytes))
+        except (requests.RequestException, LookupError) as e:
+            error = e
+        if cache is not None and (error is None or is_negative(error)):
+            if doi:
+                cache.set('page', url, doi)
+            else:
+                cache.set_negative('page', url, error)
+    if doi:
+        log.info("DOI successfully extracted from webpage content.")
+    elif error is not None:
+        log.error(f'Error accessing URL {url}: {error}')
+    else:
+        log.info("No DOI found in webpage content.")
+    return doi
+
+async def fetch_crossref_data(mode, content, reference_id, client, log, cache=None):
+    if mode == 'query':
+        log.log_warning(f'Reference ID {reference_id}: Entry recovered using query : {content}')
+    found = False
+    if cache is not None:
+        found, item, error = cache.get(mode, content)
+    if not found:
+        item, error = None, None
+        try:
+            if mode == 'doi':
+                item = await client.work(content)
+            else:
+                item = (await client.query(content))[0]
+        except (requests.RequestException, LookupError) as e:
+            error = e
+        if cache is not None:
+            if item is not None:
+                cache.set(mode, content, item)
+            elif is_negative(error):
+                cache.set_negative(mode, content, error)
+    if error is not None:
+        log.log_error(f'Reference ID {reference_id}: Error fetching data for {content}: {str(error)}')
+    return item
 
 def process_bibtex_entry(item, project_field):
     # Simplified version, expand based on actual BibTeX requirements
@@ -106,6 +202,24 @@ def process_bibtex_entry(item, project_field):
         entry['project'] = process_project_name(str(project_field).title().rstrip()) # Custom field for project
     return entry
 
+def process_local_entry(bib_entry, project_field):
+    """Return the BibTeX entry of a reference matched in the local .bib files, with the fields of process_bibtex_entry."""
+    entry = {
+        'ENTRYTYPE': bib_entry.get('ENTRYTYPE', 'article'),
+        'ID': bib_entry['doi'].replace('/', '_') if bib_entry.get('doi') else bib_entry.get('ID', ''),
+        'title': bib_entry.get('title', 'No Title'),
+        'author': bib_entry.get('author', ''),
+        'journal': bib_entry.get('journal', bib_entry.get('booktitle', 'No Journal')),
+        'year': bib_entry.get('year', 'No Year'),
+        'volume': bib_entry.get('volume', 'No Volume'),
+        'number': bib_entry.get('number', 'No Issue'),
+        'pages': bib_entry.get('pages', 'No Pages'),
+        'doi': bib_entry.get('doi', 'No DOI'),
+    }
+    if project_field:
+        entry['project'] = process_project_name(str(project_field).title().rstrip()) # Custom field for project
+    return entry
+
 def process_project_name(project):
     if project == 'Ghg':
         return 'Greenhouse Gases'
@@ -114,62 +228,218 @@ def process_project_name(project):
     else:
         return project
 
-# Initialize the BibTeX database
-db = BibDatabase()
+async def resolve_reference(client, cache, reference_id, total_references, reference_content, project_field, local_match=None):
+    """Resolve a reference, return its BibTeX entry (or None), the mode used and its log."""
+    log = ReferenceLog()
+    log.info(f'Reference {reference_id}/{total_references}')
 
-# Load the Excel file into a DataFrame
-df = pd.read_excel(excel_file_path)
-total_references = len(df)
-
-# Check for 'Project' field
-project = (df.shape[1] == 2)
-if project == False:
-    project_field = None
-
-# Process each reference in the DataFrame
-for index, row in df.iterrows():
-    reference_id = index + 1
-    if project:
-        project_field = row.iloc[0]  # Assuming project field is in the first column
-        reference_content = row.iloc[1]  # Assuming reference content is in the second column
-    else:
-        reference_content = row.iloc[0] # Assuming reference content is in the first column
-    logging.info(f'Reference {reference_id}/{total_references}')
-
-    mode, content = find_doi_or_url(reference_content)
+    mode, content = find_doi_or_url(reference_content, log)
+    if mode == 'query' and local_match is not None:
+        bib_entry, confidence = local_match
+        log.log_warning(f'Reference ID {reference_id}: Entry recovered from local references (confidence {confidence}) : {reference_content}')
+        log.info(f'Successfully processed Reference ID {reference_id} using local references.')
+        return process_local_entry(bib_entry, project_field), 'local', log
     if mode == 'url':
-        extracted_doi = extract_doi_from_webpage(content)
+        extracted_doi = await extract_doi_from_webpage(content, client, log, cache)
         if extracted_doi:
             mode, content = ('doi', extracted_doi)
-            logging.info(f'Reference ID {reference_id}: DOI extracted from URL.')
+            log.info(f'Reference ID {reference_id}: DOI extracted from URL.')
         else:
             mode, content = ('query', reference_content)
-            logging.warning(f'Reference ID {reference_id}: No DOI found, using query mode.')
+            log.warning(f'Reference ID {reference_id}: No DOI found, using query mode.')
 
-    item = fetch_crossref_data(mode, content, reference_id)
+    item = await fetch_crossref_data(mode, content, reference_id, client, log, cache)
     if item:
-        bibtex_entry = process_bibtex_entry(item, project_field)
-        db.entries.append(bibtex_entry)
-        logging.info(f'Successfully processed Reference ID {reference_id} using {mode}.')
-        if mode == 'doi':
-            reference_from_doi_count += 1
-        elif mode == 'query':
-            reference_from_query_count += 1
+        log.info(f'Successfully processed Reference ID {reference_id} using {mode}.')
+        return process_bibtex_entry(item, project_field), mode, log
+    log.error(f'Failed to process Reference ID {reference_id}.')
+    return None, mode, log
+
+async def resolve_references(references, client, cache=None, start=0, local_matches=None):
+    """
+    Resolve the references concurrently, yielding (reference_id, entry, mode, log) in the order of the references.
+
+    Args:
+        references (list): (reference content, project field) tuples.
+        client (CrossrefClient): The Crossref client.
+        cache (HttpCache): The lookup cache (None for no cache).
+        start (int): The number of references to skip (already resolved).
+        local_matches (dict): The local match (entry, confidence) of references, by index (see match_local_references).
+    """
+    local_matches = local_matches or {}
+    tasks = [asyncio.create_task(resolve_reference(client, cache, index + 1, len(references), content, project_field,
+                                                   local_matches.get(index)))
+             for index, (content, project_field) in enumerate(references[start:], start)]
+    try:
+        for index, task in enumerate(tasks, start):
+            entry, mode, log = await task
+            yield index + 1, entry, mode, log
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def load_references(excel_file_path):
+    """Load the references of the spreadsheet, return (reference content, project field) tuples."""
+    df = pd.read_excel(excel_file_path)
+    # Check for 'Project' field (in the first column, the reference content being in the second column)
+    project = (df.shape[1] == 2)
+    references = []
+    for _, row in df.iterrows():
+        if project:
+            references.append((row.iloc[1], row.iloc[0]))
+        else:
+            references.append((row.iloc[0], None))
+    return references
+
+def match_local_references(references, start=0):
+    """
+    Matches the references without DOI or URL against the local .bib files, in bulk.
+
+    Returns:
+        dict: The match (entry, confidence) of the references matched with at least local_min_confidence, by index.
+    """
+    index = BibIndex(load_bib_entries(local_bib_path))
+    rows = [i for i in range(start, len(references))
+            if find_doi_or_url(references[i][0], ReferenceLog())[0] == 'query']
+    matches = index.match_many([references[i][0] for i in rows], local_min_confidence)
+    local_matches = {i: match for i, match in zip(rows, matches) if match is not None}
+    logging.info(f'Matched {len(local_matches)}/{len(rows)} references without DOI or URL in the local references')
+    return local_matches
+
+def references_digest(references):
+    """Return a hash of the references, to check that a journal belongs to the same Excel file."""
+    data = json.dumps([[str(content), str(project_field)] for content, project_field in references])
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+def journal_path():
+    return f'{bib_file_path}/{excel_name}_journal.jsonl'
+
+def load_journal(path, digest):
+    """
+    Loads the rows committed to a journal.
+
+    Args:
+        path (str): The path of the journal.
+        digest (str): The hash of the references (see references_digest).
+
+    Returns:
+        tuple: The committed rows (list of dictionaries with row, mode, entry and messages keys) and the size
+        in bytes of the valid part of the journal (a last line partially written is dropped), or ([], None)
+        if there is no journal or if it belongs to other references.
+    """
+    if not os.path.exists(path):
+        return [], None
+    rows = []
+    size = 0
+    with open(path, 'rb') as f:
+        for index, line in enumerate(f):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b'\n'):
+                break
+            if index == 0:
+                if record.get('digest') != digest:
+                    logging.warning(f'Journal {path} belongs to other references, starting a new journal')
+                    return [], None
+            elif record['row'] != len(rows) + 1:
+                break
+            else:
+                rows.append(record)
+            size += len(line)
+    if size == 0:
+        return [], None
+    return rows, size
+
+def open_journal(path, digest, size):
+    """Open a journal for appending, after its valid part (size in bytes), or a new journal if size is None."""
+    if size is None:
+        journal = open(path, 'w', encoding='utf-8')
+        journal.write(json.dumps({'excel': excel_file_path, 'digest': digest}) + '\n')
+        journal.flush()
+        return journal
+    os.truncate(path, size)
+    return open(path, 'a', encoding='utf-8')
+
+def rebuild_from_journal(rows):
+    """Return the BibTeX database and the summary counters of the rows of a journal."""
+    db = BibDatabase()
+    counters = {'doi': 0, 'query': 0, 'local': 0, 'error': 0}
+    for row in rows:
+        if row['entry']:
+            db.entries.append(row['entry'])
+            counters[row['mode']] += 1
+        else:
+            counters['error'] += 1
+    return db, counters
+
+async def process_references(references, error_log_file, warning_log_file, journal, cache=None, start=0, local_matches=None):
+    """
+    Resolve the references after the first start rows, and commit them to the journal in the order of the rows.
+
+    Returns:
+        int: The number of network requests.
+    """
+    if crossref_store_path:
+        client = CrossrefStore(crossref_store_path)
     else:
-        logging.error(f'Failed to process Reference ID {reference_id}.')
-        error_count += 1
-        continue  # Skip to the next reference if unable to process
+        client = CrossrefClient(crossref_base_url, concurrency=concurrency, rate=requests_per_second,
+                                max_retries=max_retries, headers=headers, mailto=mailto, page_concurrency=page_concurrency)
+    try:
+        async for reference_id, entry, mode, log in resolve_references(references, client, cache, start, local_matches):
+            journal.write(json.dumps({'row': reference_id, 'mode': mode, 'entry': entry, 'messages': log.messages}) + '\n')
+            journal.flush()
+            log.flush(error_log_file, warning_log_file)
+    finally:
+        client.close()
+    return client.request_count
+
+def main():
+    references = load_references(excel_file_path)
+    total_references = len(references)
+
+    digest = references_digest(references)
+    rows, size = load_journal(journal_path(), digest) if resume else ([], None)
+    if rows:
+        logging.info(f'Resuming after Reference {len(rows)}/{total_references} (journal {journal_path()})')
+
+    local_matches = match_local_references(references, len(rows)) if local_bib_path else None
+    # The lookups of the local Crossref store are not cached
+    cache = None
+    if cache_path and not crossref_store_path:
+        cache = HttpCache(cache_path, cache_ttl_days * DAY, negative_cache_ttl_days * DAY)
+
+    # Open error and warning log files (the messages of the committed rows are written again from the journal)
+    try:
+        with open(f'./logs/{excel_name}_error_log.txt', 'w', encoding='utf-8') as error_log_file, \
+                open(f'./logs/{excel_name}_warning_log.txt', 'w', encoding='utf-8') as warning_log_file, \
+                open_journal(journal_path(), digest, size) as journal:
+            for row in rows:
+                log = ReferenceLog()
+                log.messages = [tuple(message) for message in row['messages']]
+                log.flush(error_log_file, warning_log_file, console=False)
+            request_count = asyncio.run(process_references(references, error_log_file, warning_log_file, journal,
+                                                           cache, len(rows), local_matches))
+    finally:
+        if cache is not None:
+            cache.close()
+
+    # Rebuild the BibTeX database and the counters from the journal
+    rows, _ = load_journal(journal_path(), digest)
+    db, counters = rebuild_from_journal(rows)
+
+    # Write the BibTeX entries to a file
+    with replace_file(f'{bib_file_path}/{excel_name}.bib', encoding='utf-8') as bibtex_file:
+        bibtex_writer = BibTexWriter()
+        bibtex_file.write(bibtex_writer.write(db))
 
-# Write the BibTeX entries to a file
-with open(f'{bib_file_path}/{excel_name}.bib', 'w', encoding='utf-8') as bibtex_file:
-    bibtex_writer = BibTexWriter()
-    bibtex_file.write(bibtex_writer.write(db))
+    print(f"Finished processing all {total_references} references. Check '{excel_name}.bib' for the BibTeX entries. Check 'error_log.txt' for errors and 'warning_log.txt' for general logs.")
 
-print(f"Finished processing all {total_references} references. Check '{excel_name}.bib' for the BibTeX entries. Check 'error_log.txt' for errors and 'warning_log.txt' for general logs.")
+    # After processing all references, print the summary
+    print(f"Summary:\n- References processed with DOI in content or extracted from webpage: {counters['doi']}\n- References processed from query: {counters['query']}\n- References matched in the local references: {counters['local']}\n- References failing to process: {counters['error']}")
+    print(f"- Network requests: {request_count}" + (f" (cache hits: {cache.hits}, misses: {cache.misses})" if cache is not None else ''))
 
-# After processing all references, print the summary and close log files
-print(f"Summary:\n- References processed with DOI in content or extracted from webpage: {reference_from_doi_count}\n- References processed from query: {reference_from_query_count}\n- References failing to process: {error_count}")
 
-# Close the log files
-error_log_file.close()
-warning_log_file.close()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+This module provides a persistent cache (SQLite) of the lookups of get_references.py, so that references
+already resolved are not requested again from Crossref and the publisher webpages on the next runs.
+
+Entries are keyed on their kind and a normalized key:
+- 'doi':   Crossref work of a DOI (key: lowercase DOI)
+- 'query': First Crossref item of a free-text query (key: lowercase query with collapsed whitespace)
+- 'page':  DOI extracted from a webpage (key: URL)
+
+Each entry has an expiry date (TTL). Negative results (unknown DOI, query without item, webpage without DOI
+or not found) are cached too, with their error message and a shorter TTL, so that they are not requested
+again on every run. Transient failures (connection errors, 429 and 5xx responses) are never cached.
+
+Classes:
+- HttpCache(path, ttl, negative_ttl): The cache.
+
+Usage (inspection CLI):
+python ./preprocessing/http_cache.py stats [--cache ./data/cci/crossref_cache.sqlite]
+python ./preprocessing/http_cache.py list [--kind doi] [--negative] [--expired] [--limit 20]
+python ./preprocessing/http_cache.py show doi 10.1038/nature11377
+python ./preprocessing/http_cache.py purge [--kind query] [--negative] [--expired]
+"""
+
+import os
+import json
+import time
+import sqlite3
+import argparse
+
+KINDS = ('doi', 'query', 'page')
+
+DEFAULT_CACHE_PATH = './data/cci/crossref_cache.sqlite'
+
+DAY = 24 * 3600
+
+def normalize_key(kind, key):
+    """Return the normalized key of a lookup."""
+    key = str(key).strip()
+    if kind == 'doi':
+        return key.lower()
+    if kind == 'query':
+        return ' '.join(key.lower().split())
+    return key
+
+class HttpCache:
+    """
+    Persistent cache of the lookups, stored in a SQLite database.
+
+    Args:
+        path (str): The path of the SQLite database (created if needed).
+        ttl (float): The time to live of the positive entries (seconds).
+        negative_ttl (float): The time to live of the negative entries (seconds).
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=90 * DAY, negative_ttl=7 * DAY):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT, error TEXT, '
+            'created REAL NOT NULL, expires REAL NOT NULL, PRIMARY KEY (kind, key))'
+        )
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, kind, key):
+        """
+        Looks up an entry.
+
+        Args:
+            kind (str): The kind of the lookup ('doi', 'query' or 'page').
+            key (str): The key of the lookup (DOI, query or URL).
+
+        Returns:
+            tuple: (found, value, error). value is None for a negative entry, error its error message.
+        """
+        row = self.connection.execute(
+            'SELECT value, error FROM entries WHERE kind = ? AND key = ? AND expires > ?',
+            (kind, normalize_key(kind, key), time.time())
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return False, None, None
+        self.hits += 1
+        value, error = row
+        return True, (json.loads(value) if value is not None else None), error
+
+    def set(self, kind, key, value):
+        """Stores a positive entry (value must be JSON serializable)."""
+        self._store(kind, key, json.dumps(value), None, self.ttl)
+
+    def set_negative(self, kind, key, error):
+        """Stores a negative entry, with its error message (None for a lookup without error, e.g. a webpage without DOI)."""
+        self._store(kind, key, None, None if error is None else str(error), self.negative_ttl)
+
+    def _store(self, kind, key, value, error, ttl):
+        now = time.time()
+        self.connection.execute(
+            'INSERT OR REPLACE INTO entries (kind, key, value, error, created, expires) VALUES (?, ?, ?, ?, ?, ?)',
+            (kind, normalize_key(kind, key), value, error, now, now + ttl)
+        )
+        self.connection.commit()
+
+    def _where(self, kind=None, negative=False, expired=False):
+        clauses, params = [], []
+        if kind:
+            clauses.append('kind = ?')
+            params.append(kind)
+        if negative:
+            clauses.append('value IS NULL')
+        if expired:
+            clauses.append('expires <= ?')
+            params.append(time.time())
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def stats(self):
+        """Return the number of positive, negative and expired entries of each kind."""
+        rows = self.connection.execute(
+            'SELECT kind, SUM(value IS NOT NULL), SUM(value IS NULL), SUM(expires <= ?) FROM entries GROUP BY kind',
+            (time.time(),)
+        ).fetchall()
+        return {kind: {'positive': positive, 'negative': negative, 'expired': expired}
+                for kind, positive, negative, expired in rows}
+
+    def entries(self, kind=None, negative=False, expired=False, limit=None):
+        """Return (kind, key, negative, error, created, expires) tuples of the entries, most recent first."""
+        where, params = self._where(kind, negative, expired)
+        query = f'SELECT kind, key, value IS NULL, error, created, expires FROM entries{where} ORDER BY created DESC'
+        if limit:
+            query += f' LIMIT {int(limit)}'
+        return self.connection.execute(query, params).fetchall()
+
+    def purge(self, kind=None, negative=False, expired=False):
+        """Delete entries, return the number of deleted entries."""
+        where, params = self._where(kind, negative, expired)
+        count = self.connection.execute(f'DELETE FROM entries{where}', params).rowcount
+        self.connection.commit()
+        return count
+
+
+def format_time(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(timestamp))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect the lookup cache of get_references.py.')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help='Path of the SQLite cache')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help='Number of entries of each kind')
+    for name in ('list', 'purge'):
+        subparser = subparsers.add_parser(name, help=f'{name.title()} entries')
+        subparser.add_argument('--kind', choices=KINDS)
+        subparser.add_argument('--negative', action='store_true', help='Only negative entries')
+        subparser.add_argument('--expired', action='store_true', help='Only expired entries')
+        if name == 'list':
+            subparser.add_argument('--limit', type=int, default=20)
+    show_parser = subparsers.add_parser('show', help='Show an entry')
+    show_parser.add_argument('kind', choices=KINDS)
+    show_parser.add_argument('key')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.cache):
+        parser.error(f'No cache at {args.cache}')
+    with HttpCache(args.cache) as cache:
+        if args.command == 'stats':
+            stats = cache.stats()
+            print(f"{'Kind':<8}{'Positive':>10}{'Negative':>10}{'Expired':>10}")
+            for kind in KINDS:
+                counts = stats.get(kind, {'positive': 0, 'negative': 0, 'expired': 0})
+                print(f"{kind:<8}{counts['positive']:>10}{counts['negative']:>10}{counts['expired']:>10}")
+            print(f"Size: {os.path.getsize(args.cache) / 1024:.1f} KB")
+        elif args.command == 'list':
+            for kind, key, negative, error, created, expires in cache.entries(args.kind, args.negative, args.expired, args.limit):
+                status = f'negative ({error})' if negative else 'positive'
+                print(f'{kind:<6} {key}  {status}  created {format_time(created)}, expires {format_time(expires)}')
+        elif args.command == 'show':
+            found, value, error = cache.get(args.kind, args.key)
+            if not found:
+                print('Not cached (or expired)')
+            elif value is None:
+                print(f'Negative entry: {error}')
+            else:
+                print(json.dumps(value, indent=2, ensure_ascii=False))
+        elif args.command == 'purge':
+            print(f'Deleted {cache.purge(args.kind, args.negative, args.expired)} entries')
@@ -5,17 +5,21 @@ Add entries from cci_papers if:
 - An entry with the same DOI is found but with a different non empty 'project' field
 """
 
-import bibtexparser
+import os
+import sys
 from bibtexparser.bwriter import BibTexWriter
 from collections import defaultdict
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import bib_stream
+from blob_store import replace_file
 
 def load_bibtex_file(filepath):
     with open(filepath, 'r', encoding='utf-8') as bibtex_file:
-        return bibtexparser.load(bibtex_file)
+        return bib_stream.load(bibtex_file)
 
 def save_bibtex_file(database, filepath):
     writer = BibTexWriter()
-    with open(filepath, 'w', encoding='utf-8') as bibtex_file:
+    with replace_file(filepath, encoding='utf-8') as bibtex_file:
         bibtex_file.write(writer.write(database))
 
 website_db = load_bibtex_file('./data/cci/intermediate/cci_papers_website_complete_no_duplicates.bib')
@@ -1,86 +1,209 @@
 # Removes duplicate entries from BibTeX (.bib) files. It can process a single file or all files in a directory,
 # identifying duplicates by their unique 'ID' or by comparing all fields. The output is saved to a specified location, 
 # either as a modified single file or within a new directory for multiple files, with statistics on duplicates printed to the console.
+# Complete duplicates are found with a canonical hash of each entry (see bib_dedup.py), in linear time, and near-duplicates
+# (same DOI, same title, or same first author and year with a similar title) can be reported as clusters in a csv file.
+# In folder mode, the files are processed in parallel in a process pool, the entries of each file being written to the
+# output as they are accepted, and the DOIs cited in several files (e.g. in wg1_ch2 and wg1_ch7) are reported in a csv file.
 
 import os
+import sys
+import csv
 import glob
-import bibtexparser
+import tempfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from bibtexparser.bwriter import BibTexWriter
 from bibtexparser.bibdatabase import BibDatabase
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import bib_stream
+from blob_store import replace_file
+from bib_dedup import normalize_doi, unique_entries, find_duplicate_clusters, write_cluster_report
 
 def remove_duplicates_from_bib_file(input_file, output_file):
     with open(input_file, encoding='utf-8') as bibtex_file:
-        bib_database = bibtexparser.load(bibtex_file)
+        bib_database = bib_stream.load(bibtex_file)
         initial_count = len(bib_database.entries)
         unique_entries = {}
         for entry in bib_database.entries:
-            unique_entries[entry['ID']] = entry  # Assumes 'ID' is unique for each entry
+            unique_entries[entry['ID']] = entry  # The last occurrence of each ID is kept (as in folder mode)
         
         final_count = len(unique_entries)
         duplicates_count = initial_count - final_count
 
         bib_database.entries = list(unique_entries.values())
         writer = BibTexWriter()
-        with open(output_file, 'w', encoding='utf-8') as bibtex_out:
+        with replace_file(output_file, encoding='utf-8') as bibtex_out:
             bibtex_out.write(writer.write(bib_database))
         
         return initial_count, duplicates_count, final_count
     
 def remove_complete_duplicates(bib_file_path, output_file_path):
     with open(bib_file_path, encoding='utf-8') as bibtex_file:
-        bib_database = bibtexparser.load(bibtex_file)
+        bib_database = bib_stream.load(bibtex_file)
         initial_count = len(bib_database.entries)
-        unique_entries = []
-
-        for entry in bib_database.entries:
-            if entry not in unique_entries:
-                unique_entries.append(entry)
-
-        duplicates_count = initial_count - len(unique_entries)
+        unique, duplicates_count = unique_entries(bib_database.entries)
 
         # Create a new BibDatabase instance for the unique entries
         unique_bib_database = BibDatabase()
-        unique_bib_database.entries = unique_entries
+        unique_bib_database.entries = unique
 
         # Write the unique entries to the output file
         writer = BibTexWriter()
-        with open(output_file_path, 'w', encoding='utf-8') as out_file:
+        with replace_file(output_file_path, encoding='utf-8') as out_file:
             out_file.write(writer.write(unique_bib_database))
     
     print(f'Initial number of references: {initial_count}')
     print(f'Number of duplicates: {duplicates_count}')
-    print(f'Final number of references: {len(unique_entries)}')
+    print(f'Final number of references: {len(unique)}')
+
+def report_duplicate_clusters(bib_file_path, report_path):
+    with open(bib_file_path, encoding='utf-8') as bibtex_file:
+        bib_database = bib_stream.load(bibtex_file)
+    clusters = find_duplicate_clusters(bib_database.entries)
+    write_cluster_report(report_path, bib_database.entries, clusters)
+
+    print(f'Number of references: {len(bib_database.entries)}')
+    print(f'Number of duplicate clusters: {len(clusters)}')
+    print(f'Number of references in clusters: {sum(len(cluster["indices"]) for cluster in clusters)}')
+
+def stream_deduplicated_bib_file(input_file, output_file):
+    """
+    Removes the duplicate entries (common ID) of a .bib file in bounded memory, with the same output as
+    remove_duplicates_from_bib_file: the last occurrence of each ID is kept, and the comments, preambles and strings
+    are written before the entries sorted by ID.
+    A first pass over the input finds the position of the last occurrence of each ID (and the comments, preambles
+    and strings). In a second pass, each kept entry is written as soon as it is read to a temporary spool file, and
+    the output is then assembled from the spool in ID order. The output is written to a temporary file and then
+    renamed (see replace_file), so output_file can be input_file.
+
+    Args:
+        input_file (str): The .bib file.
+        output_file (str): The output .bib file.
+
+    Returns:
+        tuple: The initial, duplicate and final numbers of entries, and the (normalized DOI, ID) of the entries kept.
+    """
+    initial_count = 0
+    first_positions, last_positions = {}, {}
+    with open(input_file, encoding='utf-8') as bibtex_file:
+        reader = bib_stream.BibReader(bibtex_file)
+        for position, entry in enumerate(reader):
+            first_positions.setdefault(entry['ID'], position)
+            last_positions[entry['ID']] = position
+            initial_count += 1
+    header = BibDatabase()
+    header.comments, header.preambles, header.strings = reader.comments, reader.preambles, reader.strings
+
+    writer = BibTexWriter()
+    entry_writer = BibTexWriter()
+    entry_writer.contents = ['entries']
+    spans = {} # ID -> (offset, length) of the entry in the spool
+    dois = {}
+    with tempfile.TemporaryFile() as spool:
+        with open(input_file, encoding='utf-8') as bibtex_file:
+            for position, entry in enumerate(bib_stream.BibReader(bibtex_file)):
+                if last_positions[entry['ID']] != position:
+                    continue
+                database = BibDatabase()
+                database.entries = [entry]
+                data = entry_writer.write(database).encode('utf-8')
+                spans[entry['ID']] = (spool.tell(), len(data))
+                spool.write(data)
+                doi = normalize_doi(entry.get('doi', ''))
+                if doi:
+                    dois[entry['ID']] = doi
+
+        # Same order as BibTexWriter: by ID (case insensitive), entries with the same key in order of first occurrence
+        ids = sorted(spans, key=lambda entry_id: (BibDatabase.entry_sort_key({'ID': entry_id}, writer.order_entries_by),
+                                                  first_positions[entry_id]))
+        with replace_file(output_file, encoding='utf-8') as bibtex_out:
+            bibtex_out.write(writer.write(header))
+            for i, entry_id in enumerate(ids):
+                offset, length = spans[entry_id]
+                spool.seek(offset)
+                bibtex_out.write((writer.entry_separator if i else '') + spool.read(length).decode('utf-8'))
+    return initial_count, initial_count - len(ids), len(ids), [(dois[entry_id], entry_id) for entry_id in ids if entry_id in dois]
+
+def write_cross_file_report(report_path, doi_files):
+    """
+    Writes the DOIs cited in several files to a csv file, one row per DOI and file.
+
+    Args:
+        report_path (str): The path of the csv file.
+        doi_files (dict): The (file, ID) citing each DOI, by DOI.
 
-def process_folder(input_folder, output_folder):
+    Returns:
+        int: The number of DOIs cited in several files.
+    """
+    count = 0
+    with open(report_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['DOI', 'Files', 'File', 'ID'])
+        for doi, citations in sorted(doi_files.items()):
+            files = {filename for filename, _ in citations}
+            if len(files) < 2:
+                continue
+            count += 1
+            for filename, entry_id in citations:
+                writer.writerow([doi, len(files), filename, entry_id])
+    return count
+
+def process_folder(input_folder, output_folder, workers=None, report_path=None):
+    """
+    Removes the duplicate entries of all the .bib files of a folder, processing the files in parallel, and reports
+    the DOIs cited in several files.
+
+    Args:
+        input_folder (str): The folder of the .bib files.
+        output_folder (str): The folder of the output .bib files.
+        workers (int): The number of processes (default: the number of CPUs).
+        report_path (str): The csv file of the DOIs cited in several files
+            (default: cross_file_duplicates.csv in the output folder).
+    """
     os.makedirs(output_folder, exist_ok=True)
-    bib_files = glob.glob(f"{input_folder}/*.bib")
+    bib_files = sorted(glob.glob(f"{input_folder}/*.bib"))
     total_files = len(bib_files)
+    report_path = report_path or os.path.join(output_folder, 'cross_file_duplicates.csv')
+    doi_files = defaultdict(list)
 
-    for i, input_file in enumerate(bib_files, start=1):
-        filename = os.path.basename(input_file)
-        output_file = os.path.join(output_folder, filename)
-        print(f'Processing file {i}/{total_files}: {filename}')
-        
-        initial_count, duplicates_count, final_count = remove_duplicates_from_bib_file(input_file, output_file)
-        print(f'Initial number of references: {initial_count}')
-        print(f'Number of duplicates: {duplicates_count}')
-        print(f'Final number of references: {final_count}')
-        print('-'*30)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        output_files = [os.path.join(output_folder, os.path.basename(input_file)) for input_file in bib_files]
+        results = executor.map(stream_deduplicated_bib_file, bib_files, output_files)
+        for i, (input_file, result) in enumerate(zip(bib_files, results), start=1):
+            filename = os.path.basename(input_file)
+            initial_count, duplicates_count, final_count, dois = result
+            print(f'Processed file {i}/{total_files}: {filename}')
+            print(f'Initial number of references: {initial_count}')
+            print(f'Number of duplicates: {duplicates_count}')
+            print(f'Final number of references: {final_count}')
+            print('-'*30)
+            for doi, entry_id in dois:
+                doi_files[doi].append((filename, entry_id))
+
+    cross_file_count = write_cross_file_report(report_path, doi_files)
+    print(f'Number of DOIs cited in several files: {cross_file_count} (see {report_path})')
 
 # Example usage:
 
-# Choose from 'file', 'file_complete', 'folder'
+# Choose from 'file', 'file_complete', 'file_clusters', 'folder'
 # If 'file', duplicate entries are entries with common ID
 # If 'file_complete', duplicate are entries with every field identical
+# If 'file_clusters', near-duplicates (same DOI, title, or first author, year and similar title) are reported in a csv file
 task = 'file'
 # Update this with the path to your .bib file or folder containing .bib files                       
 input = './data/cci/cci_papers_merged.bib'
 # Update this with the path to the file or folder where you want to save the new .bib files
 output = input[:-4] + '_no_duplicates.bib'
+# Number of processes in folder mode (None for the number of CPUs)
+workers = None
 
-if task == 'file':
-    remove_duplicates_from_bib_file(input, output)
-elif task == 'file_complete':
-    remove_complete_duplicates(input, output)
-elif task == 'folder':
-    process_folder(input, output)
+if __name__ == '__main__':
+    if task == 'file':
+        remove_duplicates_from_bib_file(input, output)
+    elif task == 'file_complete':
+        remove_complete_duplicates(input, output)
+    elif task == 'file_clusters':
+        report_duplicate_clusters(input, input[:-4] + '_duplicate_clusters.csv')
+    elif task == 'folder':
+        process_folder(input, output, workers)
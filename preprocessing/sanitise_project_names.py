@@ -1,8 +1,13 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from blob_store import replace_file
+
 def clean_project_field(input_path, output_path):
     with open(input_path, 'r', encoding='utf8') as input_file:
         lines = input_file.readlines()
     
-    with open(output_path, 'w', encoding='utf8') as output_file:
+    with replace_file(output_path, encoding='utf8') as output_file:
         for line in lines:
             if line.strip().startswith('project'):
                 key, value = line.split('=', 1)
@@ -0,0 +1,171 @@
+"""
+This script segments the report chapters (content txt files) into sections, from their headings,
+and saves a section tree with character offsets for each chapter, so that term counts and in-text
+citations can be attributed to sections at any depth (see analysis/report_sections.py).
+
+The headings are found in one pass per chapter:
+- Numbered headings at the start of a line, e.g. '10.2.3.1 Observed changes in precipitation'.
+  A numbered heading is kept if its first number is the chapter number (from the file name, e.g. wg1_ch10)
+  and if it follows the previous heading (next sibling, first child or next section of an ancestor,
+  allowing a few missed headings), so that numbers in the body text are not taken as headings.
+- Boxes, Cross-Chapter Boxes and FAQs at the start of a line, followed by '|' or ':' and their title,
+  e.g. 'Box 3.2 | Attribution of ...', 'Cross-Chapter Box 2.1: Paleoclimate ...', 'FAQ 10.1 | How ...'.
+
+Each section starts at its heading and ends at the next heading of the same or upper level (or at the
+end of the chapter). Boxes and FAQs are children of the section in which they appear, and end at the
+next heading, since the end of a box is not marked in the extracted text.
+
+The tree of each chapter is saved in a 'sections' folder of the reports directory (<name>.json), with the
+size and modification time of the chapter file, and chapters are only segmented again when they change.
+Each node has the following keys: id, kind ('chapter', 'section', 'box', 'cross-chapter box' or 'faq'),
+title, level (1 for the chapter, number of components for numbered sections, level of the parent + 1
+for boxes and FAQs), start, end (character offsets in the chapter text) and children.
+
+Usage:
+- Modify the directory_path variable according to your file locations.
+- Run `python ./preprocessing/segment_sections.py` from the repository root.
+"""
+
+import os
+import re
+import sys
+import json
+
+# Read the chapters whether they are txt files or split parts (see split_chapter_references.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'analysis'))
+from report_text import list_txt_files, file_signature, read_text
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from blob_store import replace_file
+
+SEGMENTER_VERSION = 1
+
+HEADING_REGEX = re.compile(
+    r'^[ \t]*(?:'
+    r'(?P<number>\d{1,2}(?:\.\d{1,2}){1,5})\.?[ \t]+(?P<title>[A-Z][^\n]{2,200})'
+    r'|(?P<kind>Cross-Chapter Box|Box|FAQ)[ \t]+(?P<box>(?:[A-Z]+[ .]?)?\d{1,2}(?:\.\d{1,2})*|[A-Z]{2,})[ \t]*[|:][ \t]*(?P<box_title>[^\n]{2,200})'
+    r')[ \t]*$', re.MULTILINE)
+
+CHAPTER_REGEX = re.compile(r'ch(\d+)')
+
+def chapter_number(file):
+    """Return the chapter number of a report file (e.g. 10 for wg1_ch10.txt), or None."""
+    match = CHAPTER_REGEX.search(file)
+    return int(match.group(1)) if match else None
+
+def is_next_heading(path, number, max_skip=3):
+    """
+    Checks if a section number can follow the previous section number.
+
+    Args:
+        path (tuple): The number of the previous section (empty at the start of the chapter).
+        number (tuple): The number of the candidate heading.
+        max_skip (int): The maximum increment between two sibling sections (to allow missed headings).
+
+    Returns:
+        bool: True if the heading is the first child, a next sibling or the next section of an ancestor.
+    """
+    if not path:
+        return len(number) == 2 and 1 <= number[1] <= max_skip
+    if number[:len(path)] == path and len(number) == len(path) + 1:
+        return 1 <= number[-1] <= max_skip
+    for i in range(1, len(path)):
+        if len(number) == i + 1 and number[:i] == path[:i] and 1 <= number[i] - path[i] <= max_skip:
+            return True
+    return False
+
+def segment_sections(text, chapter=None, name=None):
+    """
+    Segments a chapter text into a section tree.
+
+    Args:
+        text (str): The chapter text.
+        chapter (int): The chapter number, or None to take the first number of the first numbered heading.
+        name (str): The id of the root node (default: the chapter number).
+
+    Returns:
+        dict: The root node of the section tree.
+    """
+    root = {'id': name or str(chapter), 'kind': 'chapter', 'title': None, 'level': 1,
+            'start': 0, 'end': len(text), 'children': []}
+    stack = [root]
+    path = ()
+    seen_boxes = set()
+
+    def close(is_closed, end):
+        while len(stack) > 1 and is_closed(stack[-1]):
+            stack.pop()['end'] = end
+
+    for match in HEADING_REGEX.finditer(text):
+        if match.group('number'):
+            number = tuple(int(part) for part in match.group('number').split('.'))
+            if chapter is not None and number[0] != chapter:
+                continue
+            if not is_next_heading(path, number):
+                continue
+            path = number
+            # Close the open boxes and the sections of the same or lower level
+            close(lambda node: node['kind'] != 'section' or node['level'] >= len(number), match.start())
+            node = {'id': match.group('number'), 'kind': 'section', 'title': match.group('title').strip(),
+                    'level': len(number)}
+        else:
+            kind = match.group('kind').lower()
+            box_id = f"{match.group('kind')} {match.group('box')}"
+            box_chapter = match.group('box').split('.')[0]
+            if box_id in seen_boxes or (kind != 'cross-chapter box' and chapter is not None and box_chapter.isdigit()
+                                        and int(box_chapter) != chapter):
+                continue
+            seen_boxes.add(box_id)
+            # Close the open box
+            close(lambda node: node['kind'] != 'section', match.start())
+            node = {'id': box_id, 'kind': kind, 'title': match.group('box_title').strip(),
+                    'level': stack[-1]['level'] + 1}
+        node.update({'start': match.start(), 'end': len(text), 'children': []})
+        stack[-1]['children'].append(node)
+        stack.append(node)
+
+    return root
+
+def default_sections_path(directory_path):
+    """Return the default location of the section trees of a reports directory."""
+    return os.path.join(directory_path, 'sections')
+
+def segment_folder(directory_path, sections_path=None):
+    """
+    Segments the txt files of a directory, skipping the files whose section tree is up to date.
+
+    Args:
+        directory_path (str): The directory containing the chapter txt files.
+        sections_path (str): The directory of the section trees (default: 'sections' folder of directory_path).
+
+    Returns:
+        str: The directory of the section trees.
+    """
+    sections_path = sections_path or default_sections_path(directory_path)
+    os.makedirs(sections_path, exist_ok=True)
+
+    files = sorted(list_txt_files(directory_path))
+    for i, file in enumerate(files):
+        target_path = os.path.join(sections_path, file.replace('.txt', '.json'))
+        size, mtime_ns = file_signature(directory_path, file)
+        signature = {'size': size, 'mtime_ns': mtime_ns, 'version': SEGMENTER_VERSION}
+        if os.path.exists(target_path):
+            with open(target_path, 'r', encoding='utf-8') as f:
+                if json.load(f)['signature'] == signature:
+                    continue
+        try:
+            text = read_text(directory_path, file)
+        except Exception as e:
+            print(f"Error segmenting {file}: {e}")
+            continue
+        tree = segment_sections(text, chapter_number(file), file.replace('.txt', ''))
+        with replace_file(target_path, encoding='utf-8') as f:
+            json.dump({'file': file, 'signature': signature, 'tree': tree}, f, indent=1)
+        print(f"Segmented ({i+1}/{len(files)}): {file}, {len(tree['children'])} top-level sections")
+
+    print("Segmentation completed.")
+    return sections_path
+
+
+if __name__ == '__main__':
+    directory_path = './data/reports/content'
+    segment_folder(directory_path)
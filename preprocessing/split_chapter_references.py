@@ -1,12 +1,69 @@
+"""
+This script splits the report txt files into content (before the last "References") and references
+(from the last "References").
+
+Two modes are available:
+- 'copy': the content and references of each file are written to new txt files in the target folders.
+- 'index': nothing is copied, the byte range of the content and references of each file in the original
+  txt file is recorded in a split index (split.json) in each target folder. The parts are read from the
+  original files by analysis/report_text.py (list_txt_files, read_text, open_bytes), as memory-mapped slices.
+
+Usage:
+- Modify the source_folder, before_references_folder, after_references_folder and mode variables.
+- Run `python ./preprocessing/split_chapter_references.py` from the repository root.
+"""
+
 import os
+import sys
+import json
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'analysis'))
+from blob_store import replace_file
+from report_text import SPLIT_INDEX_NAME
+
+def split_page_starts(source_pages_path, reference_index, before_pages_path, after_pages_path):
+    # Split the page sidecar (<name>.pages.bin, written by pdf_to_txt.py) of a file like its content
+    # Both parts keep all the pages so that page numbers stay the ones of the report: pages after the
+    # content start after its end, pages before the references start at the beginning of the references
+    page_starts = np.fromfile(source_pages_path, dtype='<i8')
+    with replace_file(before_pages_path, 'wb') as before_file:
+        page_starts.tofile(before_file)
+    with replace_file(after_pages_path, 'wb') as after_file:
+        np.maximum(page_starts - reference_index, 0).tofile(after_file)
+
+def split_entries(file_path):
+    # Byte ranges of the content and references of a file in index mode, or None if there is no "References"
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    stat = os.stat(file_path)
+    # Decode the content as open(..., 'r') does, for the character offset of the references
+    content = data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+    reference_index = content.rfind("References")
+    if reference_index == -1:
+        return None
+    reference_byte = data.rfind(b"References")
+    signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    before = {'start': 0, 'end': reference_byte, 'start_char': 0, **signature}
+    after = {'start': reference_byte, 'end': len(data), 'start_char': reference_index, **signature}
+    return before, after
+
+def write_split_index(folder, source_folder, part, entries):
+    split_index = {'source_folder': os.path.relpath(source_folder, folder), 'part': part, 'files': entries}
+    with open(os.path.join(folder, SPLIT_INDEX_NAME), 'w', encoding='utf-8') as f:
+        json.dump(split_index, f, indent=1)
 
-def process_files(source_folder, before_references_folder, after_references_folder):
+def process_files(source_folder, before_references_folder, after_references_folder, mode='copy'):
     # Ensure target folders exist
     if not os.path.exists(before_references_folder):
         os.makedirs(before_references_folder)
     if not os.path.exists(after_references_folder):
         os.makedirs(after_references_folder)
 
+    # Split index entries of the content and references parts (index mode)
+    before_entries = {}
+    after_entries = {}
+
     files_processed = 0
     files_with_references = 0
     files_without_references = 0
@@ -17,6 +74,17 @@ def process_files(source_folder, before_references_folder, after_references_fold
         if filename.endswith(".txt"):
             try:
                 print(f"Processing file: {filename}")
+                if mode == 'index':
+                    entries = split_entries(os.path.join(source_folder, filename))
+                    if entries is None:
+                        print(f"No 'References' tag found in {filename}.")
+                        files_without_references += 1
+                        continue
+                    before_entries[filename], after_entries[filename] = entries
+                    files_with_references += 1
+                    files_processed += 1
+                    continue
+
                 with open(os.path.join(source_folder, filename), 'r', encoding='utf-8') as file:
                     content = file.read()
                 
@@ -29,12 +97,19 @@ def process_files(source_folder, before_references_folder, after_references_fold
                     files_with_references += 1
 
                     # Write content before "References" to a new file in before_references_folder
-                    with open(os.path.join(before_references_folder, filename), 'w', encoding='utf-8') as new_file_before:
+                    with replace_file(os.path.join(before_references_folder, filename), encoding='utf-8') as new_file_before:
                         new_file_before.write(content_before_references)
                     
                     # Write content after "References" to a new file in after_references_folder
-                    with open(os.path.join(after_references_folder, filename), 'w', encoding='utf-8') as new_file_after:
+                    with replace_file(os.path.join(after_references_folder, filename), encoding='utf-8') as new_file_after:
                         new_file_after.write(content_after_references)
+
+                    # Split the page start offsets, if available
+                    pages_filename = os.path.splitext(filename)[0] + '.pages.bin'
+                    if os.path.exists(os.path.join(source_folder, pages_filename)):
+                        split_page_starts(os.path.join(source_folder, pages_filename), reference_index,
+                                          os.path.join(before_references_folder, pages_filename),
+                                          os.path.join(after_references_folder, pages_filename))
                 else:
                     print(f"No 'References' tag found in {filename}.")
                     files_without_references += 1
@@ -48,6 +123,16 @@ def process_files(source_folder, before_references_folder, after_references_fold
                 errors += 1
                 continue
 
+    if mode == 'index':
+        write_split_index(before_references_folder, source_folder, 'content', before_entries)
+        write_split_index(after_references_folder, source_folder, 'references', after_entries)
+    else:
+        # The copies replace the parts of a previous run in index mode
+        for folder in (before_references_folder, after_references_folder):
+            if os.path.exists(os.path.join(folder, SPLIT_INDEX_NAME)):
+                print(f"Removing the split index of {folder}")
+                os.remove(os.path.join(folder, SPLIT_INDEX_NAME))
+
     # Display summary of actions
     print(f"Summary of actions:")
     print(f"Files processed: {files_processed}")
@@ -55,8 +140,10 @@ def process_files(source_folder, before_references_folder, after_references_fold
     print(f"Files without 'References': {files_without_references}")
     print(f"Errors encountered: {errors}")
 
-# Example usage
-source_folder = './data/reports/txt'
-before_references_folder = './data/reports/content'
-after_references_folder = './data/reports/references'
-process_files(source_folder, before_references_folder, after_references_folder)
+if __name__ == '__main__':
+    repaired = False # Split the repaired text (utils/text_repair.py) instead of the extracted text
+    source_folder = './data/reports/repaired' if repaired else './data/reports/txt'
+    before_references_folder = './data/reports/content'
+    after_references_folder = './data/reports/references'
+    mode = 'copy' # Choose between 'copy' (write the content and references files) or 'index' (write a split index)
+    process_files(source_folder, before_references_folder, after_references_folder, mode)
@@ -0,0 +1,85 @@
+import os
+import sys
+import random
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'preprocessing'))
+from bib_index import normalize_text, trigrams, first_author_surname
+from bib_dedup import UnionFind, find_duplicate_clusters, normalize_doi, jaccard
+
+def components(n, pairs):
+    # Connected components by graph traversal, as lists of sorted indices
+    neighbours = {i: set() for i in range(n)}
+    for i, j in pairs:
+        neighbours[i].add(j)
+        neighbours[j].add(i)
+    seen, result = set(), []
+    for i in range(n):
+        if i in seen:
+            continue
+        stack, component = [i], []
+        seen.add(i)
+        while stack:
+            k = stack.pop()
+            component.append(k)
+            for other in neighbours[k] - seen:
+                seen.add(other)
+                stack.append(other)
+        result.append(sorted(component))
+    return result
+
+def test_union_find_matches_graph_components():
+    rng = random.Random(0)
+    for _ in range(50):
+        n = rng.randint(1, 60)
+        pairs = [(rng.randrange(n), rng.randrange(n)) for _ in range(rng.randint(0, n))]
+        union_find = UnionFind(n)
+        for i, j in pairs:
+            union_find.union(i, j)
+        groups = {}
+        for i in range(n):
+            groups.setdefault(union_find.find(i), []).append(i)
+        assert sorted(groups.values()) == components(n, pairs)
+        assert all(union_find.size[root] == len(members) for root, members in groups.items())
+
+def is_duplicate(a, b, title_threshold=0.9):
+    # Pairwise definition of a duplicate, compared on all pairs
+    if a == b:
+        return True
+    if normalize_doi(a.get('doi', '')) and normalize_doi(a.get('doi', '')) == normalize_doi(b.get('doi', '')):
+        return True
+    title_a, title_b = normalize_text(a.get('title', '')), normalize_text(b.get('title', ''))
+    if len(title_a) >= 20 and title_a == title_b:
+        return True
+    surname = first_author_surname(a.get('author', ''))
+    return bool(surname and title_a and title_b and a.get('year') and surname == first_author_surname(b.get('author', ''))
+                and a['year'] == b['year'] and jaccard(trigrams(title_a), trigrams(title_b)) >= title_threshold)
+
+def random_entries(rng, n):
+    titles = ['Global warming of the upper ocean since 1950', 'Global warming of the upper ocean since 1955',
+              'Arctic sea ice decline', 'Ocean heat', 'Aerosol forcing of precipitation over land areas']
+    entries = []
+    for i in range(n):
+        entry = {'ENTRYTYPE': 'article', 'ID': f'e{rng.randrange(n)}', 'title': rng.choice(titles),
+                 'author': rng.choice(['Smith, A. and Jones, B.', 'A. Smith', 'Zhang, L.']), 'year': rng.choice(['2001', '2002'])}
+        if rng.random() < 0.5:
+            entry['doi'] = rng.choice(['10.1000/A', 'https://doi.org/10.1000/a', '10.1000/b', 'not a doi'])
+        entries.append(entry)
+    return entries
+
+def test_clusters_match_pairwise_comparison():
+    rng = random.Random(1)
+    for _ in range(30):
+        entries = random_entries(rng, rng.randint(2, 25))
+        pairs = [(i, j) for i in range(len(entries)) for j in range(i + 1, len(entries)) if is_duplicate(entries[i], entries[j])]
+        expected = [component for component in components(len(entries), pairs) if len(component) > 1]
+        assert [cluster['indices'] for cluster in find_duplicate_clusters(entries)] == expected
+
+def test_cluster_reasons():
+    entries = [
+        {'ID': 'a', 'title': 'Arctic sea ice decline', 'doi': '10.1000/X'},
+        {'ID': 'b', 'title': 'Something else entirely here', 'doi': 'https://doi.org/10.1000/x'},
+        {'ID': 'c', 'title': 'Something else entirely here'},
+        {'ID': 'd', 'title': 'Ocean'},
+        {'ID': 'd', 'title': 'Ocean'},
+    ]
+    clusters = find_duplicate_clusters(entries)
+    assert clusters == [{'indices': [0, 1, 2], 'reasons': ['doi', 'title']}, {'indices': [3, 4], 'reasons': ['exact']}]
@@ -0,0 +1,60 @@
+import io
+import os
+import sys
+import bibtexparser
+from bibtexparser.bparser import BibTexParser
+from bibtexparser.customization import convert_to_unicode
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import bib_stream
+
+BIB = r"""Chapter 2 references, exported 2021.
+@comment{jabref-meta: databaseType:bibtex;}
+@string{grl = "Geophys. Res. Lett."}
+@STRING(nat = {Nature})
+@preamble{"\newcommand{\noop}[1]{}"}
+
+@Article{M{\"u}ller2001,
+  Author = {M{\"u}ller, A. and Garc{\'i}a, B.},
+  title = "The {CO2} record of {\AA}ngstr{\"o}m",
+  journal = grl,
+  year = 2001,
+  month = jan,
+  doi = {10.1029/2001GL{\_}1},
+  title = {Repeated title is ignored},
+}
+@book( zhang2010 ,
+  title = {Ocean "heat" {content}} # " and " # nat,
+  year = {2010}
+)
+@misc{nitta2015, note = {Nested {braces {inside}} values}, url = {https://example.org/a,b}}
+@software{ignored2020, title = {Non-standard type}}
+@article{broken2012, title = {Missing closing brace}
+@article{last2020, title = {Last entry}, doi = "10.1000/last"}
+Trailing text.
+"""
+
+def with_bibtexparser(decode):
+    parser = BibTexParser(common_strings=True)
+    if decode:
+        parser.customization = convert_to_unicode
+    return bibtexparser.loads(BIB, parser=parser)
+
+def summary(database):
+    entries = [list(entry.items()) for entry in database.entries]
+    return entries, database.comments, database.preambles, dict(database.strings)
+
+def test_same_database_as_bibtexparser():
+    for decode in (False, True):
+        expected = summary(with_bibtexparser(decode))
+        assert expected[0]
+        assert summary(bib_stream.loads(BIB, decode)) == expected
+        # Entries split across chunks
+        for chunk_size in (1, 7, 64):
+            assert summary(bib_stream.load(io.StringIO(BIB), decode, chunk_size=chunk_size)) == expected
+
+def test_iter_bib_yields_the_entries_in_file_order(tmp_path):
+    path = tmp_path / 'wg1_ch2.bib'
+    path.write_text(BIB, encoding='utf-8')
+    entries = [entry['ID'] for entry in bib_stream.iter_bib(str(path))]
+    assert entries == [entry['ID'] for entry in with_bibtexparser(False).entries]
+    assert bib_stream.decode_value(r'10.1029/2001GL{\_}1') == '10.1029/2001GL_1'
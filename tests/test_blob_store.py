@@ -0,0 +1,46 @@
+import os
+import sys
+import shutil
+import pytest
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'preprocessing'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from blob_store import BlobStore, replace_file
+from remove_duplicates import process_folder, remove_duplicates_from_bib_file
+from test_remove_duplicates import BIB, read_entries
+
+@pytest.mark.parametrize('link_mode', ['symlink', 'hardlink'])
+def test_writers_replace_deduped_files(tmp_path, link_mode):
+    for folder in ('references', 'references_copy'):
+        os.makedirs(tmp_path / folder)
+        (tmp_path / folder / 'a.bib').write_text(BIB, encoding='utf-8')
+    shutil.copy(tmp_path / 'references' / 'a.bib', tmp_path / 'references' / 'b.bib')
+    store = BlobStore(str(tmp_path / 'blobs'), link_mode)
+    for folder in ('references', 'references_copy'):
+        store.dedupe(str(tmp_path / folder))
+    assert store.stats()[1] == 1
+
+    # In place, in the deduplicated folders
+    process_folder(str(tmp_path / 'references'), str(tmp_path / 'references'), workers=1)
+    remove_duplicates_from_bib_file(str(tmp_path / 'references_copy' / 'a.bib'), str(tmp_path / 'references_copy' / 'a.bib'))
+
+    assert store.verify() == []
+    for path in (tmp_path / 'references' / 'a.bib', tmp_path / 'references' / 'b.bib', tmp_path / 'references_copy' / 'a.bib'):
+        assert list(read_entries(path)) == ['jones2005', 'smith2001', 'Smith2001', 'zhang2010']
+        assert not os.path.islink(path)
+    assert store.lookup(str(tmp_path / 'references' / 'a.bib')) is None
+
+def test_replace_file_keeps_blob_and_cleans_up(tmp_path):
+    (tmp_path / 'a.txt').write_text('stored', encoding='utf-8')
+    store = BlobStore(str(tmp_path / 'blobs'))
+    store.put(str(tmp_path / 'a.txt'))
+
+    with replace_file(str(tmp_path / 'a.txt'), encoding='utf-8') as f:
+        f.write('rewritten')
+    with pytest.raises(RuntimeError):
+        with replace_file(str(tmp_path / 'a.txt'), encoding='utf-8') as f:
+            f.write('interrupted')
+            raise RuntimeError
+
+    assert (tmp_path / 'a.txt').read_text(encoding='utf-8') == 'rewritten'
+    assert sorted(os.listdir(tmp_path)) == ['a.txt', 'blobs']
+    assert store.verify() == []
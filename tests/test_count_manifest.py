@@ -0,0 +1,64 @@
+import os
+import sys
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'analysis'))
+from term_matcher import TermMatcher
+from count_manifest import update_counts
+
+def make_counter(folder, calls, failing=()):
+    # Count function of terms_in_reports.py, recording the (documents, terms) of each call
+    def count(documents, search_terms):
+        calls.append((list(documents), list(search_terms)))
+        matcher = TermMatcher(search_terms)
+        counts = np.zeros((len(search_terms), len(documents)), dtype=np.uint32)
+        failed = np.zeros(len(documents), dtype=bool)
+        for column, file in enumerate(documents):
+            if file in failing:
+                failed[column] = True
+            else:
+                counts[:, column] = matcher.count_list((folder / file).read_text(encoding='utf-8'))
+        return counts, failed
+    return count
+
+def run(folder, documents, search_terms, failing=()):
+    calls = []
+    counts, failed, changed = update_counts(str(folder), documents, search_terms, str(folder / 'manifest.json'),
+                                            make_counter(folder, calls, failing))
+    expected, _ = make_counter(folder, [])(documents, search_terms)
+    assert (counts[:, ~failed] == expected[:, ~failed]).all()
+    return calls, failed, changed
+
+def test_only_changed_cells_are_recounted(tmp_path):
+    (tmp_path / 'a.txt').write_text('sea ice and sea level', encoding='utf-8')
+    (tmp_path / 'b.txt').write_text('sea level rise', encoding='utf-8')
+    documents = ['a.txt', 'b.txt']
+    terms = {'sea ice': [], 'sea level': ['sea-level']}
+
+    assert run(tmp_path, documents, terms)[0] == [(documents, list(terms))]
+    calls, _, changed = run(tmp_path, documents, terms)
+    assert (calls, changed) == ([], False)
+
+    # Same content with a new modification time: hashed again but not recounted
+    os.utime(tmp_path / 'a.txt', ns=(0, 0))
+    assert run(tmp_path, documents, terms)[0] == []
+
+    # Modified file: recounted for all the terms
+    (tmp_path / 'b.txt').write_text('sea ice, sea-level', encoding='utf-8')
+    assert run(tmp_path, documents, terms)[0] == [(['b.txt'], list(terms))]
+
+    # New and modified terms: counted in all the files
+    terms = {'sea ice': ['sea-ice'], 'sea level': ['sea-level'], 'rise': []}
+    assert run(tmp_path, documents, terms)[0] == [(documents, ['sea ice', 'rise'])]
+
+    # Order of the columns and rows changed, a file and a term removed: nothing to count
+    terms = {'rise': [], 'sea ice': ['sea-ice']}
+    calls, _, changed = run(tmp_path, ['b.txt'], terms)
+    assert (calls, changed) == ([], True)
+
+def test_failed_files_are_recounted(tmp_path):
+    (tmp_path / 'a.txt').write_text('sea ice', encoding='utf-8')
+    terms = {'sea ice': []}
+    _, failed, _ = run(tmp_path, ['a.txt'], terms, failing={'a.txt'})
+    assert failed.tolist() == [True]
+    calls, failed, _ = run(tmp_path, ['a.txt'], terms)
+    assert (calls, failed.tolist()) == ([(['a.txt'], ['sea ice'])], [False])
@@ -0,0 +1,45 @@
+import os
+import sys
+import time
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'preprocessing'))
+from crossref_stub import serve_in_thread
+from crossref_client import CrossrefClient
+
+WORKS = [{'DOI': f'10.1000/w{i}', 'title': [f'Work {i}']} for i in range(20)]
+
+def fetch_all(client, dois):
+    """Fetch the works concurrently, return them and the number of sessions opened (one per pool thread used)."""
+    async def run():
+        async with client:
+            works = await asyncio.gather(*(client.work(doi) for doi in dois))
+            return works, len(client._sessions)
+    return asyncio.run(run())
+
+def test_transient_errors_are_retried():
+    server = serve_in_thread(WORKS, fail_rate=0.4, seed=1)
+    try:
+        client = CrossrefClient(server.url, concurrency=4, page_concurrency=2, rate=None, max_retries=20, backoff=0.001)
+        works, sessions = fetch_all(client, [work['DOI'] for work in WORKS])
+    finally:
+        server.shutdown()
+
+    assert [work['DOI'] for work in works] == [work['DOI'] for work in WORKS]
+    # Some requests failed (429/503 with Retry-After) and were sent again
+    assert server.requests == client.request_count > len(WORKS)
+    assert 1 <= sessions <= 4 + 2
+    assert client._sessions == []
+
+def test_requests_are_rate_limited():
+    server = serve_in_thread(WORKS, fail_rate=0.2, seed=2)
+    try:
+        client = CrossrefClient(server.url, concurrency=8, rate=50, burst=1, max_retries=20, backoff=0.001)
+        start = time.monotonic()
+        fetch_all(client, [work['DOI'] for work in WORKS])
+        elapsed = time.monotonic() - start
+    finally:
+        server.shutdown()
+
+    # Retries take tokens too: after the first request, at most rate requests per second
+    assert server.requests > len(WORKS)
+    assert elapsed >= (server.requests - 1) / 50 * 0.9
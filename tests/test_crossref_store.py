@@ -0,0 +1,33 @@
+import os
+import sys
+import json
+import sqlite3
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'preprocessing'))
+from crossref_store import build_store, CrossrefStore
+
+def write_dump(path, works):
+    with open(path, 'w', encoding='utf-8') as f:
+        for work in works:
+            f.write(json.dumps(work) + '\n')
+
+def test_replaced_works_keep_one_title_row(tmp_path):
+    store_path = str(tmp_path / 'store.sqlite')
+    write_dump(tmp_path / 'a.jsonl', [
+        {'DOI': '10.1/a', 'title': ['Impact of Arctic wetlands on methane']},
+        {'DOI': '10.1/A', 'title': ['Impact of Arctic wetlands on methane']},
+        {'DOI': '10.1/b', 'title': ['Sea ice thickness from radar altimetry']},
+    ])
+    write_dump(tmp_path / 'b.jsonl', [
+        {'DOI': '10.1/a', 'title': ['Arctic wetlands and methane emissions']},
+        {'DOI': '10.1/b', 'title': ['Sea ice thickness from radar altimetry']},
+    ])
+    build_store([str(tmp_path / 'a.jsonl')], store_path)
+    build_store([str(tmp_path / 'b.jsonl')], store_path)
+
+    connection = sqlite3.connect(store_path)
+    assert connection.execute('SELECT doi FROM titles ORDER BY doi').fetchall() == [('10.1/a',), ('10.1/b',)]
+    connection.close()
+    store = CrossrefStore(store_path)
+    assert [work['DOI'] for work in store.find_titles('Smith (2020) Arctic wetlands and methane emissions. Nature')] == ['10.1/a']
+    assert store.find_titles('Smith (2019) Impact of Arctic wetlands on methane. Nature') == []
+    store.close()
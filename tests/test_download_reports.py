@@ -0,0 +1,123 @@
+import os
+import sys
+import hashlib
+import threading
+import pytest
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'preprocessing'))
+from download_reports import download_all, download_file, make_session
+from blob_store import BlobStore
+
+def serve_files(files):
+    """
+    Serve files ({name: bytes}) with ETag, conditional (If-None-Match) and Range (If-Range) requests.
+    server.requests records the (path, status) of each request, server.cut_after truncates the next response.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            data = files[self.path.lstrip('/')]
+            etag = '"' + hashlib.sha256(data).hexdigest()[:16] + '"'
+            start = 0
+            if self.headers.get('If-None-Match') == etag:
+                status = 304
+            elif self.headers.get('Range') and self.headers.get('If-Range') == etag:
+                status = 206
+                start = int(self.headers['Range'].split('=')[1].rstrip('-'))
+            else:
+                status = 200
+            server.requests.append((self.path, status))
+            self.send_response(status)
+            self.send_header('ETag', etag)
+            if status == 304:
+                self.end_headers()
+                return
+            body = data[start:]
+            self.send_header('Content-Length', str(len(body)))
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+            self.end_headers()
+            if server.cut_after is not None:
+                body, server.cut_after = body[:server.cut_after], None
+                self.close_connection = True
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.requests = []
+    server.cut_after = None
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+FILES = {'wg1_ch1.pdf': b'%PDF chapter 1 ' * 1000, 'wg1_ch2.pdf': b'%PDF chapter 2 ' * 1000}
+
+def manifest(server, folder):
+    return [{'url': f'{server.url}/{name}', 'path': os.path.join(folder, name)} for name in FILES]
+
+def test_unchanged_files_are_not_stored_again(tmp_path):
+    server = serve_files(FILES)
+    store = BlobStore(str(tmp_path / 'blobs'))
+    puts = []
+    put = store.put
+    store.put = lambda path, sha256=None: puts.append(path) or put(path, sha256)
+    try:
+        state_file = str(tmp_path / 'state.json')
+        first = download_all(manifest(server, str(tmp_path / 'pdf')), state_file, 2, store)
+        second = download_all(manifest(server, str(tmp_path / 'pdf')), state_file, 2, store)
+    finally:
+        server.shutdown()
+
+    assert (first['downloaded'], second['unchanged']) == (2, 2)
+    assert len(puts) == 2
+    assert store.verify() == []
+    assert os.path.islink(tmp_path / 'pdf' / 'wg1_ch1.pdf')
+
+def test_interrupted_download_is_resumed(tmp_path):
+    files = dict(FILES)
+    server = serve_files(files)
+    session = make_session(1)
+    item = manifest(server, str(tmp_path))[0]
+    try:
+        server.cut_after = 5120
+        with pytest.raises(requests.RequestException):
+            download_file(session, item, None, chunk_size=1024)
+        assert os.path.getsize(item['path'] + '.part') == 5120
+        status, transferred, file_state = download_file(session, item, None)
+    finally:
+        session.close()
+        server.shutdown()
+
+    data = files['wg1_ch1.pdf']
+    assert (status, transferred, file_state['size']) == ('resumed', len(data) - 5120, len(data))
+    assert [status for _, status in server.requests] == [200, 206]
+    with open(item['path'], 'rb') as f:
+        assert f.read() == data
+    assert not os.path.exists(item['path'] + '.part') and not os.path.exists(item['path'] + '.part.json')
+
+def test_part_of_another_version_is_downloaded_again(tmp_path):
+    files = dict(FILES)
+    server = serve_files(files)
+    session = make_session(1)
+    item = manifest(server, str(tmp_path))[0]
+    try:
+        server.cut_after = 5120
+        with pytest.raises(requests.RequestException):
+            download_file(session, item, None, chunk_size=1024)
+        # The file changed on the server: If-Range does not match, the whole file is sent (200)
+        files['wg1_ch1.pdf'] = b'%PDF chapter 1, revised ' * 1000
+        status, transferred, file_state = download_file(session, item, None)
+        # Unchanged since: answered with 304 from the ETag
+        unchanged = download_file(session, item, file_state)
+    finally:
+        session.close()
+        server.shutdown()
+
+    data = files['wg1_ch1.pdf']
+    assert (status, transferred, file_state['size']) == ('downloaded', len(data), len(data))
+    assert [status for _, status in server.requests] == [200, 200, 304]
+    assert unchanged == ('unchanged', 0, file_state)
+    with open(item['path'], 'rb') as f:
+        assert f.read() == data
@@ -0,0 +1,45 @@
+import os
+import sys
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'preprocessing'))
+from crossref_stub import serve_in_thread
+from crossref_client import CrossrefClient
+from http_cache import HttpCache
+import get_references
+
+WORKS = [{'DOI': '10.1000/abc1', 'title': ['Ocean colour trends'], 'author': [{'given': 'A', 'family': 'Smith'}],
+          'published': {'date-parts': [[2001]]}, 'container-title': ['J']}]
+PAGES = {
+    'landing': '<html><head><meta name="citation_doi" content="10.1000/abc1"></head></html>',
+    'nodoi': '<html><body>No identifier here</body></html>',
+}
+
+def resolve_all(server, cache, references):
+    async def run():
+        async with CrossrefClient(server.url, rate=None) as client:
+            results = []
+            for reference_id, content in enumerate(references, 1):
+                entry, mode, log = await get_references.resolve_reference(client, cache, reference_id, len(references), content, None)
+                results.append((entry, mode, log.messages))
+            return results
+    return asyncio.run(run())
+
+def test_warm_run_logs_like_cold_run(tmp_path):
+    server = serve_in_thread(WORKS, PAGES)
+    try:
+        references = [
+            f'{server.url}/pages/landing',
+            f'{server.url}/pages/nodoi Ocean colour trends',
+            '10.1000/missing',
+        ]
+        cache = HttpCache(str(tmp_path / 'cache.sqlite'))
+        cold = resolve_all(server, cache, references)
+        requests = server.requests
+        warm = resolve_all(server, cache, references)
+        cache.close()
+    finally:
+        server.shutdown()
+
+    assert server.requests == requests
+    assert warm == cold
+    assert ('info', 'No DOI found in webpage content.') in cold[1][2]
@@ -0,0 +1,66 @@
+import os
+import sys
+import shutil
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'preprocessing'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import bib_stream
+from remove_duplicates import remove_duplicates_from_bib_file, stream_deduplicated_bib_file
+
+BIB = """@comment{Chapter 2}
+
+@string{grl = {Geophysical Research Letters}}
+
+@article{zhang2010,
+  title = {Arctic amplification},
+  journal = grl,
+  year = {2010}
+}
+
+@article{smith2001,
+  title = {Ocean colour trends},
+  year = {2001},
+  doi = {10.1000/abc1}
+}
+
+@article{jones2005,
+  title = {Sea ice thickness},
+  year = {2005}
+}
+
+@article{smith2001,
+  title = {Ocean colour trends (corrected)},
+  year = {2001},
+  doi = {10.1000/ABC1}
+}
+
+@article{Smith2001,
+  title = {Another key differing by case},
+  year = {2001}
+}
+"""
+
+def read_entries(path):
+    with open(path, encoding='utf-8') as f:
+        return {entry['ID']: dict(entry) for entry in bib_stream.load(f).entries}
+
+def test_stream_writes_like_file_mode(tmp_path):
+    input_file = tmp_path / 'wg1_ch2.bib'
+    input_file.write_text(BIB, encoding='utf-8')
+    file_counts = remove_duplicates_from_bib_file(str(input_file), str(tmp_path / 'file.bib'))
+    counts = stream_deduplicated_bib_file(str(input_file), str(tmp_path / 'stream.bib'))
+
+    assert counts[:3] == file_counts == (5, 1, 4)
+    assert counts[3] == [('10.1000/abc1', 'smith2001')]
+    assert (tmp_path / 'stream.bib').read_text(encoding='utf-8') == (tmp_path / 'file.bib').read_text(encoding='utf-8')
+    assert read_entries(tmp_path / 'stream.bib')['smith2001']['title'] == 'Ocean colour trends (corrected)'
+
+def test_stream_in_place(tmp_path):
+    input_file = tmp_path / 'wg1_ch2.bib'
+    input_file.write_text(BIB, encoding='utf-8')
+    shutil.copy(input_file, tmp_path / 'copy.bib')
+    stream_deduplicated_bib_file(str(tmp_path / 'copy.bib'), str(tmp_path / 'expected.bib'))
+    stream_deduplicated_bib_file(str(input_file), str(input_file))
+
+    assert input_file.read_text(encoding='utf-8') == (tmp_path / 'expected.bib').read_text(encoding='utf-8')
+    assert list(read_entries(input_file)) == ['jones2005', 'smith2001', 'Smith2001', 'zhang2010']
+    assert sorted(os.listdir(tmp_path)) == ['copy.bib', 'expected.bib', 'wg1_ch2.bib']
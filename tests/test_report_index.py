@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+import random
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'analysis'))
+from term_matcher import TermMatcher
+from report_index import ReportIndex, build_index, index_is_stale
+
+SEARCH_TERMS = {
+    'sea ice': ['sea-ice', 'Sea ice extent'],
+    'lake': ['lakes', 'LAKE ice'],
+    'water vapour': ['water vapor', 'vapour'],
+    'CO2': ['CO₂', 'carbon dioxide'],
+    'El Niño': ['ENSO', 'el nino'],
+    'CMIP6': ['CMIP', 'cmip6-era'],
+}
+WORDS = ['sea', 'ice', 'sea-ice', 'extent', 'lakes', 'Lake', 'water', 'vapor', 'Vapour', 'CO2', 'CO₂', 'carbon',
+         'dioxide', 'El', 'Niño', 'nino', 'ENSO', 'CMIP6', 'cmip', '-era', 'the', '(', '.', '\n']
+
+def write_reports(folder, n_files=5, seed=0):
+    rng = random.Random(seed)
+    for i in range(n_files):
+        words = rng.choices(WORDS, k=2000)
+        text = ''.join(word + rng.choice([' ', '', ', ']) for word in words)
+        (folder / f'wg1_ch{i + 1}.txt').write_text(text, encoding='utf-8')
+
+def full_scan(folder, files):
+    matcher = TermMatcher(SEARCH_TERMS)
+    return np.array([matcher.count_list((folder / file).read_text(encoding='utf-8')) for file in files]).T
+
+def test_index_counts_match_full_scan(tmp_path):
+    write_reports(tmp_path)
+    with ReportIndex(build_index(str(tmp_path))) as index:
+        counts = index.count_terms(SEARCH_TERMS)
+        files = index.files
+    assert counts.sum() > 0
+    assert (counts == full_scan(tmp_path, files)).all()
+
+def test_index_is_stale_when_a_file_changes(tmp_path):
+    write_reports(tmp_path, n_files=2)
+    build_index(str(tmp_path))
+    assert not index_is_stale(str(tmp_path))
+    time.sleep(0.01)
+    (tmp_path / 'wg1_ch2.txt').write_text('sea ice', encoding='utf-8')
+    assert index_is_stale(str(tmp_path))
+    (tmp_path / 'wg1_ch3.txt').write_text('lake', encoding='utf-8')
+    with ReportIndex(build_index(str(tmp_path))) as index:
+        assert not index_is_stale(str(tmp_path))
+        assert (index.count_terms(SEARCH_TERMS) == full_scan(tmp_path, index.files)).all()
@@ -0,0 +1,38 @@
+import os
+import re
+import sys
+import random
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'analysis'))
+from term_matcher import TermMatcher
+
+SEARCH_TERMS = {
+    'sea ice': ['sea-ice', 'sea ice extent'],
+    'sea level': ['sea'],
+    'water vapour': ['water vapor', 'vapour'],
+    'Kelvin wave': ['kelvin'],
+    'CMIP6': ['CMIP', 'cmip6-era'],
+    'Σσς': [],
+    'İstanbul': [],
+}
+
+def regex_counts(search_terms, text):
+    # Historical counts of terms_in_reports.py: one case-insensitive alternation of the aliases per term
+    counts = {}
+    for term, aliases in search_terms.items():
+        pattern = re.compile('|'.join(re.escape(alias) for alias in [term] + aliases), re.IGNORECASE)
+        counts[term] = len(pattern.findall(text))
+    return counts
+
+def test_counts_match_regex_counts():
+    matcher = TermMatcher(SEARCH_TERMS)
+    text = ('Sea ice extent and SEA-ICE, sea level and seas; water vapor, Water Vapour, vapourvapour. '
+            'The Kelvin wave (KELVIN) in CMIP6-era and cmip6 runs. σας ΣΑΣ istanbul İSTANBUL')
+    assert matcher.count(text) == regex_counts(SEARCH_TERMS, text)
+
+def test_random_texts_match_regex_counts():
+    matcher = TermMatcher(SEARCH_TERMS)
+    words = [alias for term, aliases in SEARCH_TERMS.items() for alias in [term] + aliases] + ['a', ' ', '-', '\n', 'ice']
+    rng = random.Random(0)
+    for _ in range(200):
+        text = ''.join(rng.choice([word, word.upper(), word.lower()]) for word in rng.choices(words, k=30))
+        assert matcher.count(text) == regex_counts(SEARCH_TERMS, text)
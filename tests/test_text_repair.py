@@ -0,0 +1,42 @@
+import os
+import sys
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from text_repair import repair_text, repair_file
+
+HEADER = 'Chapter 2 Changing State of the Climate System'
+ROW = 'Sea surface temperature 0.5 0.6 0.7'
+
+def make_pages(n_pages=6):
+    """Pages with a running header and footer, and a table row repeated in each page."""
+    pages = []
+    for page in range(n_pages):
+        # The table of the first page starts right after the header
+        lines = [HEADER, ''] + ([ROW] if page == 0 else [])
+        for paragraph in range(3):
+            lines += [f'Paragraph {paragraph} of page {page} about the ocean.', ROW, ROW]
+        lines += ['Last paragraph of the page.', '', f'2-{page + 10} Total pages: 250']
+        pages.append('\n'.join(lines) + '\n')
+    return pages
+
+def test_running_headers_removed_and_table_rows_kept(tmp_path):
+    pages = make_pages()
+    page_starts = np.cumsum([0] + [len(page) for page in pages[:-1]])
+    (tmp_path / 'wg1_ch2.txt').write_text(''.join(pages), encoding='utf-8')
+    page_starts.astype('<i8').tofile(tmp_path / 'wg1_ch2.pages.bin')
+    os.makedirs(tmp_path / 'repaired')
+    repair_file(str(tmp_path / 'wg1_ch2.txt'), str(tmp_path / 'repaired' / 'wg1_ch2.txt'))
+    repaired = (tmp_path / 'repaired' / 'wg1_ch2.txt').read_text(encoding='utf-8')
+
+    assert HEADER not in repaired
+    assert 'Total pages' not in repaired
+    assert repaired.count(ROW) == 6 * 3 * 2 + 1
+
+def test_pages_from_form_feeds():
+    repaired = ''.join(repair_text(['\f'.join(make_pages())]))
+    assert HEADER not in repaired
+    assert repaired.count(ROW) == 6 * 3 * 2 + 1
+
+def test_nothing_removed_without_pages():
+    text = ''.join(make_pages())
+    assert ''.join(repair_text([text])).count(HEADER) == 6
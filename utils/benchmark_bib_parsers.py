@@ -0,0 +1,114 @@
+"""
+This script compares the streaming BibTeX reader of bib_stream.py with bibtexparser on the chapter .bib files,
+so that the gain on the stages parsing the references (references.py, bib_to_txt.py, remove_duplicates.py...)
+can be checked on the real files.
+
+For each reader, the script reports the time to parse all the files, with and without LaTeX decoding
+(convert_to_unicode for bibtexparser, decode=True for bib_stream), and the time to read only the DOIs of the
+entries with decoding (the access pattern of bib_to_txt.py, where bib_stream decodes only the DOIs).
+It also checks that both readers return the same entries (decoded values, field order, comments and strings).
+
+If no .bib file is found in bib_folder, sample chapter files are generated in sample_folder.
+
+Usage:
+- Modify the bib_folder, sample_folder and n_repeats variables if needed.
+- Run `python ./utils/benchmark_bib_parsers.py` from the repository root.
+"""
+
+import os
+import glob
+import time
+import random
+import bibtexparser
+from bibtexparser.bparser import BibTexParser
+from bibtexparser.customization import convert_to_unicode
+import bib_stream
+
+def generate_samples(sample_folder, n_files=6, n_entries=500, seed=0):
+    """Generate sample chapter .bib files with LaTeX accents and braces, return their paths."""
+    rng = random.Random(seed)
+    words = ['climate', 'ocean', 'sea', 'ice', 'Arctic', '{CO2}', 'temperature', 'r{\\\'e}gional', 'model', 'and',
+             'of', 'the', 'observations', 'satellite', '{ESA}', 'aerosol', 'precipitation', 'M{\\"u}ller', '\\&']
+    surnames = ['Smith', 'M{\\"u}ller', 'Garc{\\\'i}a', 'Nitta', 'Dupont', 'Zhang', 'Andr{\\\'e}']
+    os.makedirs(sample_folder, exist_ok=True)
+    paths = []
+    for i in range(n_files):
+        path = os.path.join(sample_folder, f'wg{i % 3 + 1}_ch{i + 1}.bib')
+        with open(path, 'w', encoding='utf-8') as f:
+            for j in range(n_entries):
+                authors = ' and '.join(f'{rng.choice(surnames)}, {rng.choice("ABCDEFGH")}.' for _ in range(rng.randint(1, 6)))
+                title = ' '.join(rng.choice(words) for _ in range(rng.randint(6, 16)))
+                f.write(f'@article{{ref{i}_{j},\n  author = {{{authors}}},\n  title = {{{{{title}}}}},\n'
+                        f'  journal = {{Journal of Climate}},\n  year = {{{rng.randint(1990, 2021)}}},\n'
+                        f'  volume = {{{rng.randint(1, 40)}}},\n  pages = {{{rng.randint(1, 900)}--{rng.randint(901, 999)}}},\n'
+                        f'  doi = {{10.{rng.randint(1000, 9999)}/{i}.{j}}}\n}}\n\n')
+        paths.append(path)
+    return paths
+
+def load_bibtexparser(path, decode):
+    with open(path, 'r', encoding='utf-8') as bibtex_file:
+        parser = BibTexParser(common_strings=True)
+        if decode:
+            parser.customization = convert_to_unicode
+        return bibtexparser.load(bibtex_file, parser=parser)
+
+def load_bib_stream(path, decode):
+    with open(path, 'r', encoding='utf-8') as bibtex_file:
+        return bib_stream.load(bibtex_file, decode)
+
+def measure(function, n_repeats):
+    """Return the best time of n_repeats calls of a function, and its result."""
+    best = None
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def same_databases(databases, other_databases):
+    """Check that two lists of databases have the same entries (values and field order), comments and strings."""
+    for database, other in zip(databases, other_databases):
+        if [list(dict(entry).items()) for entry in database.entries] != [list(dict(entry).items()) for entry in other.entries]:
+            return False
+        if database.comments != other.comments or dict(database.strings) != dict(other.strings):
+            return False
+    return True
+
+def run_benchmark(bib_paths, n_repeats=1):
+    """Measure both readers on the .bib files and display the results."""
+    scenarios = {
+        'parse': lambda load: [load(path, False) for path in bib_paths],
+        'parse + decode': lambda load: [[dict(entry) for entry in database.entries]
+                                        for database in (load(path, True) for path in bib_paths)],
+        'DOIs (decode)': lambda load: [entry.get('doi') for path in bib_paths for entry in load(path, True).entries],
+    }
+    readers = {'bibtexparser': load_bibtexparser, 'bib_stream': load_bib_stream}
+    times = {}
+    for scenario, run in scenarios.items():
+        for reader, load in readers.items():
+            times[(scenario, reader)], _ = measure(lambda: run(load), n_repeats)
+
+    reference = [load_bibtexparser(path, True) for path in bib_paths]
+    streamed = [load_bib_stream(path, True) for path in bib_paths]
+    n_entries = sum(len(database.entries) for database in reference)
+
+    print(f"{len(bib_paths)} files, {n_entries} entries, {sum(os.path.getsize(path) for path in bib_paths) / 1e6:.1f} MB")
+    print(f"{'Scenario':<18}{'bibtexparser (s)':>18}{'bib_stream (s)':>16}{'Speedup':>10}")
+    for scenario in scenarios:
+        reference_time, stream_time = times[(scenario, 'bibtexparser')], times[(scenario, 'bib_stream')]
+        print(f"{scenario:<18}{reference_time:>18.3f}{stream_time:>16.3f}{reference_time / stream_time:>9.1f}x")
+    print(f"Same entries: {same_databases(reference, streamed)}")
+    return times
+
+
+if __name__ == '__main__':
+    bib_folder = './data/references'
+    sample_folder = './data/benchmark/bib'
+    n_repeats = 1 # bibtexparser takes a few ms per entry
+
+    bib_paths = sorted(glob.glob(os.path.join(bib_folder, '*.bib')))
+    if not bib_paths:
+        print(f'No .bib file in {bib_folder}, generating samples in {sample_folder}')
+        bib_paths = generate_samples(sample_folder)
+    run_benchmark(bib_paths, n_repeats)
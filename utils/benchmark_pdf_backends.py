@@ -0,0 +1,149 @@
+"""
+This script compares the PDF extraction backends of pdf_backends.py on a set of sample PDFs generated locally
+with reportlab, so that the extraction engine of pdf_to_txt.py can be chosen without the IPCC reports.
+
+The sample PDFs contain filler words and search term aliases (from search_terms.json), laid out in lines
+as in the reports. For each backend, the script reports:
+- Throughput, in pages per second.
+- Peak memory of the extraction, measured in a fresh process: Python allocations (tracemalloc, for one PDF) and,
+  where available, the peak resident memory of the process (which includes native engines such as PDFium).
+- Agreement of the term counts (term_matcher.py) on the extracted text with the counts on the text written
+  in the PDFs: number of (term, document) counts that differ, and total count difference.
+
+Usage:
+- Modify the search_terms_path, sample_folder, n_documents and n_pages variables if needed.
+- Run `python ./utils/benchmark_pdf_backends.py` from the repository root.
+"""
+
+import os
+import sys
+import time
+import json
+import random
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+from pdf_backends import BACKENDS, get_backend
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'analysis'))
+from term_matcher import TermMatcher
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def sample_lines(search_terms, n_lines, seed=0, line_length=95):
+    """Generate lines mixing filler words and search term aliases."""
+    rng = random.Random(seed)
+    aliases = [alias for term, term_aliases in search_terms.items() for alias in [term] + term_aliases]
+    # Aliases must be drawable with the standard PDF fonts
+    aliases = [alias for alias in aliases if alias.isprintable() and all(ord(char) < 256 for char in alias)]
+    filler = ['the', 'climate', 'ocean', 'observations', 'of', 'and', 'in', 'trend', 'satellite', 'model', '2.3', '(Figure', 'et', 'al.,']
+    lines = []
+    line = ''
+    while len(lines) < n_lines:
+        word = rng.choice(aliases) if rng.random() < 0.05 else rng.choice(filler)
+        if line and len(line) + len(word) + 1 > line_length:
+            lines.append(line)
+            line = word
+        else:
+            line = f'{line} {word}' if line else word
+    return lines
+
+def write_sample_pdf(pdf_path, lines, lines_per_page=60):
+    """Write lines to a PDF file, lines_per_page lines per page."""
+    pdf = canvas.Canvas(pdf_path, pagesize=A4)
+    width, height = A4
+    for start in range(0, len(lines), lines_per_page):
+        text = pdf.beginText(40, height - 50)
+        text.setFont('Helvetica', 9)
+        for line in lines[start:start + lines_per_page]:
+            text.textLine(line)
+        pdf.drawText(text)
+        pdf.showPage()
+    pdf.save()
+
+def generate_samples(search_terms, sample_folder, n_documents=3, n_pages=20, lines_per_page=60):
+    """Generate the sample PDFs, return a dictionary {pdf_path: text written in the PDF}."""
+    os.makedirs(sample_folder, exist_ok=True)
+    samples = {}
+    for i in range(n_documents):
+        lines = sample_lines(search_terms, n_pages * lines_per_page, seed=i)
+        pdf_path = os.path.join(sample_folder, f'sample_ch{i + 1}.pdf')
+        write_sample_pdf(pdf_path, lines, lines_per_page)
+        samples[pdf_path] = '\n'.join(lines)
+    return samples
+
+def measure_backend(name, pdf_paths):
+    """
+    Extract the PDFs with a backend, return the texts, elapsed time, page count and peak memory.
+    Python allocations are traced on a second extraction of the first PDF only, as tracing slows down extraction.
+    """
+    backend = get_backend(name)
+    start = time.perf_counter()
+    texts = {}
+    n_pages = 0
+    for pdf_path in pdf_paths:
+        pages = backend.extract_pages(pdf_path)
+        n_pages += len(pages)
+        texts[pdf_path] = ''.join(pages)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource else None
+
+    tracemalloc.start()
+    backend.extract_pages(pdf_paths[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return texts, elapsed, n_pages, peak, max_rss
+
+def count_differences(matcher, reference_texts, texts):
+    """Compare the term counts of the extracted texts with the counts of the reference texts."""
+    differing = 0
+    total = 0
+    for pdf_path, reference_text in reference_texts.items():
+        for expected, found in zip(matcher.count_list(reference_text), matcher.count_list(texts[pdf_path])):
+            if expected != found:
+                differing += 1
+                total += abs(expected - found)
+    return differing, total
+
+def run_benchmark(search_terms, samples, backends=None):
+    """Measure each backend on the sample PDFs and display the results."""
+    matcher = TermMatcher(search_terms)
+    results = {}
+    for name in backends or BACKENDS:
+        # Each backend runs in a fresh process, so that peak memories are not shared between backends
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            try:
+                texts, elapsed, n_pages, peak, max_rss = executor.submit(measure_backend, name, list(samples)).result()
+            except Exception as e:
+                print(f"{name}: failed ({e})")
+                continue
+        differing, total = count_differences(matcher, samples, texts)
+        results[name] = {'pages_per_second': n_pages / elapsed, 'peak_memory_mb': peak / 1e6,
+                         'max_rss_mb': max_rss / 1e6 if max_rss else None,
+                         'differing_counts': differing, 'count_difference': total}
+
+    print(f"{len(samples)} sample PDFs, {len(search_terms)} search terms")
+    print(f"{'Backend':<12}{'Pages/s':>10}{'Peak (MB)':>12}{'Max RSS (MB)':>14}{'Differing counts':>18}{'Count difference':>18}")
+    for name, result in results.items():
+        max_rss = f"{result['max_rss_mb']:.0f}" if result['max_rss_mb'] else '-'
+        print(f"{name:<12}{result['pages_per_second']:>10.1f}{result['peak_memory_mb']:>12.1f}{max_rss:>14}"
+              f"{result['differing_counts']:>18}{result['count_difference']:>18}")
+    return results
+
+
+if __name__ == '__main__':
+    search_terms_path = './data/cci/search_terms.json'
+    sample_folder = './data/benchmark/pdf'
+    n_documents = 3
+    n_pages = 20
+
+    with open(search_terms_path, 'r') as f:
+        search_terms = json.load(f)
+
+    samples = generate_samples(search_terms, sample_folder, n_documents, n_pages)
+    run_benchmark(search_terms, samples)
@@ -0,0 +1,440 @@
+"""
+Streaming BibTeX reader, a faster drop-in replacement for bibtexparser.load (1.x) on the IPCC reference files.
+
+The file is read in chunks and tokenized with regular expressions, entry by entry, so that entries can be
+processed as they are read (iter_bib) without building the whole database. The parsing rules are those of
+bibtexparser 1.x with its default parser: lowercase field names and entry types, first occurrence of a
+repeated field kept, @string interpolation (with the month abbreviations), non-standard entry types skipped,
+and text outside entries kept as comments. Unparsable entries are kept as comments, as bibtexparser does.
+
+With decode=True, field values are converted from LaTeX to unicode as with the convert_to_unicode
+customization, but lazily: a value is converted the first time it is accessed, so that a stage reading only
+the DOIs does not convert the titles and authors of every entry.
+
+Classes:
+- BibRecord: A BibTeX entry (dictionary) whose values are decoded on first access.
+- BibReader(bibtex_file, decode, ignore_nonstandard_types, common_strings): Iterator over the entries of a file.
+
+Functions:
+- decode_value(value): Convert a value from LaTeX to unicode.
+- iter_bib(file_path, decode): Iterate over the entries of a .bib file.
+- load(bibtex_file, decode): Parse a file into a bibtexparser BibDatabase (drop-in for bibtexparser.load).
+- loads(bibtex_str, decode): Parse a string into a bibtexparser BibDatabase (drop-in for bibtexparser.loads).
+
+Usage:
+python ./utils/bib_stream.py file.bib [file2.bib ...]
+"""
+
+import io
+import re
+import sys
+import time
+import logging
+from collections import OrderedDict
+from bibtexparser.bibdatabase import BibDatabase, COMMON_STRINGS, STANDARD_TYPES, UndefinedString
+from bibtexparser.latexenc import latex_to_unicode
+
+CHUNK_SIZE = 1 << 20
+
+WHITESPACE_REGEX = re.compile(r'\s*')
+ITEM_START_REGEX = re.compile(r'@\s*([A-Za-z]+)')
+KEY_REGEX = re.compile(r'([^,\s]*)\s*')
+FIELD_NAME_REGEX = re.compile(r'[A-Za-z0-9_\-().+]+')
+STRING_NAME_REGEX = re.compile(r'[A-Za-z0-9_\-:]+')
+INTEGER_REGEX = re.compile(r'\d+')
+BRACE_REGEX = re.compile(r'[{}]')
+QUOTED_REGEX = re.compile(r'["{}]')
+COMMENT_END_REGEX = re.compile(r'[ \t\r]*\n\s*@') # A comment runs until the next line starting with @
+CLOSING = {'{': '}', '(': ')'}
+
+def needs_decoding(value):
+    """Check if latex_to_unicode can change a value (LaTeX commands, braces or non-ASCII characters)."""
+    return not value.isascii() or '\\' in value or '{' in value or '}' in value
+
+def decode_value(value):
+    """Convert a value from LaTeX to unicode (as the convert_to_unicode customization of bibtexparser)."""
+    return latex_to_unicode(value) if needs_decoding(value) else value
+
+def strip_after_new_lines(value):
+    """Remove the leading whitespace of all but the first line of a value (as bibtexparser does)."""
+    if '\n' not in value and '\r' not in value:
+        return value
+    lines = value.splitlines()
+    return '\n'.join([lines[0]] + [line.lstrip() for line in lines[1:]])
+
+class BibRecord(dict):
+    """
+    A BibTeX entry: a dictionary of the fields (with ENTRYTYPE and ID), whose values are converted from LaTeX
+    to unicode the first time they are accessed if created with decode=True.
+    """
+
+    __slots__ = ('_pending',)
+
+    def __init__(self, fields=(), decode=False):
+        super().__init__(fields)
+        self._pending = set(dict.keys(self)) if decode else None
+
+    def _decode(self, key):
+        self._pending.discard(key)
+        value = dict.__getitem__(self, key)
+        if isinstance(value, str):
+            dict.__setitem__(self, key, decode_value(value))
+
+    def _decode_all(self):
+        if self._pending:
+            for key in list(self._pending):
+                self._decode(key)
+
+    def __getitem__(self, key):
+        if self._pending and key in self._pending:
+            self._decode(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __iter__(self):
+        # Defined in Python so that dict(record) goes through __getitem__ (and decodes the values)
+        return iter(dict.keys(self))
+
+    def items(self):
+        self._decode_all()
+        return dict.items(self)
+
+    def values(self):
+        self._decode_all()
+        return dict.values(self)
+
+    def __setitem__(self, key, value):
+        if self._pending:
+            self._pending.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        if self._pending:
+            self._pending.discard(key)
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        if self._pending and key in self._pending:
+            self._decode(key)
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        self._decode_all()
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        dict.__setitem__(self, key, default)
+        return default
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def copy(self):
+        return BibRecord(self.items())
+
+    def __eq__(self, other):
+        self._decode_all()
+        if isinstance(other, BibRecord):
+            other._decode_all()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        self._decode_all()
+        return dict.__repr__(self)
+
+    def __reduce__(self):
+        return (BibRecord, (dict(self.items()),))
+
+class _Incomplete(Exception):
+    """The item continues after the end of the buffer."""
+
+class _Invalid(Exception):
+    """The item is not valid BibTeX (it is kept as a comment)."""
+
+class BibReader:
+    """
+    Iterator over the entries (BibRecord) of a BibTeX file, reading the file in chunks.
+    The comments, preambles and strings are available once the iteration is done.
+
+    Args:
+        bibtex_file (file): The BibTeX file (text file object) or string.
+        decode (bool): Convert the values from LaTeX to unicode (lazily, on access).
+        ignore_nonstandard_types (bool): Skip the entries of non-standard types (as bibtexparser does by default).
+        common_strings (bool): Define the month abbreviations as strings.
+        chunk_size (int): The number of characters read at once.
+    """
+
+    def __init__(self, bibtex_file, decode=False, ignore_nonstandard_types=True, common_strings=True, chunk_size=CHUNK_SIZE):
+        self.file = io.StringIO(bibtex_file) if isinstance(bibtex_file, str) else bibtex_file
+        self.decode = decode
+        self.ignore_nonstandard_types = ignore_nonstandard_types
+        self.chunk_size = chunk_size
+        self.comments = []
+        self.preambles = []
+        self.strings = OrderedDict(COMMON_STRINGS) if common_strings else OrderedDict()
+        self._buffer = ''
+        self._eof = False
+        self._first_chunk = True
+
+    def _read(self, pos):
+        """Drop the buffer before pos and read the next chunk, return False at the end of the file."""
+        if self._eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        self._eof = len(chunk) < self.chunk_size
+        if self._first_chunk and chunk.startswith('\ufeff'):
+            # Some files start with a byte-order mark
+            chunk = chunk[1:]
+        self._first_chunk = False
+        self._buffer = self._buffer[pos:] + chunk
+        return True
+
+    def __iter__(self):
+        pos = 0
+        while True:
+            text = self._buffer
+            try:
+                pos = self._skip(text, pos)
+                if pos >= len(text):
+                    if self._read(pos):
+                        pos = 0
+                        continue
+                    return
+                try:
+                    entry, pos = self._parse_item(text, pos)
+                except _Invalid:
+                    comment, pos = self._parse_comment(text, pos)
+                    self.comments.append(comment)
+                    entry = None
+            except _Incomplete:
+                self._read(pos)
+                pos = 0
+                continue
+            if entry is not None:
+                yield entry
+
+    def _char(self, text, pos):
+        if pos < len(text):
+            return text[pos]
+        raise _Invalid() if self._eof else _Incomplete()
+
+    def _match(self, regex, text, pos):
+        match = regex.match(text, pos)
+        if match is not None and match.end() == len(text) and not self._eof:
+            raise _Incomplete()
+        return match
+
+    def _skip(self, text, pos):
+        return self._match(WHITESPACE_REGEX, text, pos).end()
+
+    def _parse_item(self, text, pos):
+        """Parse the item (entry, string, preamble or comment) at pos, return the entry (or None) and the end."""
+        if self._char(text, pos) != '@':
+            raise _Invalid()
+        match = self._match(ITEM_START_REGEX, text, pos)
+        if match is None:
+            raise _Invalid()
+        item_type = match.group(1).lower()
+        if item_type == 'comment' and match.end() - pos == len('@comment'):
+            comment, end = self._parse_comment(text, self._skip(text, match.end()))
+            if comment[:1] == '{':
+                comment = comment[1:]
+            if comment[-1:] == '}':
+                comment = comment[:-1]
+            self.comments.append(comment)
+            return None, end
+        pos = self._skip(text, match.end())
+        close = CLOSING.get(self._char(text, pos))
+        if close is None:
+            raise _Invalid()
+        pos = self._skip(text, pos + 1)
+        if item_type == 'string':
+            name = self._match(STRING_NAME_REGEX, text, pos)
+            if name is None:
+                raise _Invalid()
+            pos = self._expect(text, self._skip(text, name.end()), '=')
+            pieces, pos = self._parse_expression(text, pos, strip=False)
+            self._expect(text, pos, close)
+            self.strings[name.group().lower()] = self._clean_value(pieces)
+            return None, pos + 1
+        if item_type == 'preamble':
+            pieces, pos = self._parse_value(text, pos, strip=False)
+            self._expect(text, pos, close)
+            self.preambles.append(''.join(pieces))
+            return None, pos + 1
+        return self._parse_entry(text, pos, item_type, close)
+
+    def _parse_entry(self, text, pos, entry_type, close):
+        key = self._match(KEY_REGEX, text, pos)
+        entry_id = key.group(1)
+        pos = self._expect(text, key.end(), ',')
+        if not entry_id:
+            raise _Invalid()
+        fields = []
+        while True:
+            pos = self._skip(text, pos)
+            if fields and self._char(text, pos) == close:
+                pos += 1
+                break
+            name = self._match(FIELD_NAME_REGEX, text, pos)
+            if name is None:
+                raise _Invalid()
+            pos = self._expect(text, self._skip(text, name.end()), '=')
+            pieces, pos = self._parse_value(text, pos, strip=True)
+            fields.append((name.group().lower(), self._clean_value(pieces)))
+            char = self._char(text, pos)
+            if char == ',':
+                pos += 1
+            elif char == close:
+                pos += 1
+                break
+            else:
+                raise _Invalid()
+        if self.ignore_nonstandard_types and entry_type not in STANDARD_TYPES:
+            logging.getLogger(__name__).warning('Entry type %s not standard. Not considered.', entry_type)
+            return None, pos
+        # Same fields and field order as bibtexparser (first occurrence of a field kept, fields in reverse order)
+        record = {}
+        for name, value in reversed(fields):
+            record[name] = value
+        record['ENTRYTYPE'] = entry_type
+        record['ID'] = entry_id
+        return BibRecord(record, self.decode), pos
+
+    def _expect(self, text, pos, char):
+        """Check that the next non-whitespace character is char, return the position after it (and whitespace)."""
+        pos = self._skip(text, pos)
+        if self._char(text, pos) != char:
+            raise _Invalid()
+        return self._skip(text, pos + 1)
+
+    def _parse_value(self, text, pos, strip):
+        """Parse an integer or a string expression, return its pieces and the position after it (and whitespace)."""
+        if self._char(text, pos).isdigit():
+            match = self._match(INTEGER_REGEX, text, pos)
+            return [match.group()], self._skip(text, match.end())
+        return self._parse_expression(text, pos, strip)
+
+    def _parse_expression(self, text, pos, strip):
+        """Parse braced or quoted strings and string names joined by #, return the pieces and the position after."""
+        pieces = []
+        while True:
+            char = self._char(text, pos)
+            if char == '{':
+                piece, pos = self._parse_braced(text, pos)
+            elif char == '"':
+                piece, pos = self._parse_quoted(text, pos)
+            else:
+                name = self._match(STRING_NAME_REGEX, text, pos)
+                if name is None:
+                    raise _Invalid()
+                if name.group().lower() not in self.strings:
+                    raise UndefinedString(name.group().lower())
+                pieces.append(self.strings[name.group().lower()])
+                pos = self._skip(text, name.end())
+                if self._char(text, pos) != '#':
+                    return pieces, pos
+                pos = self._skip(text, pos + 1)
+                continue
+            pieces.append(strip_after_new_lines(piece) if strip else piece)
+            pos = self._skip(text, pos)
+            if self._char(text, pos) != '#':
+                return pieces, pos
+            pos = self._skip(text, pos + 1)
+
+    def _parse_braced(self, text, pos):
+        depth = 0
+        for match in BRACE_REGEX.finditer(text, pos):
+            depth += 1 if match.group() == '{' else -1
+            if depth == 0:
+                return text[pos + 1:match.start()], match.end()
+        raise _Invalid() if self._eof else _Incomplete()
+
+    def _parse_quoted(self, text, pos):
+        depth = 0
+        for match in QUOTED_REGEX.finditer(text, pos + 1):
+            char = match.group()
+            if char == '"' and depth == 0:
+                return text[pos + 1:match.start()], match.end()
+            if char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if depth < 0:
+                    raise _Invalid()
+        raise _Invalid() if self._eof else _Incomplete()
+
+    def _clean_value(self, pieces):
+        if len(pieces) == 1 and pieces[0] in ('', '{}'):
+            return ''
+        return ''.join(pieces)
+
+    def _parse_comment(self, text, pos):
+        """Return the comment starting at pos (until the next line starting with @) and its end."""
+        match = COMMENT_END_REGEX.search(text, pos)
+        if match is None:
+            if not self._eof:
+                raise _Incomplete()
+            end = len(text)
+            comment = text[pos:].rstrip()
+        else:
+            end = match.start()
+            comment = text[pos:end]
+        return comment.rstrip('\n'), end
+
+def iter_bib(file_path, decode=False, **kwargs):
+    """
+    Iterates over the entries of a .bib file, reading the file in chunks.
+
+    Args:
+        file_path (str): The path of the .bib file.
+        decode (bool): Convert the values from LaTeX to unicode (lazily, on access).
+        **kwargs: The other arguments of BibReader.
+
+    Yields:
+        BibRecord: The entries, in file order.
+    """
+    with open(file_path, 'r', encoding='utf-8') as bibtex_file:
+        yield from BibReader(bibtex_file, decode, **kwargs)
+
+def load(bibtex_file, decode=False, **kwargs):
+    """
+    Parses a BibTeX file into a bibtexparser BibDatabase, like bibtexparser.load with the default parser
+    (or with the convert_to_unicode customization if decode is True).
+
+    Args:
+        bibtex_file (file): The BibTeX file (text file object).
+        decode (bool): Convert the values from LaTeX to unicode (lazily, on access).
+        **kwargs: The other arguments of BibReader.
+
+    Returns:
+        BibDatabase: The database, whose entries are BibRecord dictionaries.
+    """
+    reader = BibReader(bibtex_file, decode, **kwargs)
+    bib_database = BibDatabase()
+    bib_database.entries = list(reader)
+    bib_database.comments = reader.comments
+    bib_database.preambles = reader.preambles
+    bib_database.strings = reader.strings
+    return bib_database
+
+def loads(bibtex_str, decode=False, **kwargs):
+    """Parses a BibTeX string into a bibtexparser BibDatabase (see load)."""
+    return load(io.StringIO(bibtex_str), decode, **kwargs)
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        start_time = time.perf_counter()
+        count = sum(1 for _ in iter_bib(path))
+        print(f'{path}: {count} entries in {(time.perf_counter() - start_time) * 1000:.1f} ms')
@@ -1,23 +1,27 @@
-import glob
-import bibtexparser
-from bibtexparser.bparser import BibTexParser
-from bibtexparser.customization import convert_to_unicode
+import os
+import bib_stream
+from reference_store import read_store, store_is_stale, list_bib_files, parse_file_name
 
 def parse_bib_files(folder_path, filename_tag):
-    bib_files = glob.glob(f"{folder_path}/*{filename_tag}*.bib")
+    # Files of the report in name order, as in the reference store
+    bib_files = [file for file in list_bib_files(folder_path) if parse_file_name(file)[0] == filename_tag]
     all_dois = []
 
     for bib_file in bib_files:
-        with open(bib_file, 'r', encoding='utf-8') as bibtex_file:
-            parser = BibTexParser()
-            parser.customization = convert_to_unicode
-            bib_database = bibtexparser.load(bibtex_file, parser=parser)
+        with open(os.path.join(folder_path, bib_file), 'r', encoding='utf-8') as bibtex_file:
+            # Only the DOIs are decoded (see bib_stream.py)
+            bib_database = bib_stream.load(bibtex_file, decode=True)
             for entry in bib_database.entries:
                 if 'doi' in entry:
                     all_dois.append(entry['doi'])
 
     return all_dois
 
+def read_store_dois(store_path, filename_tag):
+    # DOIs of the files with the tag in their name, from the reference store (see reference_store.py)
+    df = read_store(store_path, reports=[filename_tag], columns=['doi_raw'])
+    return [bib_stream.decode_value(doi) for doi in df['doi_raw'].dropna()]
+
 def write_dois_to_txt(dois, file_path, total_file_path=False):
     with open(file_path, 'w', encoding='utf-8') as txt_file:
         for doi in dois:
@@ -31,11 +35,13 @@ report_tags = ['sr15', 'srccl', 'srocc', 'wg1', 'wg2', 'wg3']
 
 folder_path = './data/references_no_duplicates' # Update this with the path to your folder
 total_file_path = f'./results/dois/ar6_dois_full.txt'
+store_path = './data/references_store' # Built with reference_store.py, the .bib files are parsed if missing or stale
 
+use_store = os.path.exists(store_path) and not store_is_stale(folder_path, store_path)
 n_dois = 0
 for tag in report_tags:
     txt_file_path = f'./results/dois/ar6_dois_{tag}.txt'
-    dois = parse_bib_files(folder_path, tag)
+    dois = read_store_dois(store_path, tag) if use_store else parse_bib_files(folder_path, tag)
     n_dois += len(dois)
     write_dois_to_txt(dois, txt_file_path, total_file_path)
     print(f'Total number of DOIs in {tag}: {len(dois)}')
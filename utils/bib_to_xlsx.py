@@ -1,4 +1,4 @@
-import bibtexparser
+import bib_stream
 from openpyxl import Workbook
 
 def convert_bib_to_xlsx(bib_file_path, xlsx_file_path):
@@ -15,7 +15,7 @@ def convert_bib_to_xlsx(bib_file_path, xlsx_file_path):
 
     # Parse the BibTeX file
     with open(bib_file_path, 'r', encoding='utf-8') as bib_file:
-        bib_database = bibtexparser.load(bib_file)
+        bib_database = bib_stream.load(bib_file)
 
         # Iterate through entries
         for entry in bib_database.entries:
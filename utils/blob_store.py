@@ -0,0 +1,295 @@
+"""
+Content-addressable store for the downloaded and processed files (PDFs, bib files...), so that a file is stored
+once whatever the number of folders it appears in (e.g. data/reports/pdf and data/reports/pdf/full_temp, or
+data/references and data/references_no_duplicates).
+
+Each file is stored once as a read-only blob named after its SHA-256 (<root>/objects/ab/cdef...), and the
+logical paths of the file (the paths used by the scripts) are symbolic links to the blob (or hard links with
+link_mode='hardlink', e.g. where symbolic links are not available). An index (<root>/index.json) records the
+SHA-256, size and modification time of each logical path, so that checking whether a file is already stored is
+a stat call, and checking whether a content is already stored is a file existence check.
+
+Blobs must not be modified in place. Opening a logical path for writing opens its blob, which is refused as
+the blob is read-only (except for a superuser). The scripts write their outputs with replace_file, which writes
+a temporary file and renames it over the logical path: the link is replaced and the blob is left unchanged.
+`verify` detects a blob modified through one of its links.
+
+Each processing stage can record the blobs it consumed (and the files it produced) in a provenance log
+(<root>/provenance.jsonl, one JSON line per run of a stage on a file).
+
+Classes:
+- BlobStore(root, link_mode): The store.
+
+Functions:
+- replace_file(path, mode, encoding, newline): Open a file to be written, replacing the file (or link) when closed.
+
+Usage:
+python ./utils/blob_store.py dedupe ./data/reports/pdf ./data/references [--root ./data/blobs] [--hardlink]
+python ./utils/blob_store.py stats
+python ./utils/blob_store.py verify
+python ./utils/blob_store.py provenance [path]
+"""
+
+import os
+import json
+import stat
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+import contextlib
+
+DEFAULT_ROOT = './data/blobs'
+
+READ_ONLY = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+
+def file_hash(file_path):
+    """Return the SHA-256 of a file, read by blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+@contextlib.contextmanager
+def replace_file(path, mode='w', encoding=None, newline=None):
+    """
+    Opens a file to be written as a temporary file, renamed over path once written (and removed on error),
+    so that a stored file (a link to a blob) is replaced instead of being written through, and that an
+    interrupted write does not leave a truncated file.
+
+    Args:
+        path (str): The file to write.
+        mode (str): 'w' (text) or 'wb' (binary).
+        encoding (str): The encoding of a text file.
+        newline (str): The newline of a text file (as for open).
+
+    Yields:
+        file: The temporary file.
+    """
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp_path, mode, encoding=encoding, newline=newline) as f:
+            yield f
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def logical_key(path):
+    """Return the key of a logical path in the index (normalized path relative to the working directory)."""
+    return os.path.normpath(os.path.relpath(path))
+
+class BlobStore:
+    """
+    Content-addressable store with symlinked (or hard-linked) logical paths. Thread safe.
+
+    Args:
+        root (str): The folder of the store.
+        link_mode (str): 'symlink' (default, falls back to a hard link where symbolic links are not available)
+            or 'hardlink' (falls back to a symbolic link across file systems).
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, link_mode='symlink'):
+        self.root = root
+        self.link_mode = link_mode
+        self.index_path = os.path.join(root, 'index.json')
+        self.provenance_path = os.path.join(root, 'provenance.jsonl')
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.save()
+
+    def save(self):
+        """Save the index (written to a temporary file, then renamed)."""
+        with self._lock:
+            with open(self.index_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, indent=1)
+            os.replace(self.index_path + '.tmp', self.index_path)
+
+    def blob_path(self, sha256):
+        return os.path.join(self.root, 'objects', sha256[:2], sha256[2:])
+
+    def has(self, sha256):
+        """Check if a content is stored."""
+        return os.path.exists(self.blob_path(sha256))
+
+    def lookup(self, path):
+        """Return the SHA-256 of a logical path if it is stored and unchanged since (stat only), or None."""
+        entry = self.index.get(logical_key(path))
+        if entry is None or not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        if (entry['size'], entry['mtime_ns']) != (stat.st_size, stat.st_mtime_ns) or not self.has(entry['sha256']):
+            return None
+        return entry['sha256']
+
+    def hash_of(self, path):
+        """Return the SHA-256 of a file, from the index if the file is stored and unchanged."""
+        return self.lookup(path) or file_hash(path)
+
+    def put(self, path, sha256=None):
+        """
+        Stores a file and replaces it with a link to its blob (nothing is copied if the content is already stored).
+
+        Args:
+            path (str): The file (logical path).
+            sha256 (str): The SHA-256 of the file, if already known.
+
+        Returns:
+            str: The SHA-256 of the file.
+        """
+        known = self.lookup(path)
+        if known is not None:
+            return known
+        sha256 = sha256 or file_hash(path)
+        blob_path = self.blob_path(sha256)
+        with self._lock:
+            if not os.path.exists(blob_path):
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                try:
+                    os.link(path, blob_path)
+                except OSError:
+                    shutil.copyfile(path, blob_path + '.tmp')
+                    os.replace(blob_path + '.tmp', blob_path)
+                os.chmod(blob_path, READ_ONLY)
+        self.link(sha256, path)
+        return sha256
+
+    def link(self, sha256, path):
+        """Creates (or replaces) a logical path as a link to a stored blob."""
+        blob_path = self.blob_path(sha256)
+        if not os.path.exists(blob_path):
+            raise FileNotFoundError(f'Blob {sha256} is not stored')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.{threading.get_ident()}.link'
+        link_target = os.path.relpath(blob_path, os.path.dirname(path) or '.')
+        if os.path.islink(path) and os.readlink(path) == link_target:
+            tmp_path = None
+        elif self.link_mode == 'hardlink':
+            if os.path.exists(path) and not os.path.islink(path) and os.path.samefile(path, blob_path):
+                tmp_path = None
+            else:
+                try:
+                    os.link(blob_path, tmp_path)
+                except OSError:
+                    os.symlink(link_target, tmp_path)
+        else:
+            try:
+                os.symlink(link_target, tmp_path)
+            except OSError:
+                os.link(blob_path, tmp_path)
+        if tmp_path is not None:
+            os.replace(tmp_path, path)
+        stat = os.stat(path)
+        with self._lock:
+            self.index[logical_key(path)] = {'sha256': sha256, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def dedupe(self, folder, extensions=None):
+        """
+        Stores all the files of a folder (recursively), replacing duplicates with links to the same blob.
+
+        Args:
+            folder (str): The folder.
+            extensions (tuple): The extensions of the files to store (default: all files).
+
+        Returns:
+            tuple: The number of files and the number of bytes saved (files whose content was already stored).
+        """
+        n_files, saved = 0, 0
+        for directory, _, files in os.walk(folder):
+            if os.path.abspath(directory).startswith(os.path.abspath(self.root)):
+                continue
+            for file in sorted(files):
+                path = os.path.join(directory, file)
+                if os.path.islink(path) or (extensions and not file.endswith(tuple(extensions))):
+                    continue
+                if self.lookup(path) is None:
+                    sha256 = file_hash(path)
+                    if self.has(sha256) and not os.path.samefile(path, self.blob_path(sha256)):
+                        saved += os.path.getsize(path)
+                    self.put(path, sha256)
+                n_files += 1
+        return n_files, saved
+
+    def record_provenance(self, stage, inputs, outputs=None, parameters=None):
+        """
+        Records the blobs consumed by a processing stage in the provenance log.
+
+        Args:
+            stage (str): The name of the stage (e.g. 'pdf_to_txt').
+            inputs (dict): The SHA-256 of each input, by path (or URL).
+            outputs (list): The paths of the files produced.
+            parameters (dict): The parameters of the stage (e.g. the extractor version).
+        """
+        record = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'stage': stage,
+                  'inputs': {logical_key(path) if os.path.exists(path) else path: sha256 for path, sha256 in inputs.items()},
+                  'outputs': [logical_key(path) for path in outputs or []], 'parameters': parameters or {}}
+        with self._lock:
+            with open(self.provenance_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+
+    def provenance(self, path=None):
+        """Return the provenance records (of the stages having produced or consumed a path, if given)."""
+        if not os.path.exists(self.provenance_path):
+            return []
+        key = logical_key(path) if path else None
+        with open(self.provenance_path, 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        return [record for record in records if key is None or key in record['inputs'] or key in record['outputs']]
+
+    def verify(self):
+        """Return the SHA-256 of the blobs whose content does not match their name (modified in place)."""
+        corrupted = []
+        objects = os.path.join(self.root, 'objects')
+        for prefix in sorted(os.listdir(objects)):
+            for name in sorted(os.listdir(os.path.join(objects, prefix))):
+                if not name.endswith('.tmp') and file_hash(os.path.join(objects, prefix, name)) != prefix + name:
+                    corrupted.append(prefix + name)
+        return corrupted
+
+    def stats(self):
+        """Return the number of logical paths, the number of blobs and the size of the blobs (bytes)."""
+        objects = os.path.join(self.root, 'objects')
+        sizes = [os.path.getsize(os.path.join(objects, prefix, name))
+                 for prefix in os.listdir(objects) for name in os.listdir(os.path.join(objects, prefix))]
+        return len(self.index), len(sizes), sum(sizes)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Content-addressable store of the data files.')
+    parser.add_argument('--root', default=DEFAULT_ROOT, help='Folder of the store')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    dedupe_parser = subparsers.add_parser('dedupe', help='Store the files of folders, replacing duplicates with links')
+    dedupe_parser.add_argument('folders', nargs='+')
+    dedupe_parser.add_argument('--hardlink', action='store_true', help='Use hard links instead of symbolic links')
+    subparsers.add_parser('stats', help='Number of logical paths and blobs')
+    subparsers.add_parser('verify', help='Check that the blobs were not modified in place')
+    provenance_parser = subparsers.add_parser('provenance', help='Show the provenance records')
+    provenance_parser.add_argument('path', nargs='?')
+    args = parser.parse_args()
+
+    store = BlobStore(args.root, 'hardlink' if getattr(args, 'hardlink', False) else 'symlink')
+    if args.command == 'dedupe':
+        with store:
+            for folder in args.folders:
+                n_files, saved = store.dedupe(folder)
+                print(f'{folder}: {n_files} files stored, {saved / 1e6:.1f} MB of duplicates saved')
+    elif args.command == 'stats':
+        n_paths, n_blobs, size = store.stats()
+        print(f'{n_paths} logical paths, {n_blobs} blobs ({size / 1e6:.1f} MB)')
+    elif args.command == 'verify':
+        corrupted = store.verify()
+        print(f'{len(corrupted)} blobs modified in place' + ''.join(f'\n{sha256}' for sha256 in corrupted))
+    elif args.command == 'provenance':
+        for record in store.provenance(args.path):
+            print(json.dumps(record))
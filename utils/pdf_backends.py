@@ -0,0 +1,154 @@
+"""
+This module provides a common interface to the PDF text extraction engines listed in requirements.txt,
+so that the extraction engine of pdf_to_txt.py can be selected by name:
+- 'pypdf2'      PyPDF2 (historical engine of pdf_to_txt.py)
+- 'pdfminer'    pdfminer.six layout analysis
+- 'pdfplumber'  pdfplumber (built on pdfminer.six, closer to the visual layout)
+- 'pypdfium2'   PDFium bindings (native code)
+
+Each engine is imported only when its backend is used. All backends return the text of each page
+as a string, with '\\n' line breaks.
+
+Functions:
+- get_backend(name): Return the backend of an extraction engine.
+
+Example usage:
+backend = get_backend('pypdfium2')
+texts = backend.extract_pages('./data/reports/pdf/wg1_ch2.pdf')    # one string per page
+"""
+
+import abc
+from importlib.metadata import version
+
+class PdfBackend(abc.ABC):
+    """
+    Base class of the extraction backends.
+
+    Attributes:
+        name (str): The name of the backend.
+        distribution (str): The name of the installed package, used for the version of the backend.
+    """
+    name = None
+    distribution = None
+
+    @property
+    def version(self):
+        return f'{self.name}-{version(self.distribution)}'
+
+    @abc.abstractmethod
+    def count_pages(self, source_path):
+        """Return the number of pages of a PDF file."""
+
+    @abc.abstractmethod
+    def extract_pages(self, source_path, start=0, stop=None):
+        """
+        Extracts the text of the pages [start, stop) of a PDF file.
+
+        Args:
+            source_path (str): The PDF file.
+            start (int): The first page (0-based).
+            stop (int): The page after the last page (default: end of the document).
+
+        Returns:
+            list: The text of each page.
+        """
+
+class PyPDF2Backend(PdfBackend):
+    name = 'pypdf2'
+    distribution = 'PyPDF2'
+
+    def count_pages(self, source_path):
+        from PyPDF2 import PdfReader
+        return len(PdfReader(source_path).pages)
+
+    def extract_pages(self, source_path, start=0, stop=None):
+        from PyPDF2 import PdfReader
+        texts = []
+        for page in PdfReader(source_path).pages[start:stop]:
+            try:
+                texts.append(page.extract_text() or '')
+            except UnicodeEncodeError as e:
+                print(f"Encoding error encountered and skipped in {source_path}: {e}")
+                texts.append('')
+        return texts
+
+class PdfminerBackend(PdfBackend):
+    name = 'pdfminer'
+    distribution = 'pdfminer.six'
+
+    def count_pages(self, source_path):
+        from pdfminer.pdfpage import PDFPage
+        with open(source_path, 'rb') as f:
+            return sum(1 for _ in PDFPage.get_pages(f))
+
+    def extract_pages(self, source_path, start=0, stop=None):
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LTTextContainer
+        stop = self.count_pages(source_path) if stop is None else stop
+        texts = []
+        for page_layout in extract_pages(source_path, page_numbers=range(start, stop)):
+            texts.append(''.join(element.get_text() for element in page_layout if isinstance(element, LTTextContainer)))
+        return texts
+
+class PdfplumberBackend(PdfBackend):
+    name = 'pdfplumber'
+    distribution = 'pdfplumber'
+
+    def count_pages(self, source_path):
+        import pdfplumber
+        with pdfplumber.open(source_path) as pdf:
+            return len(pdf.pages)
+
+    def extract_pages(self, source_path, start=0, stop=None):
+        import pdfplumber
+        texts = []
+        with pdfplumber.open(source_path) as pdf:
+            for page in pdf.pages[start:stop]:
+                texts.append(page.extract_text() or '')
+                # Free the parsed objects of the page, so that memory does not grow with the document
+                page.close()
+        return texts
+
+class Pypdfium2Backend(PdfBackend):
+    name = 'pypdfium2'
+    distribution = 'pypdfium2'
+
+    def count_pages(self, source_path):
+        import pypdfium2
+        pdf = pypdfium2.PdfDocument(source_path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+    def extract_pages(self, source_path, start=0, stop=None):
+        import pypdfium2
+        pdf = pypdfium2.PdfDocument(source_path)
+        texts = []
+        try:
+            for i in range(start, len(pdf) if stop is None else stop):
+                page = pdf[i]
+                textpage = page.get_textpage()
+                # PDFium uses Windows line breaks
+                texts.append(textpage.get_text_range().replace('\r\n', '\n'))
+                textpage.close()
+                page.close()
+        finally:
+            pdf.close()
+        return texts
+
+BACKENDS = {backend.name: backend for backend in (PyPDF2Backend, PdfminerBackend, PdfplumberBackend, Pypdfium2Backend)}
+
+def get_backend(name):
+    """
+    Returns the backend of an extraction engine.
+
+    Args:
+        name (str): The name of the engine ('pypdf2', 'pdfminer', 'pdfplumber' or 'pypdfium2').
+
+    Returns:
+        PdfBackend: The backend.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown PDF backend {name!r}, choose from {list(BACKENDS)}')
+    return BACKENDS[name]()
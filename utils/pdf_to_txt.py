@@ -1,42 +1,204 @@
 import os
-from PyPDF2 import PdfReader
+import json
+import hashlib
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pdf_backends import get_backend
+from blob_store import BlobStore, replace_file
 
-def convert_pdf_folder_to_txt(source_folder, target_folder):
+# Change the revision when the extraction changes, so that cached outputs are converted again
+EXTRACTOR_REVISION = 2
+MANIFEST_NAME = 'extraction_manifest.json'
+
+def file_hash(file_path):
+    # SHA-256 of a file, read by blocks
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def extractor_version(backend):
+    return f'{get_backend(backend).version}-{EXTRACTOR_REVISION}'
+
+def extract_pages(backend, source_path, start, stop):
+    # Extract the text of pages [start, stop) of a PDF file, one string per page
+    return get_backend(backend).extract_pages(source_path, start, stop)
+
+def load_manifest(target_folder):
+    manifest_path = os.path.join(target_folder, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+def save_manifest(manifest, target_folder):
+    manifest_path = os.path.join(target_folder, MANIFEST_NAME)
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+def is_cached(manifest, source_path, target_path, extractor):
+    # A PDF is skipped if its txt exists and was extracted from the same content with the same extractor version
+    entry = manifest.get(os.path.basename(source_path))
+    if entry is None or entry['extractor'] != extractor or not os.path.exists(target_path) \
+            or not os.path.exists(pages_path(target_path)):
+        return False
+    stat = os.stat(source_path)
+    if (entry['size'], entry['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+        return True
+    if entry['sha256'] == file_hash(source_path):
+        entry['size'], entry['mtime_ns'] = stat.st_size, stat.st_mtime_ns
+        return True
+    return False
+
+def pages_path(target_path):
+    return os.path.splitext(target_path)[0] + '.pages.bin'
+
+def write_txt(target_path, texts):
+    # Write the pages to a temporary file first, so that an interrupted conversion is not cached
+    # The start offset (in characters) of each page is written to a sidecar (<name>.pages.bin, int64)
+    page_starts = array('q')
+    position = 0
+    with replace_file(target_path, encoding='utf-8') as txt_file:
+        for text in texts:
+            # Line breaks as read back in text mode, so that offsets are the ones of the text read
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+            page_starts.append(position)
+            try:
+                txt_file.write(text)
+                position += len(text)
+            except UnicodeEncodeError as e:
+                print(f"Encoding error encountered and skipped in {os.path.basename(target_path)}: {e}")
+        with replace_file(pages_path(target_path), 'wb') as pages_file:
+            page_starts.tofile(pages_file)
+
+def load_page_starts(txt_path):
+    """Return the start offset (in characters) of each page of a converted txt file, from its .pages.bin sidecar."""
+    import numpy as np
+    return np.fromfile(pages_path(txt_path), dtype='<i8')
+
+def page_numbers(page_starts, positions):
+    """Map character offsets of a converted txt file to page numbers (0-based) with a binary search."""
+    import numpy as np
+    return np.searchsorted(page_starts, positions, side='right') - 1
+
+def convert_pdf_folder_to_txt(source_folder, target_folder, workers=1, pages_per_task=100, force=False, backend='pypdf2',
+                              store=None):
+    """
+    Convert the PDF files of a folder to txt files.
+
+    PDFs whose content (SHA-256) and extractor version match the cached output are skipped, unless force is True.
+    With workers other than 1, documents are converted in parallel in a pool of worker processes (None uses all
+    cores), and documents with more than pages_per_task pages (e.g. WG2 full report, Atlas) are split into page
+    ranges converted in parallel, then written in page order. At most twice as many page ranges as workers are
+    extracted ahead of the document being written.
+    The extraction engine is selected with backend (see pdf_backends.py).
+    With a content-addressable store (store, see blob_store.py), the PDFs are hashed from the store index when
+    stored, and the blob consumed by each conversion is recorded in the provenance log of the store.
+    """
     # Check if the target folder exists, if not, create it
     if not os.path.exists(target_folder):
         os.makedirs(target_folder)
-    
+
     # List all PDF files in the source folder
     pdf_files = [f for f in os.listdir(source_folder) if f.endswith('.pdf')]
-    
-    # Process each PDF file
-    for i, pdf_file in enumerate(pdf_files):
+    manifest = load_manifest(target_folder)
+    extractor = extractor_version(backend)
+
+    # Skip cached PDF files
+    to_convert = []
+    for pdf_file in pdf_files:
         source_path = os.path.join(source_folder, pdf_file)
         target_path = os.path.join(target_folder, pdf_file.replace('.pdf', '.txt'))
-        
-        # Initialize a PDF reader and open the source PDF file
-        reader = PdfReader(source_path)
-        
-        # Extract text from each page and attempt to write to a new txt file
-        with open(target_path, 'w', encoding='utf-8') as txt_file:
-            for page in reader.pages:
+        if not force and is_cached(manifest, source_path, target_path, extractor):
+            print(f"Skipped (cached): {pdf_file}")
+        else:
+            to_convert.append(pdf_file)
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
+    try:
+        # Split each document into page ranges
+        tasks = []
+        for pdf_file in to_convert:
+            source_path = os.path.join(source_folder, pdf_file)
+            if executor is None:
+                tasks.append((pdf_file, [(0, None)]))
+                continue
+            n_pages = get_backend(backend).count_pages(source_path)
+            ranges = [(start, min(start + pages_per_task, n_pages)) for start in range(0, n_pages, pages_per_task)]
+            tasks.append((pdf_file, ranges or [(0, 0)]))
+
+        # Submit the page ranges in document order, keeping at most max_pending in flight so that workers stay busy
+        # while the pages extracted ahead of the document being written stay bounded
+        jobs = ((os.path.join(source_folder, pdf_file), start, stop) for pdf_file, ranges in tasks for start, stop in ranges)
+        pending = deque()
+        max_pending = 2 * executor._max_workers if executor is not None else 0
+
+        def collect_pages(n_ranges):
+            # Texts of the next n_ranges page ranges (those of one document), submitting the next ranges meanwhile
+            texts, error = [], None
+            for _ in range(n_ranges):
+                while len(pending) < max_pending:
+                    job = next(jobs, None)
+                    if job is None:
+                        break
+                    pending.append(executor.submit(extract_pages, backend, *job))
                 try:
-                    text = page.extract_text()
-                    if text:
-                        txt_file.write(text)
-                except UnicodeEncodeError as e:
-                    print(f"Encoding error encountered and skipped in {pdf_file}: {e}")
-        
-        # Display progress
-        print(f"Converted ({i+1}/{len(pdf_files)}): {pdf_file} to txt")
-        
+                    texts.extend(pending.popleft().result())
+                except Exception as e:
+                    # Still collect the other ranges of the document
+                    error = error or e
+            if error is not None:
+                raise error
+            return texts
+
+        for i, (pdf_file, ranges) in enumerate(tasks):
+            source_path = os.path.join(source_folder, pdf_file)
+            target_path = os.path.join(target_folder, pdf_file.replace('.pdf', '.txt'))
+            try:
+                if executor is None:
+                    texts = extract_pages(backend, source_path, 0, None)
+                else:
+                    texts = collect_pages(len(ranges))
+                write_txt(target_path, texts)
+            except Exception as e:
+                print(f"Failed to convert {pdf_file}: {e}")
+                continue
+
+            stat = os.stat(source_path)
+            sha256 = store.hash_of(source_path) if store is not None else file_hash(source_path)
+            manifest[pdf_file] = {'sha256': sha256, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                  'extractor': extractor, 'pages': len(texts)}
+            save_manifest(manifest, target_folder)
+            if store is not None:
+                store.record_provenance('pdf_to_txt', {source_path: sha256}, [target_path, pages_path(target_path)],
+                                        {'extractor': extractor})
+
+            # Display progress
+            print(f"Converted ({i+1}/{len(tasks)}): {pdf_file} to txt")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # Forget deleted PDF files
+    for pdf_file in set(manifest) - set(pdf_files):
+        del manifest[pdf_file]
+    save_manifest(manifest, target_folder)
+
     print("Conversion completed.")
 
 
-source_folder = './data/reports/pdf'
-target_folder = './data/reports/txt'
+if __name__ == '__main__':
+    source_folder = './data/reports/pdf'
+    target_folder = './data/reports/txt'
+
+    source_folder = './data/reports/pdf/full_temp'
+    target_folder = './data/reports/full'
 
-source_folder = './data/reports/pdf/full_temp'
-target_folder = './data/reports/full'
+    # Content-addressable store of the PDFs (see blob_store.py), None to disable
+    blob_store_root = None
 
-convert_pdf_folder_to_txt(source_folder, target_folder)
\ No newline at end of file
+    store = BlobStore(blob_store_root) if blob_store_root else None
+    convert_pdf_folder_to_txt(source_folder, target_folder, store=store)
@@ -0,0 +1,187 @@
+"""
+Columnar store of the references of the report chapters, built once from the chapter .bib files
+(data/references_no_duplicates), so that the analyses read the references in milliseconds instead of
+parsing the BibTeX files again.
+
+The store is a Parquet dataset partitioned by report (<store>/report=wg1/..., <store>/report=sr15/...), with one
+row per entry and the columns:
+- file, position: The .bib file and the position of the entry in the file.
+- id: The BibTeX key of the entry.
+- doi: The normalized DOI (lowercase, without resolver prefix, see preprocessing/bib_dedup.py), or null.
+- doi_raw: The DOI field as written in the .bib file (not decoded from LaTeX), or null.
+- wg, chapter: The working group (1, 2, 3, or null for special reports) and the chapter, from the file name.
+- title, first_author, year: The title, first author and year of the entry (decoded from LaTeX).
+
+The size and modification time of each .bib file are recorded in <store>/_sources.json (ignored by the Parquet
+readers), so that a stale store (.bib files added, removed or modified since the build) can be detected and the
+readers fall back on the files.
+
+Functions:
+- build_store(bib_folder, store_path): Build the store from the .bib files of a folder.
+- store_is_stale(bib_folder, store_path): Check if the .bib files changed since the store was built.
+- read_store(store_path, reports, columns): Read the store (or some reports) as a pandas DataFrame.
+
+Usage:
+python ./utils/reference_store.py build [--bib-folder ./data/references_no_duplicates]
+python ./utils/reference_store.py stats
+(with --store <folder> before the command to use another store than ./data/references_store)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import bib_stream
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'preprocessing'))
+from bib_dedup import normalize_doi
+
+DEFAULT_BIB_FOLDER = './data/references_no_duplicates'
+DEFAULT_STORE_PATH = './data/references_store'
+
+SCHEMA = pa.schema([
+    ('report', pa.string()),
+    ('wg', pa.int8()),
+    ('chapter', pa.string()),
+    ('file', pa.string()),
+    ('position', pa.int32()),
+    ('id', pa.string()),
+    ('doi', pa.string()),
+    ('doi_raw', pa.string()),
+    ('title', pa.string()),
+    ('first_author', pa.string()),
+    ('year', pa.string()),
+])
+
+WG_REGEX = re.compile(r'^wg(\d)$')
+
+def parse_file_name(file):
+    """Return the report, working group and chapter of a chapter .bib file name (e.g. wg1_ch2.bib -> wg1, 1, '2')."""
+    name = os.path.splitext(file)[0]
+    report = name.split('_')[0]
+    match = WG_REGEX.match(report)
+    # Same chapter as analysis/references_chapters.py
+    chapter = name.split('ch')[-1] if '_ch' in name else None
+    return report, int(match.group(1)) if match else None, chapter
+
+def list_bib_files(bib_folder):
+    return sorted(file for file in os.listdir(bib_folder) if file.endswith('.bib'))
+
+def file_signature(bib_folder, file):
+    stat = os.stat(os.path.join(bib_folder, file))
+    return stat.st_size, stat.st_mtime_ns
+
+def build_store(bib_folder=DEFAULT_BIB_FOLDER, store_path=DEFAULT_STORE_PATH):
+    """
+    Builds the store from the .bib files of a folder (replacing the previous store).
+
+    Args:
+        bib_folder (str): The folder of the chapter .bib files.
+        store_path (str): The folder of the store.
+
+    Returns:
+        int: The number of references stored.
+    """
+    columns = {name: [] for name in SCHEMA.names}
+    sources = {}
+    for file in list_bib_files(bib_folder):
+        report, wg, chapter = parse_file_name(file)
+        size, mtime_ns = file_signature(bib_folder, file)
+        sources[file] = {'size': size, 'mtime_ns': mtime_ns}
+        for position, entry in enumerate(bib_stream.iter_bib(os.path.join(bib_folder, file))):
+            doi = entry.get('doi')
+            author = bib_stream.decode_value(entry.get('author', '')).split(' and ')[0].strip()
+            columns['report'].append(report)
+            columns['wg'].append(wg)
+            columns['chapter'].append(chapter)
+            columns['file'].append(file)
+            columns['position'].append(position)
+            columns['id'].append(entry['ID'])
+            columns['doi'].append(normalize_doi(bib_stream.decode_value(doi)) or None if doi is not None else None)
+            columns['doi_raw'].append(doi)
+            columns['title'].append(bib_stream.decode_value(entry['title']) if 'title' in entry else None)
+            columns['first_author'].append(author or None)
+            columns['year'].append(bib_stream.decode_value(entry['year']) if 'year' in entry else None)
+    table = pa.table(columns, schema=SCHEMA)
+
+    # Written to a temporary folder, then renamed
+    tmp_path = store_path.rstrip('/\\') + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    pq.write_to_dataset(table, tmp_path, partition_cols=['report'])
+    with open(os.path.join(tmp_path, '_sources.json'), 'w', encoding='utf-8') as f:
+        json.dump(sources, f, indent=1)
+    if os.path.exists(store_path):
+        if not os.path.exists(os.path.join(store_path, '_sources.json')):
+            raise FileExistsError(f'{store_path} exists and is not a reference store')
+        shutil.rmtree(store_path)
+    os.replace(tmp_path, store_path)
+    return table.num_rows
+
+def store_is_stale(bib_folder=DEFAULT_BIB_FOLDER, store_path=DEFAULT_STORE_PATH):
+    """
+    Checks if the .bib files of a folder were added, removed or modified since the store was built.
+
+    Returns:
+        bool: True if the store is missing or stale, False otherwise.
+    """
+    sources_path = os.path.join(store_path, '_sources.json')
+    if not os.path.exists(sources_path):
+        return True
+    with open(sources_path, 'r', encoding='utf-8') as f:
+        sources = json.load(f)
+    if not os.path.isdir(bib_folder):
+        return False
+    if sorted(sources) != list_bib_files(bib_folder):
+        return True
+    return any(file_signature(bib_folder, file) != (source['size'], source['mtime_ns']) for file, source in sources.items())
+
+def read_store(store_path=DEFAULT_STORE_PATH, reports=None, columns=None):
+    """
+    Reads the store as a pandas DataFrame, in file and entry order.
+
+    Args:
+        store_path (str): The folder of the store.
+        reports (list): The reports to read (e.g. ['wg1', 'sr15']), only their partitions are read (default: all).
+        columns (list): The columns to read (default: all).
+
+    Returns:
+        pandas.DataFrame: The references.
+    """
+    read_columns = None if columns is None else list(dict.fromkeys(list(columns) + ['file', 'position']))
+    filters = [('report', 'in', list(reports))] if reports is not None else None
+    table = pq.read_table(store_path, columns=read_columns, filters=filters)
+    if 'report' in table.column_names:
+        # The partition column is read as a dictionary
+        index = table.column_names.index('report')
+        table = table.set_column(index, 'report', table.column('report').cast(pa.string()))
+    df = table.to_pandas(types_mapper={pa.int8(): pd.Int8Dtype()}.get)
+    df = df.sort_values(['file', 'position'], kind='stable').reset_index(drop=True)
+    return df[[name for name in SCHEMA.names if name in df.columns] if columns is None else list(columns)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Columnar store of the chapter references.')
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help='Folder of the store')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='Build the store from the chapter .bib files')
+    build_parser.add_argument('--bib-folder', default=DEFAULT_BIB_FOLDER)
+    subparsers.add_parser('stats', help='Number of references and DOIs by report')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start_time = time.time()
+        count = build_store(args.bib_folder, args.store)
+        print(f'{count} references stored in {args.store} ({time.time() - start_time:.1f} s)')
+    elif args.command == 'stats':
+        start_time = time.perf_counter()
+        df = read_store(args.store, columns=['report', 'doi'])
+        elapsed = (time.perf_counter() - start_time) * 1000
+        stats = df.groupby('report').agg(references=('doi', 'size'), dois=('doi', 'count'), unique_dois=('doi', 'nunique'))
+        print(stats.to_string())
+        print(f'{len(df)} references read in {elapsed:.1f} ms')
@@ -1,3 +1,5 @@
+from blob_store import replace_file
+
 def remove_duplicates(input_file, output_file):
     # Read lines from input file
     with open(input_file, 'r') as f:
@@ -7,7 +9,7 @@ def remove_duplicates(input_file, output_file):
     unique_lines = list(set(lines))
 
     # Write unique lines to output file
-    with open(output_file, 'w') as f:
+    with replace_file(output_file) as f:
         f.writelines(unique_lines)
 
 # Example usage
@@ -0,0 +1,287 @@
+"""
+Repair the text extracted from the IPCC report PDFs before analysis, so that multi-word terms
+are found across PDF line breaks:
+- Running headers and footers (lines repeated every page, e.g. 'Chapter 2 Changing State of the Climate System')
+  are removed. A line is considered as a running header or footer if it is one of the first or last
+  `edge_lines` lines of a page, and appears (digits ignored) at the top or bottom of at least `min_repeats`
+  different pages in a window of `window` lines around it. Lines repeated inside the pages (e.g. table rows)
+  are kept. The pages are given by the page sidecar of the file (<name>.pages.bin, written by pdf_to_txt.py)
+  or by form feeds in the text; without them, no line is removed.
+- Words hyphenated at the end of a line are rejoined ('tempera-\\nture' becomes 'temperature').
+- Lines wrapped in the middle of a sentence are rejoined ('sea surface\\ntemperature' becomes
+  'sea surface temperature') when the line does not end with a punctuation mark and the next line
+  starts with a lowercase letter. Other line breaks (headings, paragraphs, lists) are kept.
+
+The text is processed in one linear pass, line by line, with a bounded buffer (the window of lines
+used to detect headers and footers), so that whole reports can be repaired with bounded memory.
+
+Each repaired file comes with an offset map (<name>.offsets.bin) mapping the characters of the repaired
+text back to the characters of the original text. The map is a sequence of int64 pairs
+(repaired offset, original offset), one for each position where the shift between both texts changes.
+It can be read with numpy.fromfile(path, dtype='<i8').reshape(-1, 2) and used with original_offset.
+If the original file has a page sidecar (<name>.pages.bin, written by pdf_to_txt.py), the page start offsets
+are mapped to the repaired text and written next to the repaired file.
+"""
+
+import os
+import re
+import bisect
+from array import array
+from collections import Counter, deque
+from blob_store import replace_file
+
+DIGITS_REGEX = re.compile(r'\d+')
+LETTER_REGEX = re.compile(r'[^\W\d_]')
+
+def header_key(line, max_length=120, min_length=8):
+    """Return the key identifying a running header/footer line (digits ignored), or None if the line cannot be one."""
+    key = DIGITS_REGEX.sub('#', line.strip())
+    if min_length <= len(key) <= max_length and LETTER_REGEX.search(key):
+        return key
+    return None
+
+def iter_lines(chunks):
+    """Split text chunks (e.g. file blocks or PDF pages) into lines, yielding (line, original offset)."""
+    offset = 0
+    remainder = ''
+    for chunk in chunks:
+        lines = (remainder + chunk).split('\n')
+        remainder = lines.pop()
+        for line in lines:
+            yield line, offset
+            offset += len(line) + 1
+    if remainder:
+        yield remainder, offset
+
+def iter_page_lines(lines, page_starts=None, edge_lines=2):
+    """
+    Locate the lines of a stream of (line, offset) tuples in the pages, yielding (line, offset, page, edge) tuples,
+    edge being True for the first and last edge_lines non-blank lines of a page.
+    The pages start at the offsets page_starts or, if None, after the form feeds of the text.
+    """
+    page = 0
+    next_page = 0
+    first_lines = 0  # Number of non-blank lines of the page seen so far
+    pending = deque()  # Lines followed by less than edge_lines non-blank lines of their page
+    pending_nonblank = 0
+
+    def is_nonblank(entry):
+        return bool(entry[0].strip())
+
+    for line, offset in lines:
+        if page_starts is not None:
+            line_page = bisect.bisect_right(page_starts, offset) - 1
+        else:
+            # A form feed starting the line starts its page, otherwise the page starts at the next line
+            line_page = next_page + line.startswith('\f')
+            next_page = line_page + line[1:].count('\f')
+        if line_page != page:
+            # The pending lines are the last lines of the previous page
+            for entry in pending:
+                yield entry[0], entry[1], entry[2], True
+            pending.clear()
+            pending_nonblank = 0
+            page = line_page
+            first_lines = 0
+        entry = (line, offset, page, first_lines < edge_lines)
+        if is_nonblank(entry):
+            first_lines += 1
+            pending_nonblank += 1
+        pending.append(entry)
+        while pending and pending_nonblank - is_nonblank(pending[0]) >= edge_lines:
+            left = pending.popleft()
+            pending_nonblank -= is_nonblank(left)
+            yield left
+    for entry in pending:
+        yield entry[0], entry[1], entry[2], True
+
+def remove_running_headers(lines, window=400, min_repeats=3, page_starts=None, edge_lines=2):
+    """
+    Remove running headers and footers from a stream of (line, offset) tuples.
+    A line is removed if it is at a page edge (first or last edge_lines lines of a page, see iter_page_lines)
+    and its key appears at a page edge of at least min_repeats different pages among the window lines around it,
+    so that the repeats are at least a page apart.
+    """
+    half = window // 2
+    buffer = deque()
+    pages = {}  # Key -> Counter of the pages where the key is at a page edge, in the buffer
+    center = 0  # Index in buffer of the next line to decide
+
+    def decide(entry):
+        line, offset, key, page = entry
+        return key is not None and len(pages[key]) >= min_repeats
+
+    def count(entry, increment):
+        key, page = entry[2], entry[3]
+        if key is None:
+            return
+        counter = pages.setdefault(key, Counter())
+        counter[page] += increment
+        if counter[page] <= 0:
+            del counter[page]
+            if not counter:
+                del pages[key]
+
+    for line, offset, page, edge in iter_page_lines(lines, page_starts, edge_lines):
+        # Only the lines at a page edge can be headers or footers
+        entry = (line, offset, header_key(line) if edge else None, page)
+        buffer.append(entry)
+        count(entry, 1)
+        if len(buffer) - center > half:
+            entry = buffer[center]
+            if not decide(entry):
+                yield entry[0], entry[1]
+            center += 1
+            if center > half:
+                count(buffer.popleft(), -1)
+                center -= 1
+    for entry in list(buffer)[center:]:
+        if not decide(entry):
+            yield entry[0], entry[1]
+
+def join_lines(lines):
+    """
+    Rejoin hyphenated words and wrapped lines from a stream of (line, offset) tuples.
+    Yield (text, original offset) pieces, each piece being a contiguous part of the original text
+    or a separator (space or line break) replacing the original line break.
+    """
+    previous = None
+    for line, offset in lines:
+        if previous is not None:
+            previous_line, previous_offset = previous
+            stripped = previous_line.rstrip()
+            starts_lowercase = line[:1].islower()
+            if starts_lowercase and len(stripped) > 1 and stripped.endswith('-') and LETTER_REGEX.match(stripped[-2]):
+                # Hyphenated word: drop the hyphen and the line break
+                yield stripped[:-1], previous_offset
+            elif starts_lowercase and stripped and stripped[-1] not in '.:;?!':
+                # Wrapped line: replace the line break by a space
+                yield stripped, previous_offset
+                yield ' ', previous_offset + len(stripped)
+            else:
+                yield previous_line, previous_offset
+                yield '\n', previous_offset + len(previous_line)
+        previous = (line, offset)
+    if previous is not None:
+        yield previous
+
+def repair_text(chunks, offsets=None, window=400, min_repeats=3, page_starts=None, edge_lines=2):
+    """
+    Repair a text given as a stream of chunks and yield the repaired text in pieces.
+
+    Args:
+        chunks (iterable): The original text, in chunks (e.g. file blocks or PDF pages).
+        offsets (array.array): Optional 'q' array receiving the offset map (repaired offset, original offset pairs).
+        window (int): Number of lines around each line used to detect running headers and footers.
+        min_repeats (int): Number of pages in the window above which a line is a running header or footer.
+        page_starts (list): The start offset of each page in the original text (default: pages separated by form feeds).
+        edge_lines (int): Number of lines at the top and bottom of each page that can be headers or footers.
+
+    Yields:
+        str: The pieces of the repaired text.
+    """
+    position = 0
+    shift = None
+    lines = remove_running_headers(iter_lines(chunks), window, min_repeats, page_starts, edge_lines)
+    for piece, original in join_lines(lines):
+        if not piece:
+            continue
+        if offsets is not None and original - position != shift:
+            shift = original - position
+            offsets.extend((position, original))
+        position += len(piece)
+        yield piece
+
+def read_chunks(file_path, chunk_size=1 << 20):
+    """Read a text file by chunks of chunk_size characters."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for chunk in iter(lambda: f.read(chunk_size), ''):
+            yield chunk
+
+def repair_file(source_path, target_path, offsets_path=None, **kwargs):
+    """
+    Repair a text file, writing the repaired text and its offset map (default: <target>.offsets.bin).
+    The offset map is flushed to disk regularly so that memory use stays bounded.
+    The page sidecar of the source file (<source>.pages.bin), if any, gives the pages used to detect the running
+    headers and footers, and is mapped to the repaired text.
+    """
+    offsets_path = offsets_path or os.path.splitext(target_path)[0] + '.offsets.bin'
+    offsets = array('q')
+    source_pages_path = os.path.splitext(source_path)[0] + '.pages.bin'
+    source_page_starts = None
+    if os.path.exists(source_pages_path):
+        import numpy as np
+        source_page_starts = np.fromfile(source_pages_path, dtype='<i8')
+        kwargs.setdefault('page_starts', source_page_starts.tolist())
+    with replace_file(target_path, encoding='utf-8') as target_file, replace_file(offsets_path, 'wb') as offsets_file:
+        for piece in repair_text(read_chunks(source_path), offsets, **kwargs):
+            target_file.write(piece)
+            if len(offsets) >= 1 << 16:
+                offsets.tofile(offsets_file)
+                del offsets[:]
+        offsets.tofile(offsets_file)
+
+    if source_page_starts is not None:
+        offset_map = np.fromfile(offsets_path, dtype='<i8').reshape(-1, 2)
+        page_starts = repaired_offsets(offset_map, source_page_starts)
+        with replace_file(os.path.splitext(target_path)[0] + '.pages.bin', 'wb') as pages_file:
+            page_starts.astype('<i8').tofile(pages_file)
+
+def original_offset(offset_map, position):
+    """
+    Map a character offset in the repaired text to the corresponding offset in the original text.
+
+    Args:
+        offset_map (numpy.ndarray): The offset map, an (n, 2) array of (repaired offset, original offset) pairs.
+        position (int): The offset in the repaired text.
+
+    Returns:
+        int: The offset in the original text.
+    """
+    import numpy as np
+    index = int(np.searchsorted(offset_map[:, 0], position, side='right')) - 1
+    if index < 0:
+        return position
+    return int(offset_map[index, 1] + position - offset_map[index, 0])
+
+def repaired_offsets(offset_map, positions):
+    """
+    Map character offsets in the original text to the corresponding offsets in the repaired text.
+    Offsets in removed text (e.g. a running header) are mapped to the next character kept.
+
+    Args:
+        offset_map (numpy.ndarray): The offset map, an (n, 2) array of (repaired offset, original offset) pairs.
+        positions (numpy.ndarray): The offsets in the original text.
+
+    Returns:
+        numpy.ndarray: The offsets in the repaired text.
+    """
+    import numpy as np
+    positions = np.asarray(positions, dtype=np.int64)
+    if len(offset_map) == 0:
+        return np.zeros_like(positions)
+    index = np.searchsorted(offset_map[:, 1], positions, side='right') - 1
+    clipped = np.maximum(index, 0)
+    repaired = offset_map[clipped, 0] + positions - offset_map[clipped, 1]
+    # Offsets before the first kept character, or after the end of a kept piece
+    next_starts = np.append(offset_map[1:, 0], np.iinfo(np.int64).max)[clipped]
+    repaired = np.where(index < 0, offset_map[0, 0], np.minimum(repaired, next_starts))
+    return repaired
+
+def repair_folder(source_folder, target_folder, **kwargs):
+    # Check if the target folder exists, if not, create it
+    if not os.path.exists(target_folder):
+        os.makedirs(target_folder)
+
+    txt_files = [f for f in os.listdir(source_folder) if f.endswith('.txt')]
+    for i, txt_file in enumerate(txt_files):
+        repair_file(os.path.join(source_folder, txt_file), os.path.join(target_folder, txt_file), **kwargs)
+        print(f"Repaired ({i+1}/{len(txt_files)}): {txt_file}")
+
+    print("Repair completed.")
+
+if __name__ == '__main__':
+    source_folder = './data/reports/txt'
+    target_folder = './data/reports/repaired'
+
+    repair_folder(source_folder, target_folder)